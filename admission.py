@@ -0,0 +1,183 @@
+"""
+API key registry and admission control.
+
+Keys are loaded once at startup and compared in constant time. Each key
+gets a token bucket (requests per second) and a concurrency limit, and a
+global in-flight cap sheds load instead of letting requests queue.
+"""
+import hashlib
+import hmac
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Scopes granted to keys that do not list their own
+DEFAULT_SCOPES = ("read", "write")
+ALL_SCOPES = ("read", "write", "admin", "trace")
+
+
+def _digest(secret: str) -> bytes:
+    return hashlib.sha256(secret.encode("utf-8")).digest()
+
+
+class TokenBucket:
+    """Classic token bucket; rate <= 0 means unlimited"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(burst, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def try_take(self) -> float:
+        """Take one token; return 0 on success, otherwise seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class ApiKey:
+    """An authenticated client and its limits"""
+
+    def __init__(self, name: str, secret: str, rate: float, burst: float,
+                 concurrency: int, scopes=DEFAULT_SCOPES):
+        self.name = name
+        self.digest = _digest(secret)
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.scopes = frozenset(scopes)
+        self.in_flight = 0
+        self.rejected = 0
+
+    def has_scope(self, scope: str) -> bool:
+        return scope in self.scopes
+
+    def __repr__(self):
+        return f"ApiKey(name={self.name!r})"
+
+
+class KeyRing:
+    """All configured API keys.
+
+    Keys come from ``API_KEY`` (single operator key with every scope),
+    ``API_KEYS`` (comma-separated ``name:secret`` entries) and
+    ``API_KEYS_FILE`` (JSON list of objects with ``name``, ``key`` and
+    optional ``rate``, ``burst``, ``concurrency`` and ``scopes``).
+    """
+
+    def __init__(self, keys: List[ApiKey]):
+        self.keys = keys
+
+    @classmethod
+    def from_env(cls) -> "KeyRing":
+        rate = float(os.getenv("RATE_LIMIT_PER_SECOND", 50))
+        burst = float(os.getenv("RATE_LIMIT_BURST", 100))
+        concurrency = int(os.getenv("KEY_MAX_CONCURRENCY", 16))
+        keys = []
+
+        legacy = os.getenv("API_KEY")
+        if legacy:
+            keys.append(ApiKey("default", legacy, rate, burst, concurrency, ALL_SCOPES))
+
+        for i, entry in enumerate(filter(None, os.getenv("API_KEYS", "").split(","))):
+            name, sep, secret = entry.strip().partition(":")
+            if not sep:
+                name, secret = f"key-{i + 1}", name
+            keys.append(ApiKey(name, secret, rate, burst, concurrency))
+
+        path = os.getenv("API_KEYS_FILE")
+        if path:
+            with open(path) as f:
+                for entry in json.load(f):
+                    keys.append(ApiKey(
+                        entry["name"],
+                        entry["key"],
+                        float(entry.get("rate", rate)),
+                        float(entry.get("burst", burst)),
+                        int(entry.get("concurrency", concurrency)),
+                        entry.get("scopes", DEFAULT_SCOPES),
+                    ))
+        return cls(keys)
+
+    def authenticate(self, secret: str) -> Optional[ApiKey]:
+        """Return the matching key; every key is compared so timing does not leak which matched"""
+        digest = _digest(secret)
+        match = None
+        for key in self.keys:
+            if hmac.compare_digest(digest, key.digest):
+                match = key
+        return match
+
+
+class AdmissionRejected(Exception):
+    """Request shed by admission control"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class AdmissionController:
+    """Enforces the global in-flight cap and per-key rate and concurrency limits"""
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(int(os.getenv("MAX_IN_FLIGHT", 64)))
+
+    def admit(self, key: ApiKey):
+        """Reserve a slot for key or raise AdmissionRejected"""
+        with self._lock:
+            if 0 < self.max_in_flight <= self.in_flight:
+                self.shed += 1
+                key.rejected += 1
+                raise AdmissionRejected(503, "Server overloaded, retry later", 1.0)
+            if 0 < key.concurrency <= key.in_flight:
+                self.rate_limited += 1
+                key.rejected += 1
+                raise AdmissionRejected(429, "Too many concurrent requests for this API key", 1.0)
+            wait = key.bucket.try_take()
+            if wait > 0:
+                self.rate_limited += 1
+                key.rejected += 1
+                raise AdmissionRejected(429, "Rate limit exceeded for this API key", wait)
+            self.in_flight += 1
+            self.admitted += 1
+            key.in_flight += 1
+
+    def release(self, key: ApiKey):
+        with self._lock:
+            self.in_flight -= 1
+            key.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "rate_limited": self.rate_limited,
+            }
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Online, incremental snapshots of the ChromaDB persistence directory.
+
+A snapshot is taken while the service keeps running:
+
+1. HNSW segment files are copied first. A file whose size and mtime match
+   the parent snapshot is referenced instead of copied. The copy is
+   throttled and optimistic: if Chroma flushes a segment while it is
+   being copied (its files' mtimes change), that segment is copied again,
+   and after repeated conflicts it is copied with writes paused through
+   the ``WriteGate``.
+2. ``chroma.sqlite3`` is copied afterwards with SQLite's online backup
+   API. Because it is taken after the index files, the embeddings queue
+   it contains covers everything the copied index has seen, and Chroma
+   replays the remainder when the snapshot is opened.
+
+Each snapshot directory holds a complete ``manifest.json``; unchanged
+files point at the snapshot that stores them, so a restore walks the
+chain automatically.
+
+With ``BACKUP_INTERVAL_SECONDS`` set, snapshots are also taken on a
+schedule (read replicas refresh from them, see replica.py), and
+``BACKUP_KEEP`` bounds how many are kept: older snapshots are deleted
+once no kept snapshot references files stored in them.
+
+Usage:
+    python backup.py list [--backup-dir ./backups]
+    python backup.py restore --target ./chroma_store [--snapshot ID] [--backup-dir ./backups] [--force]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SQLITE_FILE = "chroma.sqlite3"
+# Small top-level files copied with every snapshot (the reindexer's switch-over record)
+TOP_LEVEL_FILES = ("active_collection",)
+CHUNK_SIZE = 1 << 20
+MAX_OPTIMISTIC_ATTEMPTS = 3
+
+
+class WriteGate:
+    """Lets any number of writes proceed together, or pauses them all for a backup"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._writers = 0
+        self._paused = False
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            while self._paused:
+                self._cond.wait()
+            self._writers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writers -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def pause(self):
+        with self._cond:
+            while self._paused:
+                self._cond.wait()
+            self._paused = True
+            while self._writers:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._paused = False
+                self._cond.notify_all()
+
+
+class Throttle:
+    """Limits sustained throughput to bytes_per_second (<= 0 means unlimited)"""
+
+    def __init__(self, bytes_per_second: float):
+        self.rate = bytes_per_second
+        self.start = time.monotonic()
+        self.consumed = 0
+
+    def consume(self, amount: int):
+        if self.rate <= 0:
+            return
+        self.consumed += amount
+        ahead = self.consumed / self.rate - (time.monotonic() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def copy_file(src: str, dst: str, throttle: Optional[Throttle] = None) -> str:
+    """Copy src to dst in chunks and return the sha256 of the copied bytes"""
+    digest = hashlib.sha256()
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while True:
+            chunk = fin.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            fout.write(chunk)
+            if throttle is not None:
+                throttle.consume(len(chunk))
+    return digest.hexdigest()
+
+
+def file_sha256(path: str, throttle: Optional[Throttle] = None) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            if throttle is not None:
+                throttle.consume(len(chunk))
+    return digest.hexdigest()
+
+
+def _stat(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def list_snapshots(backup_dir: str) -> List[dict]:
+    """Manifests of all complete snapshots, oldest first"""
+    snapshots = []
+    if not os.path.isdir(backup_dir):
+        return snapshots
+    for name in sorted(os.listdir(backup_dir)):
+        path = os.path.join(backup_dir, name, "manifest.json")
+        if os.path.isfile(path):
+            with open(path) as f:
+                snapshots.append(json.load(f))
+    snapshots.sort(key=lambda m: m["created_at"])
+    return snapshots
+
+
+class SnapshotInProgress(Exception):
+    pass
+
+
+class BackupManager:
+    """Creates snapshots of a Chroma directory into backup_dir"""
+
+    def __init__(self, source_dir: str, backup_dir: str, gate: WriteGate, bytes_per_second: float,
+                 interval: float = 0, keep: int = 0):
+        self.source_dir = source_dir
+        self.backup_dir = backup_dir
+        self.gate = gate
+        self.bytes_per_second = bytes_per_second
+        # Seconds between scheduled snapshots (0: only on request) and snapshots kept (0: all)
+        self.interval = interval
+        self.keep = keep
+        self.current: Optional[dict] = None
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, source_dir: str, gate: WriteGate) -> "BackupManager":
+        return cls(
+            source_dir,
+            os.getenv("BACKUP_DIR", "./backups"),
+            gate,
+            float(os.getenv("BACKUP_MAX_BYTES_PER_SEC", 20 * 1024 * 1024)),
+            float(os.getenv("BACKUP_INTERVAL_SECONDS", 0)),
+            int(os.getenv("BACKUP_KEEP", 0)),
+        )
+
+    def status(self) -> dict:
+        return {
+            "running": self.current,
+            "last_error": self.last_error,
+            "interval_seconds": self.interval,
+            "keep": self.keep,
+            "snapshots": [
+                {key: m[key] for key in ("id", "parent", "created_at", "bytes_copied", "bytes_total")}
+                for m in list_snapshots(self.backup_dir)
+            ],
+        }
+
+    def start(self, full: bool = False) -> str:
+        """Start a snapshot on a background thread and return its ID"""
+        with self._lock:
+            if self.current is not None:
+                raise SnapshotInProgress(self.current["id"])
+            snapshot_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + uuid.uuid4().hex[:6]
+            self.current = {"id": snapshot_id, "started_at": time.time(), "phase": "starting"}
+        threading.Thread(target=self._run, args=(snapshot_id, full), daemon=True).start()
+        return snapshot_id
+
+    def start_schedule(self):
+        """Take a snapshot every interval seconds on a background thread (no-op without an interval)"""
+        if self.interval > 0:
+            threading.Thread(target=self._schedule, daemon=True).start()
+
+    def _schedule(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.start()
+            except SnapshotInProgress:
+                pass
+
+    def _run(self, snapshot_id: str, full: bool):
+        try:
+            self.create_snapshot(snapshot_id, full)
+            self.last_error = None
+            if self.keep > 0:
+                self.prune(self.keep)
+        except Exception as e:
+            logger.exception("Snapshot failed")
+            self.last_error = f"{snapshot_id}: {e}"
+            shutil.rmtree(os.path.join(self.backup_dir, snapshot_id), ignore_errors=True)
+        finally:
+            with self._lock:
+                self.current = None
+
+    def _phase(self, phase: str):
+        if self.current is not None:
+            self.current["phase"] = phase
+
+    def create_snapshot(self, snapshot_id: str, full: bool = False) -> dict:
+        """Take a snapshot (blocking)"""
+        created_at = datetime.now(timezone.utc).isoformat()
+        snapshots = list_snapshots(self.backup_dir)
+        parent = None if full or not snapshots else snapshots[-1]
+        target = os.path.join(self.backup_dir, snapshot_id)
+        files_dir = os.path.join(target, "files")
+        throttle = Throttle(self.bytes_per_second)
+        files: Dict[str, dict] = {}
+
+        # Before the segments: a switch-over during the copy then names the collection
+        # the copy started on, which is dropped only after a grace period
+        for name in TOP_LEVEL_FILES:
+            if os.path.isfile(os.path.join(self.source_dir, name)):
+                files[name] = self._copy_small(name, files_dir, parent)
+
+        self._phase("segments")
+        for segment in sorted(os.listdir(self.source_dir)):
+            segment_path = os.path.join(self.source_dir, segment)
+            if os.path.isdir(segment_path):
+                files.update(self._copy_segment(segment, segment_path, files_dir, parent, throttle))
+
+        self._phase("sqlite")
+        files[SQLITE_FILE] = self._copy_sqlite(files_dir, parent, throttle)
+
+        manifest = {
+            "id": snapshot_id,
+            "parent": parent["id"] if parent else None,
+            "created_at": created_at,
+            "files": files,
+            "bytes_copied": sum(f["size"] for f in files.values() if f["stored_in"] == snapshot_id),
+            "bytes_total": sum(f["size"] for f in files.values()),
+        }
+        with open(os.path.join(target, "manifest.json.tmp"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(os.path.join(target, "manifest.json.tmp"), os.path.join(target, "manifest.json"))
+        logger.info(
+            f"Snapshot {snapshot_id} complete: copied {manifest['bytes_copied']} of {manifest['bytes_total']} bytes"
+        )
+        return manifest
+
+    def _copy_segment(self, segment: str, path: str, files_dir: str, parent, throttle) -> Dict[str, dict]:
+        snapshot_id = os.path.basename(os.path.dirname(files_dir))
+        for attempt in range(MAX_OPTIMISTIC_ATTEMPTS + 1):
+            paused = attempt == MAX_OPTIMISTIC_ATTEMPTS
+            with (self.gate.pause() if paused else nullcontext()):
+                before = {name: _stat(os.path.join(path, name)) for name in sorted(os.listdir(path))}
+                entries = {}
+                for name, stat in before.items():
+                    rel = f"{segment}/{name}"
+                    previous = parent["files"].get(rel) if parent else None
+                    if previous and previous["size"] == stat["size"] and previous["mtime_ns"] == stat["mtime_ns"]:
+                        entries[rel] = previous
+                        continue
+                    sha = copy_file(
+                        os.path.join(path, name), os.path.join(files_dir, rel), None if paused else throttle
+                    )
+                    entries[rel] = dict(stat, sha256=sha, stored_in=snapshot_id)
+                after = {name: _stat(os.path.join(path, name)) for name in sorted(os.listdir(path))}
+            if paused or before == after:
+                return entries
+            logger.info(f"Segment {segment} changed while copying, retrying")
+        return entries
+
+    def _copy_small(self, name: str, files_dir: str, parent) -> dict:
+        snapshot_id = os.path.basename(os.path.dirname(files_dir))
+        dst = os.path.join(files_dir, name)
+        sha = copy_file(os.path.join(self.source_dir, name), dst)
+        previous = parent["files"].get(name) if parent else None
+        if previous and previous["sha256"] == sha:
+            os.remove(dst)
+            return previous
+        return dict(_stat(dst), sha256=sha, stored_in=snapshot_id)
+
+    def prune(self, keep: int) -> List[str]:
+        """Delete all but the newest keep snapshots, except those kept ones reference; returns the deleted IDs"""
+        snapshots = list_snapshots(self.backup_dir)
+        kept = snapshots[-keep:]
+        referenced = {entry["stored_in"] for manifest in kept for entry in manifest["files"].values()}
+        deleted = []
+        for manifest in snapshots[:-keep]:
+            if manifest["id"] not in referenced:
+                # The manifest goes first so a half-deleted snapshot is never listed
+                os.remove(os.path.join(self.backup_dir, manifest["id"], "manifest.json"))
+                shutil.rmtree(os.path.join(self.backup_dir, manifest["id"]), ignore_errors=True)
+                deleted.append(manifest["id"])
+        if deleted:
+            logger.info(f"Pruned snapshots {', '.join(deleted)}")
+        return deleted
+
+    def _copy_sqlite(self, files_dir: str, parent, throttle) -> dict:
+        snapshot_id = os.path.basename(os.path.dirname(files_dir))
+        dst = os.path.join(files_dir, SQLITE_FILE)
+        os.makedirs(files_dir, exist_ok=True)
+        source = sqlite3.connect(f"file:{os.path.join(self.source_dir, SQLITE_FILE)}?mode=ro", uri=True)
+        dest = sqlite3.connect(dst)
+        try:
+            page_size = source.execute("PRAGMA page_size").fetchone()[0]
+            pages = max(1, CHUNK_SIZE // page_size)
+            restarts = 0
+            last_remaining = None
+
+            def progress(status, remaining, total):
+                nonlocal restarts, last_remaining
+                if last_remaining is not None and remaining > last_remaining:
+                    restarts += 1
+                    if restarts > MAX_OPTIMISTIC_ATTEMPTS:
+                        raise _BackupRestarted()
+                last_remaining = remaining
+                throttle.consume(pages * page_size)
+
+            try:
+                source.backup(dest, pages=pages, progress=progress)
+            except _BackupRestarted:
+                # Constant writes keep restarting a stepped backup; copy in one step instead
+                source.backup(dest)
+        finally:
+            dest.close()
+            source.close()
+
+        stat = _stat(dst)
+        sha = file_sha256(dst, throttle)
+        previous = parent["files"].get(SQLITE_FILE) if parent else None
+        if previous and previous["sha256"] == sha:
+            os.remove(dst)
+            return previous
+        return dict(stat, sha256=sha, stored_in=snapshot_id)
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def restore(backup_dir: str, target: str, snapshot_id: Optional[str] = None, force: bool = False) -> dict:
+    """Rebuild a Chroma directory from a snapshot and the snapshots it references"""
+    snapshots = list_snapshots(backup_dir)
+    if not snapshots:
+        raise ValueError(f"No snapshots in {backup_dir}")
+    manifest = snapshots[-1] if snapshot_id is None else next((m for m in snapshots if m["id"] == snapshot_id), None)
+    if manifest is None:
+        raise ValueError(f"Snapshot {snapshot_id} not found")
+    if os.path.exists(target) and not force:
+        raise ValueError(f"{target} already exists (use --force to replace it)")
+
+    staging = f"{target.rstrip(os.sep)}.restore-{uuid.uuid4().hex[:6]}"
+    for rel, entry in manifest["files"].items():
+        src = os.path.join(backup_dir, entry["stored_in"], "files", rel)
+        sha = copy_file(src, os.path.join(staging, rel))
+        if sha != entry["sha256"]:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise ValueError(f"Checksum mismatch for {rel} in snapshot {entry['stored_in']}")
+
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.replace(staging, target)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["list", "restore"])
+    parser.add_argument("--backup-dir", default=os.getenv("BACKUP_DIR", "./backups"))
+    parser.add_argument("--snapshot", default=None, help="snapshot ID (default: latest)")
+    parser.add_argument("--target", default=os.getenv("CHROMA_PATH", "./chroma_store"))
+    parser.add_argument("--force", action="store_true", help="replace an existing target directory")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for manifest in list_snapshots(args.backup_dir):
+            print(
+                f"{manifest['id']}  parent={manifest['parent'] or '-':<24} "
+                f"copied={manifest['bytes_copied']:>12}  total={manifest['bytes_total']:>12}"
+            )
+        return
+
+    try:
+        manifest = restore(args.backup_dir, args.target, args.snapshot, args.force)
+    except ValueError as e:
+        print(f"Restore failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Restored snapshot {manifest['id']} into {args.target}")
+
+
+if __name__ == "__main__":
+    main()
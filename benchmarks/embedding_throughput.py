@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Embedding throughput benchmark
+
+Measures documents per second (and per core) of the local ONNX embedding
+function for a grid of thread counts and batch sizes.
+
+Usage (from the repository root):
+    python -m benchmarks.embedding_throughput --threads 1 2 4 --batch 8 32 --docs 512
+"""
+import argparse
+import os
+import random
+import time
+
+from embedding import EmbeddingConfig, LocalOnnxEmbeddingFunction
+
+WORDS = (
+    "vector search index document embedding model query latency throughput memory "
+    "cluster shard replica snapshot cache batch token network storage compute"
+).split()
+
+
+def make_documents(count: int, words: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(words // 2, words))) for _ in range(count)]
+
+
+def run(threads: int, batch: int, documents, concurrency: int, model_path):
+    os.environ["EMBEDDING_THREADS"] = str(threads)
+    os.environ["EMBEDDING_MAX_BATCH"] = str(batch)
+    if model_path:
+        os.environ["EMBEDDING_MODEL_PATH"] = model_path
+    function = LocalOnnxEmbeddingFunction(EmbeddingConfig())
+    function.embed(documents[:batch])  # load the model and warm up
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        function.embed(documents)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        chunks = [documents[i::concurrency] for i in range(concurrency)]
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(function.embed, chunks))
+    elapsed = time.perf_counter() - start
+    return len(documents) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument("--docs", type=int, default=512)
+    parser.add_argument("--words", type=int, default=60, help="maximum words per document")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel embed() callers")
+    parser.add_argument("--model-path", default=None)
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs, args.words)
+    print(f"{'threads':>7} {'batch':>5} {'docs/s':>10} {'docs/s/core':>12}")
+    for threads in args.threads:
+        for batch in args.batch:
+            rate = run(threads, batch, documents, args.concurrency, args.model_path)
+            cores = min(threads * args.concurrency, os.cpu_count() or 1)
+            print(f"{threads:>7} {batch:>5} {rate:>10.1f} {rate / cores:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+MinHash LSH near-duplicate benchmark
+
+Generates a synthetic corpus of random-word documents, plants edited
+copies of some of them (a few words replaced), then reports indexing
+throughput, per-document lookup latency, clustering time, and how many
+planted pairs were recovered. The naive alternative, one similarity
+search per document, is quadratic in the corpus size.
+
+Usage (from the repository root):
+    python -m benchmarks.near_duplicates --docs 100000 --words 200 --edits 5
+"""
+import argparse
+import random
+import time
+
+from minhash_index import MinHashIndex, np
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=200, help="words per document")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--planted", type=float, default=0.05, help="fraction of documents given an edited copy")
+    parser.add_argument("--edits", type=int, default=5, help="words replaced in each copy")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--permutations", type=int, default=128)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = [f"w{i}" for i in range(args.vocabulary)]
+    documents = {}
+    for i in range(args.docs):
+        documents[f"doc-{i}"] = [rng.choice(vocabulary) for _ in range(args.words)]
+    planted = {}
+    for i in rng.sample(range(args.docs), int(args.docs * args.planted)):
+        words = list(documents[f"doc-{i}"])
+        for _ in range(args.edits):
+            words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        planted[f"copy-{i}"] = f"doc-{i}"
+        documents[f"copy-{i}"] = words
+    texts = [(doc_id, " ".join(words)) for doc_id, words in documents.items()]
+
+    index = MinHashIndex(args.threshold, args.permutations)
+    print(f"{len(texts)} documents, {len(planted)} planted near-duplicates, numpy: {np is not None}")
+    print(f"{index.bands} bands x {index.rows} rows for threshold {args.threshold}")
+
+    start = time.perf_counter()
+    for offset in range(0, len(texts), 1000):
+        index.add_many(texts[offset:offset + 1000])
+    elapsed = time.perf_counter() - start
+    rate = len(texts) / elapsed
+    print(f"index:    {elapsed:8.2f}s  {rate:10.0f} docs/s  (1M documents in {1e6 / rate / 60:.1f} min)")
+
+    probes = rng.sample(list(planted), min(1000, len(planted)))
+    start = time.perf_counter()
+    for doc_id in probes:
+        index.near_duplicates(doc_id)
+    elapsed = time.perf_counter() - start
+    print(f"lookup:   {elapsed / len(probes) * 1e6:8.1f}us per document")
+
+    start = time.perf_counter()
+    clusters = index.clusters()
+    elapsed = time.perf_counter() - start
+    print(f"clusters: {elapsed:8.2f}s  {len(clusters)} groups")
+
+    cluster_of = {doc_id: n for n, ids in enumerate(clusters) for doc_id in ids}
+    found = sum(
+        1 for copy, original in planted.items()
+        if copy in cluster_of and cluster_of[copy] == cluster_of.get(original)
+    )
+    members = sum(len(ids) for ids in clusters)
+    print(f"recall:   {found / len(planted):.3f} of planted pairs grouped, {members - 2 * found} other grouped documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Quantized vector index benchmark
+
+Builds ``QuantizedVectorIndex`` in each storage mode over the same
+synthetic clustered vectors and reports memory per vector, query latency
+and recall@k against exact search.
+
+Usage (from the repository root):
+    python -m benchmarks.quantized_index --vectors 100000 --dimension 384 --k 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from quantized_index import MODES, QuantizedVectorIndex
+
+
+def make_vectors(rng, centers, count: int):
+    """Points around Gaussian cluster centers, which look more like sentence embeddings than uniform noise"""
+    assignment = rng.integers(0, len(centers), count)
+    return centers[assignment] + 0.5 * rng.standard_normal((count, centers.shape[1])).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rescore-factor", type=int, default=None, help="default depends on the mode")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.clusters, args.dimension)).astype(np.float32)
+    vectors = make_vectors(rng, centers, args.vectors)
+    queries = make_vectors(rng, centers, args.queries)
+    ids = [str(i) for i in range(args.vectors)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        exact = QuantizedVectorIndex("float32", args.dimension)
+        for doc_id, vector in zip(ids, vectors):
+            exact.add(doc_id, vector)
+        truth = [{doc_id for doc_id, _ in exact.search(q, args.k)} for q in queries]
+
+        print(f"{args.vectors} vectors x {args.dimension} dims, k={args.k}")
+        print(f"{'mode':<8} {'originals':<10} {'rescore':>7} {'bytes/vector':>13} {'ratio':>6} {'p50 ms':>8} {'recall':>7}")
+        for mode in MODES:
+            for originals in ([False] if mode == "float32" else [False, True]):
+                path = os.path.join(tmp, f"{mode}.f32") if originals else None
+                index = QuantizedVectorIndex(mode, args.dimension, path, args.rescore_factor, keep_originals=originals)
+                for doc_id, vector in zip(ids, vectors):
+                    index.add(doc_id, vector)
+
+                latencies = []
+                hits = 0
+                for q, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    found = index.search(q, args.k)
+                    latencies.append(time.perf_counter() - start)
+                    hits += len(expected & {doc_id for doc_id, _ in found})
+                latencies.sort()
+
+                usage = index.memory_usage()
+                per_vector = (usage["code_bytes"] + usage["scale_bytes"]) / usage["capacity"]
+                print(
+                    f"{mode:<8} {'mmap' if originals else '-':<10} {index.rescore_factor:>7} {per_vector:>13.1f} "
+                    f"{usage['compression_ratio']:>5}x {latencies[len(latencies) // 2] * 1000:>8.2f} "
+                    f"{hits / (len(queries) * args.k):>7.3f}"
+                )
+                del index
+
+
+if __name__ == "__main__":
+    main()
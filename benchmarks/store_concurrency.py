@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Sharded document store concurrency stress test and scan scaling benchmark
+
+``stress`` runs writer threads (each owning a disjoint set of IDs) against
+scanner and reader threads, then checks that no operation raised, that
+every scan saw only well-formed documents, and that the final contents
+match what the writers recorded.
+
+``scaling`` measures substring-scan throughput of ``ShardedDocumentStore.scan``
+by scan thread count. On a GIL build expect it to stay flat; on a
+free-threaded build (python3.13t) it should scale with cores.
+
+Usage (from the repository root):
+    python -m benchmarks.store_concurrency stress --seconds 10 --writers 8 --scanners 4
+    python -m benchmarks.store_concurrency scaling --docs 200000 --threads 1,2,4,8
+"""
+import argparse
+import random
+import threading
+import time
+
+from sharded_store import ShardedDocumentStore, gil_enabled
+
+
+def stress(args):
+    store = ShardedDocumentStore(args.shards, args.scan_threads)
+    stop = threading.Event()
+    errors = []
+    expected = [dict() for _ in range(args.writers)]
+    counts = {"writes": 0, "scans": 0, "reads": 0}
+    counts_lock = threading.Lock()
+
+    def count(kind, n=1):
+        with counts_lock:
+            counts[kind] += n
+
+    def writer(index):
+        rng = random.Random(index)
+        model = expected[index]
+        try:
+            while not stop.is_set():
+                doc_id = f"w{index}-{rng.randrange(args.keys)}"
+                op = rng.random()
+                if op < 0.6:
+                    text = f"{doc_id}|{rng.randrange(10 ** 6)}" + "x" * rng.randrange(200)
+                    store.put(doc_id, text)
+                    model[doc_id] = text
+                elif op < 0.8:
+                    text = f"{doc_id}|replaced"
+                    if store.replace(doc_id, text) != (doc_id in model):
+                        raise AssertionError(f"replace({doc_id}) disagreed with the model")
+                    if doc_id in model:
+                        model[doc_id] = text
+                else:
+                    if (store.pop(doc_id, None) is not None) != (doc_id in model):
+                        raise AssertionError(f"pop({doc_id}) disagreed with the model")
+                    model.pop(doc_id, None)
+                count("writes")
+        except Exception as e:
+            errors.append(e)
+
+    def check_shard(items):
+        seen = 0
+        for doc_id, text in items:
+            if not text.startswith(doc_id + "|"):
+                raise AssertionError(f"torn document {doc_id!r}: {text[:40]!r}")
+            seen += 1
+        return seen
+
+    def scanner():
+        try:
+            while not stop.is_set():
+                store.scan(check_shard)
+                count("scans")
+        except Exception as e:
+            errors.append(e)
+
+    def reader(index):
+        rng = random.Random(1000 + index)
+        try:
+            while not stop.is_set():
+                doc_id = f"w{rng.randrange(args.writers)}-{rng.randrange(args.keys)}"
+                text = store.get(doc_id)
+                if text is not None and not text.startswith(doc_id + "|"):
+                    raise AssertionError(f"torn read {doc_id!r}")
+                count("reads")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=scanner) for _ in range(args.scanners)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    final = {}
+    for model in expected:
+        final.update(model)
+    if dict(store.items()) != final:
+        errors.append(AssertionError("final store contents differ from the writers' models"))
+    if len(store) != len(final):
+        errors.append(AssertionError(f"len(store) is {len(store)}, expected {len(final)}"))
+
+    print(f"GIL enabled: {gil_enabled()}, shards: {args.shards}, scan threads: {store.scan_threads}")
+    print(f"{counts['writes']} writes, {counts['scans']} scans, {counts['reads']} reads in {args.seconds}s")
+    if errors:
+        for error in errors[:10]:
+            print(f"FAILED: {error!r}")
+        raise SystemExit(1)
+    print(f"OK: {len(final)} documents consistent")
+
+
+def scaling(args):
+    rng = random.Random(0)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "theta", "kappa", "lambda", "sigma"]
+    documents = [
+        (f"doc-{i}", " ".join(rng.choice(words) for _ in range(rng.randint(5, 30))))
+        for i in range(args.docs)
+    ]
+
+    def match_shard(items):
+        return sum(text.lower().count("kappa lambda") for _, text in items)
+
+    print(f"GIL enabled: {gil_enabled()}, {args.docs} documents, {args.shards} shards")
+    print(f"{'threads':>7} {'scans/s':>9} {'docs/s':>12} {'speedup':>8}")
+    baseline = None
+    for threads in [int(t) for t in args.threads.split(",")]:
+        store = ShardedDocumentStore(args.shards, threads)
+        for doc_id, text in documents:
+            store.put(doc_id, text)
+        store.scan(match_shard)
+        start = time.perf_counter()
+        scans = 0
+        while time.perf_counter() - start < args.seconds:
+            store.scan(match_shard)
+            scans += 1
+        rate = scans / (time.perf_counter() - start)
+        baseline = baseline or rate
+        print(f"{threads:>7} {rate:>9.2f} {rate * args.docs:>12.0f} {rate / baseline:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    stress_parser = sub.add_parser("stress")
+    stress_parser.add_argument("--seconds", type=float, default=10)
+    stress_parser.add_argument("--writers", type=int, default=8)
+    stress_parser.add_argument("--scanners", type=int, default=4)
+    stress_parser.add_argument("--readers", type=int, default=4)
+    stress_parser.add_argument("--keys", type=int, default=2000, help="IDs per writer")
+    stress_parser.add_argument("--shards", type=int, default=16)
+    stress_parser.add_argument("--scan-threads", type=int, default=4)
+
+    scaling_parser = sub.add_parser("scaling")
+    scaling_parser.add_argument("--docs", type=int, default=200000)
+    scaling_parser.add_argument("--shards", type=int, default=16)
+    scaling_parser.add_argument("--threads", default="1,2,4,8")
+    scaling_parser.add_argument("--seconds", type=float, default=3)
+
+    args = parser.parse_args()
+    stress(args) if args.command == "stress" else scaling(args)
+
+
+if __name__ == "__main__":
+    main()
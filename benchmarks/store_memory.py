@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Document store memory benchmark
+
+Compares bytes per document of a plain dict of str -> str (the original
+``documents_storage``) with ``CompactDocumentStore``, measured with
+tracemalloc.
+
+Usage (from the repository root):
+    python -m benchmarks.store_memory --docs 200000 --text-length 120
+"""
+import argparse
+import random
+import string
+import tracemalloc
+import uuid
+
+from compact_store import CompactDocumentStore
+
+
+def make_documents(count: int, text_length: int, seed: int = 0):
+    rng = random.Random(seed)
+    alphabet = string.ascii_lowercase + " " * 6
+    for _ in range(count):
+        doc_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        length = rng.randint(text_length // 2, text_length)
+        yield doc_id, "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def measure(factory, documents):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = factory()
+    for doc_id, text in documents:
+        store[doc_id] = text
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return store, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200000)
+    parser.add_argument("--text-length", type=int, default=120)
+    args = parser.parse_args()
+
+    raw = sum(len(doc_id) + len(text.encode("utf-8")) for doc_id, text in make_documents(args.docs, args.text_length))
+    print(f"{args.docs} documents, {raw / args.docs:.1f} raw bytes per document (id + UTF-8 text)")
+
+    # Documents are generated inside each measurement so the strings a dict keeps are counted
+    _, dict_bytes = measure(dict, make_documents(args.docs, args.text_length))
+    store, compact_bytes = measure(CompactDocumentStore, make_documents(args.docs, args.text_length))
+
+    print(f"{'store':<10} {'bytes/doc':>10} {'total MiB':>10}")
+    print(f"{'dict':<10} {dict_bytes / args.docs:>10.1f} {dict_bytes / 2**20:>10.1f}")
+    print(f"{'compact':<10} {compact_bytes / args.docs:>10.1f} {compact_bytes / 2**20:>10.1f}")
+    print(f"reported by memory_usage(): {store.memory_usage()['bytes_per_document']} bytes/doc")
+
+
+if __name__ == "__main__":
+    main()
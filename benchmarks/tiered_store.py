@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tiered document store benchmark
+
+Loads documents into a ``ShardedDocumentStore`` with a memory budget
+that holds only a fraction of the corpus, then issues point reads with a
+Zipf-like popularity (a few documents get most reads, as in production)
+and reports the hit ratio and read latency against an all-in-RAM store.
+A full scan afterwards shows that scans do not flush the working set.
+
+Usage (from the repository root):
+    python -m benchmarks.tiered_store --docs 200000 --text-length 500 --budget-fraction 0.1
+"""
+import argparse
+import bisect
+import itertools
+import random
+import statistics
+import time
+
+from benchmarks.store_memory import make_documents
+from sharded_store import ShardedDocumentStore
+
+
+def zipf_sampler(count: int, exponent: float, rng: random.Random):
+    weights = [1.0 / (rank + 1) ** exponent for rank in range(count)]
+    cumulative = list(itertools.accumulate(weights))
+    return lambda: bisect.bisect_left(cumulative, rng.random() * cumulative[-1])
+
+
+def read_latencies(store: ShardedDocumentStore, ids: list, sample, reads: int) -> list:
+    latencies = []
+    for _ in range(reads):
+        doc_id = ids[sample()]
+        start = time.perf_counter()
+        store.get(doc_id)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: list, usage: dict):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    hit_ratio = usage.get("hit_ratio")
+    print(f"{name:<14} p50 {statistics.median(latencies) * 1e6:7.1f}us  p99 {p99 * 1e6:7.1f}us  "
+          f"hit ratio {'-' if hit_ratio is None else f'{hit_ratio:.3f}'}  "
+          f"resident text {usage.get('resident_text_bytes', usage['live_bytes']) / 2 ** 20:8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200000)
+    parser.add_argument("--text-length", type=int, default=500)
+    parser.add_argument("--budget-fraction", type=float, default=0.1, help="memory budget as a fraction of text bytes")
+    parser.add_argument("--reads", type=int, default=200000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="popularity skew of the reads")
+    args = parser.parse_args()
+
+    documents = list(make_documents(args.docs, args.text_length))
+    ids = [doc_id for doc_id, _ in documents]
+    text_bytes = sum(len(text.encode("utf-8")) for _, text in documents)
+    budget = int(text_bytes * args.budget_fraction)
+    print(f"{args.docs} documents, {text_bytes / 2 ** 20:.1f} MiB of text, budget {budget / 2 ** 20:.1f} MiB")
+
+    for name, store in (
+        ("in memory", ShardedDocumentStore()),
+        ("tiered", ShardedDocumentStore(memory_budget=budget)),
+    ):
+        store.put_many(documents)
+        sample = zipf_sampler(args.docs, args.zipf, random.Random(0))
+        # Warm up the working set, then measure
+        read_latencies(store, ids, sample, args.reads // 4)
+        report(name, read_latencies(store, ids, sample, args.reads), store.memory_usage())
+
+        if name == "tiered":
+            start = time.perf_counter()
+            scanned = sum(store.scan(lambda items: sum(1 for _ in items)))
+            print(f"{'full scan':<14} {scanned} documents in {time.perf_counter() - start:.2f}s")
+            report("after scan", read_latencies(store, ids, sample, args.reads), store.memory_usage())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Trigram index benchmark: indexed vs scanned substring search
+
+Loads documents into a ``ShardedDocumentStore`` and a ``TrigramIndex``,
+then answers substring queries cut from random documents both ways: a
+full scan counting the query in every lowercased text (what /search does
+without the index), and the index's candidates verified with the same
+count. Fuzzy queries are the same substrings with one character changed.
+Reports index build time, posting list size and per-query latency.
+
+Usage (from the repository root):
+    python -m benchmarks.trigram_index --docs 100000 --text-length 500 --query-length 8
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+
+from benchmarks.store_memory import make_documents
+from sharded_store import ShardedDocumentStore
+from trigram_index import TrigramIndex
+
+
+def scan(store: ShardedDocumentStore, query_lower: str) -> set:
+    def match_shard(items):
+        return [doc_id for doc_id, text in items if query_lower in text.lower()]
+    return {doc_id for ids in store.scan(match_shard) for doc_id in ids}
+
+
+def indexed(store: ShardedDocumentStore, index: TrigramIndex, query_lower: str) -> set:
+    texts = store.get_many(index.candidates(query_lower))
+    return {doc_id for doc_id, text in texts.items() if query_lower in text.lower()}
+
+
+def timed(fn, queries: list) -> list:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    print(f"{name:<10} mean {statistics.mean(latencies) * 1e3:8.2f}ms  p50 {statistics.median(latencies) * 1e3:8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--text-length", type=int, default=500)
+    parser.add_argument("--query-length", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    documents = list(make_documents(args.docs, args.text_length))
+    store = ShardedDocumentStore()
+    store.put_many(documents)
+    # Every query is let through to the index, however common
+    index = TrigramIndex(max_candidate_fraction=1.0)
+    start = time.perf_counter()
+    index.add_many(documents)
+    stats = index.stats()
+    print(f"{args.docs} documents indexed in {time.perf_counter() - start:.1f}s: {stats['trigrams']} trigrams, "
+          f"{stats['postings']} postings in {stats['posting_bytes'] / 2 ** 20:.1f} MiB")
+
+    rng = random.Random(1)
+    queries = []
+    for _ in range(args.queries):
+        text = rng.choice(documents)[1]
+        offset = rng.randrange(max(1, len(text) - args.query_length))
+        queries.append(text[offset:offset + args.query_length])
+
+    for query in queries[:5]:
+        assert scan(store, query) == indexed(store, index, query), query
+    report("scan", timed(lambda query: scan(store, query), queries))
+    report("index", timed(lambda query: indexed(store, index, query), queries))
+
+    typos = []
+    for query in queries:
+        position = rng.randrange(len(query))
+        typos.append(query[:position] + rng.choice(string.ascii_lowercase) + query[position + 1:])
+    report("fuzzy", timed(lambda query: index.fuzzy(query, 10), typos))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+WebSocket channel vs HTTP per-call overhead benchmark
+
+Runs against a live server (any of the three apps). Seeds a few
+documents, then measures small get and search calls made one at a time
+over keep-alive HTTP (AsyncChromaClient) and over the WebSocket channel
+(ChannelClient), and finally the channel's throughput with many calls
+pipelined on one connection. Keep RATE_LIMIT_PER_SECOND above the call
+rate (or 0) on the server, or admission control will reject calls.
+
+Usage (from the repository root, with the server running):
+    python -m benchmarks.websocket_channel --url http://localhost:10000 --api-key your-api-key --calls 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from client import AsyncChromaClient, ChannelClient
+
+
+def report(name: str, latencies: list):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<22} p50 {statistics.median(latencies) * 1e3:7.3f}ms  p99 {p99 * 1e3:7.3f}ms")
+
+
+async def sequential(call, calls: int) -> list:
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        await call(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run(args):
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    ids = [f"{prefix}-{i}" for i in range(args.docs)]
+
+    async with AsyncChromaClient(args.url, args.api_key) as http:
+        await http.add_many([{"id": doc_id, "text": f"benchmark document {i} about vector search"}
+                             for i, doc_id in enumerate(ids)])
+        report("http get", await sequential(lambda i: http.get(ids[i % len(ids)]), args.calls))
+        report("http search", await sequential(lambda i: http.search(f"document {i % len(ids)}", limit=3), args.calls))
+
+    async with ChannelClient(args.url, args.api_key) as channel:
+        report("websocket get", await sequential(lambda i: channel.get(ids[i % len(ids)]), args.calls))
+        report("websocket search", await sequential(
+            lambda i: channel.search(f"document {i % len(ids)}", limit=3), args.calls
+        ))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(channel.search(f"document {i % len(ids)}", limit=3) for i in range(args.calls)))
+        elapsed = time.perf_counter() - start
+        print(f"{'websocket pipelined':<22} {args.calls / elapsed:9.0f} searches/s ({args.calls} in flight)")
+
+    async with AsyncChromaClient(args.url, args.api_key) as http:
+        await asyncio.gather(*(http.delete(doc_id) for doc_id in ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:10000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--docs", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
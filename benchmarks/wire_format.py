@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Wire format benchmark: JSON vs MessagePack vs Arrow IPC
+
+Times both ends of the three bulk paths, in process and without a
+server:
+
+``add``     client encoding of an /add/batch body with embeddings, then the
+            server's decode, Pydantic validation and embedding decoding
+``search``  the server's encoding of a /search/batch response, then the
+            client's decode
+``export``  the server's encoding of an /export page with embeddings, then
+            the client's decode into a float32 matrix
+
+The JSON numbers follow main.py's current path (json.loads plus Pydantic
+validation, base64 embeddings, jsonable_encoder plus json.dumps). Arrow
+decoding stops at the table; its columns are usable without conversion.
+
+Usage (from the repository root; needs msgpack, pyarrow and numpy):
+    python -m benchmarks.wire_format --docs 256 --dimension 384 --queries 64 --k 10
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import time
+from typing import List, Optional, Union
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from vectors import decode_embedding, encode_embedding
+from wire_format import (
+    ARROW_TYPE, MSGPACK_TYPE, ExportEncoder, arrow_stream, binary_response, decode_body, encode_msgpack, search_batch_table,
+)
+
+
+# Same fields as the request and response models in main.py
+class DocumentAdd(BaseModel):
+    id: Optional[str] = None
+    text: str
+    embedding: Optional[Union[str, bytes]] = None
+
+
+class DocumentBatch(BaseModel):
+    documents: List[DocumentAdd]
+
+
+class SearchResponse(BaseModel):
+    id: str
+    text: Optional[str] = None
+    metadata: Optional[dict] = None
+    distance: Optional[float] = None
+    score: Optional[float] = None
+
+
+def validate(body) -> DocumentBatch:
+    if hasattr(DocumentBatch, "model_validate"):
+        return DocumentBatch.model_validate(body)
+    return DocumentBatch.parse_obj(body)
+
+
+def timed(fn, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def report(path: str, name: str, encode: float, decode: float, size: int, baseline: Optional[float]):
+    total = encode + decode
+    speedup = f"{baseline / total:6.1f}x" if baseline else "      -"
+    print(f"{path:<7} {name:<8} {encode * 1e3:9.2f} {decode * 1e3:9.2f} {size / 1024:10.1f} {speedup}")
+    return total
+
+
+def bench_add(args, rng, texts, vectors):
+    ids = [f"doc-{i}" for i in range(args.docs)]
+
+    def server(body, media_type=None):
+        batch = validate(json.loads(body) if media_type is None else decode_body(body, media_type, DocumentBatch))
+        return [decode_embedding(document.embedding, args.dimension) for document in batch.documents]
+
+    def json_body():
+        return json.dumps({"documents": [
+            {"id": doc_id, "text": text, "embedding": encode_embedding(vector)}
+            for doc_id, text, vector in zip(ids, texts, vectors)
+        ]})
+
+    def msgpack_body():
+        return encode_msgpack({"documents": [
+            {"id": doc_id, "text": text, "embedding": vector.tobytes()}
+            for doc_id, text, vector in zip(ids, texts, vectors)
+        ]})
+
+    def arrow_body():
+        matrix = np.stack(vectors)
+        return arrow_stream(pa.table({
+            "id": ids,
+            "text": texts,
+            "embedding": pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), args.dimension),
+        }))
+
+    bodies = {"json": json_body(), "msgpack": msgpack_body(), "arrow": arrow_body()}
+    baseline = report("add", "json", timed(json_body, args.repeat),
+                      timed(lambda: server(bodies["json"]), args.repeat), len(bodies["json"]), None)
+    report("add", "msgpack", timed(msgpack_body, args.repeat),
+           timed(lambda: server(bodies["msgpack"], MSGPACK_TYPE), args.repeat), len(bodies["msgpack"]), baseline)
+    report("add", "arrow", timed(arrow_body, args.repeat),
+           timed(lambda: server(bodies["arrow"], ARROW_TYPE), args.repeat), len(bodies["arrow"]), baseline)
+
+
+def bench_search(args, rng, texts):
+    results = [
+        [SearchResponse(id=f"doc-{rng.randrange(args.docs)}", text=rng.choice(texts), distance=rng.random())
+         for _ in range(args.k)]
+        for _ in range(args.queries)
+    ]
+
+    def json_response():
+        return json.dumps(jsonable_encoder(results, exclude_none=True)).encode("utf-8")
+
+    def msgpack_response():
+        return binary_response(results, MSGPACK_TYPE, exclude_none=True).body
+
+    def arrow_response():
+        return binary_response(results, ARROW_TYPE, search_batch_table, exclude_none=True).body
+
+    bodies = {"json": json_response(), "msgpack": msgpack_response(), "arrow": arrow_response()}
+    baseline = report("search", "json", timed(json_response, args.repeat),
+                      timed(lambda: json.loads(bodies["json"]), args.repeat), len(bodies["json"]), None)
+    report("search", "msgpack", timed(msgpack_response, args.repeat),
+           timed(lambda: msgpack.unpackb(bodies["msgpack"]), args.repeat), len(bodies["msgpack"]), baseline)
+    report("search", "arrow", timed(arrow_response, args.repeat),
+           timed(lambda: pa.ipc.open_stream(bodies["arrow"]).read_all(), args.repeat), len(bodies["arrow"]), baseline)
+
+
+def bench_export(args, texts, vectors):
+    ids = [f"doc-{i}" for i in range(args.docs)]
+    # Chroma hands pages over as float lists
+    embeddings = [vector.tolist() for vector in vectors]
+
+    def json_page():
+        return "".join(
+            json.dumps({"id": doc_id, "text": text, "embedding": encode_embedding(embedding)}) + "\n"
+            for doc_id, text, embedding in zip(ids, texts, embeddings)
+        ).encode("utf-8")
+
+    def binary_page(media_type):
+        encoder = ExportEncoder(media_type, include_embeddings=True)
+        return encoder.encode(ids, texts, embeddings) + encoder.finish()
+
+    def json_client(body):
+        records = [json.loads(line) for line in body.splitlines()]
+        return np.stack([np.frombuffer(base64.b64decode(r["embedding"]), "<f4") for r in records])
+
+    def msgpack_client(body):
+        records = list(msgpack.Unpacker(io.BytesIO(body), raw=False))
+        return np.frombuffer(b"".join(r["embedding"] for r in records), "<f4").reshape(len(records), -1)
+
+    def arrow_client(body):
+        column = pa.ipc.open_stream(body).read_all().column("embedding").combine_chunks()
+        return column.values.to_numpy().reshape(len(column), -1)
+
+    bodies = {"json": json_page(), "msgpack": binary_page(MSGPACK_TYPE), "arrow": binary_page(ARROW_TYPE)}
+    baseline = report("export", "json", timed(json_page, args.repeat),
+                      timed(lambda: json_client(bodies["json"]), args.repeat), len(bodies["json"]), None)
+    report("export", "msgpack", timed(lambda: binary_page(MSGPACK_TYPE), args.repeat),
+           timed(lambda: msgpack_client(bodies["msgpack"]), args.repeat), len(bodies["msgpack"]), baseline)
+    report("export", "arrow", timed(lambda: binary_page(ARROW_TYPE), args.repeat),
+           timed(lambda: arrow_client(bodies["arrow"]), args.repeat), len(bodies["arrow"]), baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=256, help="documents per add batch and export page")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--text-length", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=64, help="queries per search batch")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "theta", "kappa", "lambda", "sigma"]
+    texts = [" ".join(rng.choice(words) for _ in range(args.text_length // 6)) for _ in range(args.docs)]
+    vectors = [np.random.default_rng(i).random(args.dimension, dtype=np.float32) for i in range(args.docs)]
+
+    print(f"{args.docs} documents x {args.dimension} dimensions, {args.queries} queries x {args.k} hits")
+    print(f"{'path':<7} {'format':<8} {'encode ms':>9} {'decode ms':>9} {'size KiB':>10} {'speedup':>7}")
+    bench_add(args, rng, texts, vectors)
+    bench_search(args, rng, texts)
+    bench_export(args, texts, vectors)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Incremental BM25 index and reciprocal rank fusion for hybrid search.
+
+Searches copy the posting lists of their terms under the index lock and
+score them outside it, so a query on a common term never holds up writes.
+Scoring checks the search deadline between terms.
+"""
+import heapq
+import math
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from search_budget import Deadline
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over an in-memory inverted index, updated per document"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self.total_length = 0
+        self.ready = False
+        self._lock = threading.RLock()
+        # IDs written while the initial load is running; the loader must not overwrite them
+        self._touched = set()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def _remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            posting = self.postings[term]
+            del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def _add(self, doc_id: str, text: str):
+        self._remove(doc_id)
+        counts: Dict[str, int] = {}
+        tokens = tokenize(text)
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_terms[doc_id] = tuple(counts)
+        self.doc_lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def add(self, doc_id: str, text: str):
+        """Index a document, replacing any previous version"""
+        with self._lock:
+            if not self.ready:
+                self._touched.add(doc_id)
+            self._add(doc_id, text)
+
+    def add_many(self, documents: Iterable[Tuple[str, str]]):
+        with self._lock:
+            for doc_id, text in documents:
+                if not self.ready:
+                    self._touched.add(doc_id)
+                self._add(doc_id, text)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            if not self.ready:
+                self._touched.add(doc_id)
+            self._remove(doc_id)
+
+    def load(self, documents: Iterable[Tuple[str, str]]):
+        """Initial bulk load that may run concurrently with add/remove"""
+        for doc_id, text in documents:
+            with self._lock:
+                if doc_id not in self._touched:
+                    self._add(doc_id, text)
+        with self._lock:
+            self.ready = True
+            self._touched.clear()
+
+    def search(self, query: str, limit: int, deadline: Optional[Deadline] = None) -> List[Tuple[str, float]]:
+        """Top documents by BM25 score, best first; past the deadline the terms scored so far rank alone"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.doc_lengths)
+            if not n or not terms:
+                return []
+            avgdl = self.total_length / n or 1.0
+            postings = [list(self.postings[term].items()) for term in terms if term in self.postings]
+            doc_lengths = self.doc_lengths
+
+        scores: Dict[str, float] = {}
+        for i, posting in enumerate(postings):
+            if i and deadline is not None and deadline.exceeded():
+                break
+            df = len(posting)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for doc_id, tf in posting:
+                # A document removed since the copy was taken is skipped
+                length = doc_lengths.get(doc_id)
+                if length is None:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * length / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self.doc_lengths), "terms": len(self.postings), "ready": self.ready}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: score(d) = sum over lists of 1 / (k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,595 @@
+"""
+Python client for the document API, sync and async.
+
+Both clients keep a pool of keep-alive connections (httpx), retry
+transient failures (connection errors, 429 and 5xx from a proxy) with
+jittered exponential backoff, and honour ``Retry-After``. IDs for new
+documents are generated client-side, so a retried add cannot store a
+second copy. The server answers 409 for an ID it already holds, so when
+a resent add gets 409 the client reads those IDs back: if they hold the
+texts it sent, an earlier attempt whose answer was lost stored them and
+the add succeeds; otherwise the 409 is raised. A retried delete can
+still report 404.
+
+``AsyncChromaClient`` coalesces concurrent ``add`` and ``search`` calls
+into ``/add/batch`` and ``/search/batch`` requests, and bounds the number
+of requests in flight. Servers without the batch endpoints are detected
+on the first 404/405 and served one call at a time from then on.
+
+    async with AsyncChromaClient("http://localhost:8000", api_key) as client:
+        results = await asyncio.gather(*(client.search(q) for q in queries))
+
+    with ChromaClient("http://localhost:8000", api_key) as client:
+        for document in client.export():
+            ...
+
+``ChannelClient`` sends add, get and search calls as tagged frames over
+one WebSocket (``/ws``), pipelined, with replies matched as they arrive.
+
+Requires httpx (``pip install httpx``); ``ChannelClient`` requires
+websockets instead.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional, Tuple
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import websockets
+    from websockets.version import version as websockets_version
+except ImportError:
+    websockets = None
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# How long the async client waits for more calls to join a batch
+BATCH_WINDOW = 0.005
+
+
+class ChromaApiError(Exception):
+    """Non-success response from the API"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _raise_for_status(response) -> None:
+    if response.status_code < 400:
+        return
+    try:
+        detail = response.json().get("detail", response.text)
+    except ValueError:
+        detail = response.text
+    raise ChromaApiError(response.status_code, detail)
+
+
+def _retry_delay(attempt: int, backoff: float, response=None) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when given"""
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return random.uniform(0, backoff * (2 ** attempt))
+
+
+def _document(text: str, doc_id: Optional[str], embedding: Optional[str]) -> dict:
+    # A client-side ID lets a resent add recognise what an earlier attempt stored
+    document = {"id": doc_id or str(uuid.uuid4()), "text": text}
+    if embedding is not None:
+        document["embedding"] = embedding
+    return document
+
+
+def _search_options(**options) -> dict:
+    """Search options that are set; include is a list of fields"""
+    options = {key: value for key, value in options.items() if value is not None}
+    if isinstance(options.get("include"), str):
+        options["include"] = options["include"].split(",")
+    return options
+
+
+def _search_params(query: str, limit: int, options: dict) -> dict:
+    params = dict(options, query=query, limit=limit)
+    if "include" in params:
+        params["include"] = ",".join(params["include"])
+    return params
+
+
+def _added_documents(body: dict) -> List[dict]:
+    """Documents sent in an /add or /add/batch body"""
+    return body["documents"] if "documents" in body else [body]
+
+
+def _holds(changed: dict, documents: List[dict]) -> bool:
+    """True if a get_changed result shows every document stored with the text sent"""
+    stored = {document["id"]: document["text"] for document in changed["changed"]}
+    return all(stored.get(document["id"]) == document["text"] for document in documents)
+
+
+def _add_result(body: dict):
+    """The answer an add would have had: one document, or a list for a batch"""
+    result = [{"id": document["id"], "text": document["text"]} for document in _added_documents(body)]
+    return result if "documents" in body else result[0]
+
+
+class _BaseClient:
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout: float = 30.0,
+        max_connections: int = 10,
+        max_retries: int = 3,
+        backoff: float = 0.1,
+        batch_size: int = 64,
+    ):
+        if httpx is None:
+            raise ImportError("The client requires httpx (pip install httpx)")
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self._options = dict(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        # Batch endpoints this server does not have
+        self._unsupported = set()
+
+    def _should_retry(self, attempt: int, response=None, error=None) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if error is not None:
+            return isinstance(error, httpx.TransportError)
+        return response.status_code in RETRY_STATUSES
+
+
+class ChromaClient(_BaseClient):
+    """Blocking client; safe to share between threads"""
+
+    def __init__(self, base_url: str, api_key: str, **kwargs):
+        super().__init__(base_url, api_key, **kwargs)
+        self._http = httpx.Client(**self._options)
+
+    def __enter__(self) -> "ChromaClient":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._http.close()
+
+    def _exchange(self, method: str, path: str, **kwargs) -> Tuple[Any, bool]:
+        """The final response, and whether the request was sent more than once"""
+        attempt = 0
+        while True:
+            try:
+                response = self._http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt, error=e):
+                    raise
+                time.sleep(_retry_delay(attempt, self.backoff))
+            else:
+                if not self._should_retry(attempt, response=response):
+                    return response, attempt > 0
+                time.sleep(_retry_delay(attempt, self.backoff, response))
+            attempt += 1
+
+    def _request(self, method: str, path: str, **kwargs):
+        return self._exchange(method, path, **kwargs)[0]
+
+    def _call(self, method: str, path: str, **kwargs):
+        response = self._request(method, path, **kwargs)
+        _raise_for_status(response)
+        return response.json()
+
+    def _add(self, method: str, path: str, json: dict):
+        """_call for adds: a 409 to a resent add is success if the IDs hold the texts sent"""
+        response, resent = self._exchange(method, path, json=json)
+        if response.status_code == 409 and resent:
+            documents = _added_documents(json)
+            try:
+                changed = self.get_changed({document["id"]: None for document in documents})
+            except ChromaApiError:
+                changed = {"changed": []}
+            if _holds(changed, documents):
+                return _add_result(json)
+        _raise_for_status(response)
+        return response.json()
+
+    def _map(self, fn, items: list) -> list:
+        """fn over items with at most max_connections calls in flight"""
+        with ThreadPoolExecutor(self.max_connections) as executor:
+            return list(executor.map(fn, items))
+
+    def _batched(self, path: str, key: str, items: list, single, call=None, **body) -> list:
+        """Send items through a batch endpoint in chunks (with call, default _call), or one by one if the server lacks it"""
+        call = call or self._call
+        if path not in self._unsupported:
+            try:
+                results = []
+                for start in range(0, len(items), self.batch_size):
+                    chunk = items[start:start + self.batch_size]
+                    results.extend(call("POST", path, json=dict(body, **{key: chunk})))
+                return results
+            except ChromaApiError as e:
+                if e.status_code not in (404, 405) or results:
+                    raise
+                self._unsupported.add(path)
+        return self._map(single, items)
+
+    # Documents
+
+    def add(self, text: str, id: Optional[str] = None, embedding: Optional[str] = None) -> dict:
+        return self._add("POST", "/add", json=_document(text, id, embedding))
+
+    def add_many(self, documents: List[dict]) -> List[dict]:
+        """Add {"text", "id"?, "embedding"?} documents, batched"""
+        documents = [_document(d["text"], d.get("id"), d.get("embedding")) for d in documents]
+        return self._batched(
+            "/add/batch", "documents", documents, lambda d: self._add("POST", "/add", json=d), call=self._add
+        )
+
+    def get(self, doc_id: str) -> dict:
+        return self._call("GET", f"/get/{doc_id}")
+
+    def get_changed(self, known: Dict[str, Optional[int]]) -> dict:
+        """{"changed": [...], "missing": [...]} for the IDs whose version differs from known"""
+        documents = [{"id": doc_id, "version": version} for doc_id, version in known.items()]
+        return self._call("POST", "/get/batch", json={"documents": documents})
+
+    def update(self, doc_id: str, text: str, embedding: Optional[str] = None) -> dict:
+        return self._call("PUT", "/update", json=_document(text, doc_id, embedding))
+
+    def upsert(self, doc_id: str, text: str, embedding: Optional[str] = None) -> dict:
+        return self._call("POST", "/upsert", json=_document(text, doc_id, embedding))
+
+    def delete(self, doc_id: str) -> dict:
+        return self._call("DELETE", f"/delete/{doc_id}")
+
+    # Search
+
+    def search(self, query: str, limit: int = 10, mode: Optional[str] = None, ef: Optional[int] = None,
+               profile: Optional[str] = None, include: Optional[List[str]] = None,
+               max_distance: Optional[float] = None) -> List[dict]:
+        options = _search_options(mode=mode, ef=ef, profile=profile, include=include, max_distance=max_distance)
+        return self._call("GET", "/search", params=_search_params(query, limit, options))
+
+    def search_many(self, queries: List[str], limit: int = 10, **options) -> List[List[dict]]:
+        """One result list per query, batched; options as for search, except mode"""
+        options = _search_options(**options)
+        return self._batched(
+            "/search/batch", "queries", queries,
+            lambda q: self._call("GET", "/search", params=_search_params(q, limit, options)),
+            limit=limit, **options
+        )
+
+    def search_vector(self, embedding: str, limit: int = 10, **options) -> List[dict]:
+        options = _search_options(**options)
+        return self._call("POST", "/search/vector", json=dict(options, embedding=embedding, limit=limit))
+
+    def export(self, include_embeddings: bool = False) -> Iterator[dict]:
+        """Every document, streamed; nothing is buffered beyond the current line"""
+        params = {"include_embeddings": "true"} if include_embeddings else None
+        with self._http.stream("GET", "/export", params=params) as response:
+            if response.status_code >= 400:
+                response.read()
+                _raise_for_status(response)
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def health(self) -> dict:
+        return self._call("GET", "/health")
+
+    def stats(self) -> dict:
+        return self._call("GET", "/stats")
+
+
+class _Batcher:
+    """Collects concurrent calls for one batch endpoint and sends them together"""
+
+    def __init__(self, client: "AsyncChromaClient", path: str, key: str, single, call=None, **body):
+        self.client = client
+        self.path = path
+        self.key = key
+        self.single = single
+        # Sends a batch body; the client's _call unless given
+        self.call = call or client._call
+        self.body = body
+        self._pending: list = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def submit(self, item):
+        if self.path in self.client._unsupported:
+            return await self.single(item)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.client.batch_size:
+            self._flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(BATCH_WINDOW)
+        self._flush_task = None
+        self._flush()
+
+    def _flush(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        pending, self._pending = self._pending, []
+        if pending:
+            asyncio.ensure_future(self._send(pending))
+
+    async def _send(self, pending: list):
+        items = [item for item, _ in pending]
+        try:
+            if len(items) == 1:
+                results = [await self.single(items[0])]
+            else:
+                results = await self.call("POST", self.path, json=dict(self.body, **{self.key: items}))
+        except ChromaApiError as e:
+            if e.status_code in (404, 405):
+                # No batch endpoint: remember that and send the calls one by one
+                self.client._unsupported.add(self.path)
+                await asyncio.gather(*(self._send_one(item, future) for item, future in pending))
+                return
+            results = e
+        except Exception as e:
+            results = e
+        for i, (_, future) in enumerate(pending):
+            if future.done():
+                continue
+            if isinstance(results, Exception):
+                future.set_exception(results)
+            else:
+                future.set_result(results[i])
+
+    async def _send_one(self, item, future):
+        try:
+            future.set_result(await self.single(item))
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+
+class AsyncChromaClient(_BaseClient):
+    """asyncio client; concurrent add and search calls are sent as batches"""
+
+    def __init__(self, base_url: str, api_key: str, **kwargs):
+        super().__init__(base_url, api_key, **kwargs)
+        self._http = httpx.AsyncClient(**self._options)
+        self._semaphore = asyncio.Semaphore(self.max_connections)
+        self._add_batcher = _Batcher(
+            self, "/add/batch", "documents", lambda d: self._add("POST", "/add", json=d), call=self._add
+        )
+        self._search_batchers: Dict[tuple, _Batcher] = {}
+
+    async def __aenter__(self) -> "AsyncChromaClient":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self._http.aclose()
+
+    async def _exchange(self, method: str, path: str, **kwargs) -> Tuple[Any, bool]:
+        """The final response, and whether the request was sent more than once"""
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    response = await self._http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt, error=e):
+                    raise
+                await asyncio.sleep(_retry_delay(attempt, self.backoff))
+            else:
+                if not self._should_retry(attempt, response=response):
+                    return response, attempt > 0
+                await asyncio.sleep(_retry_delay(attempt, self.backoff, response))
+            attempt += 1
+
+    async def _request(self, method: str, path: str, **kwargs):
+        return (await self._exchange(method, path, **kwargs))[0]
+
+    async def _call(self, method: str, path: str, **kwargs):
+        response = await self._request(method, path, **kwargs)
+        _raise_for_status(response)
+        return response.json()
+
+    async def _add(self, method: str, path: str, json: dict):
+        """_call for adds: a 409 to a resent add is success if the IDs hold the texts sent"""
+        response, resent = await self._exchange(method, path, json=json)
+        if response.status_code == 409 and resent:
+            documents = _added_documents(json)
+            try:
+                changed = await self.get_changed({document["id"]: None for document in documents})
+            except ChromaApiError:
+                changed = {"changed": []}
+            if _holds(changed, documents):
+                return _add_result(json)
+        _raise_for_status(response)
+        return response.json()
+
+    # Documents
+
+    async def add(self, text: str, id: Optional[str] = None, embedding: Optional[str] = None) -> dict:
+        return await self._add_batcher.submit(_document(text, id, embedding))
+
+    async def add_many(self, documents: List[dict]) -> List[dict]:
+        """Add {"text", "id"?, "embedding"?} documents, batched"""
+        return await asyncio.gather(*(self.add(d["text"], d.get("id"), d.get("embedding")) for d in documents))
+
+    async def get(self, doc_id: str) -> dict:
+        return await self._call("GET", f"/get/{doc_id}")
+
+    async def get_changed(self, known: Dict[str, Optional[int]]) -> dict:
+        """{"changed": [...], "missing": [...]} for the IDs whose version differs from known"""
+        documents = [{"id": doc_id, "version": version} for doc_id, version in known.items()]
+        return await self._call("POST", "/get/batch", json={"documents": documents})
+
+    async def update(self, doc_id: str, text: str, embedding: Optional[str] = None) -> dict:
+        return await self._call("PUT", "/update", json=_document(text, doc_id, embedding))
+
+    async def upsert(self, doc_id: str, text: str, embedding: Optional[str] = None) -> dict:
+        return await self._call("POST", "/upsert", json=_document(text, doc_id, embedding))
+
+    async def delete(self, doc_id: str) -> dict:
+        return await self._call("DELETE", f"/delete/{doc_id}")
+
+    # Search
+
+    async def search(self, query: str, limit: int = 10, mode: Optional[str] = None, ef: Optional[int] = None,
+                     profile: Optional[str] = None, include: Optional[List[str]] = None,
+                     max_distance: Optional[float] = None) -> List[dict]:
+        options = _search_options(ef=ef, profile=profile, include=include, max_distance=max_distance)
+        if mode not in (None, "vector"):
+            # The batch endpoint only runs vector searches
+            return await self._call("GET", "/search", params=_search_params(query, limit, dict(options, mode=mode)))
+        # A batch shares one limit and one set of options
+        key = (limit, repr(sorted(options.items())))
+        batcher = self._search_batchers.get(key)
+        if batcher is None:
+            batcher = self._search_batchers[key] = _Batcher(
+                self, "/search/batch", "queries",
+                lambda q: self._call("GET", "/search", params=_search_params(q, limit, options)),
+                limit=limit, **options
+            )
+        return await batcher.submit(query)
+
+    async def search_many(self, queries: List[str], limit: int = 10, **options) -> List[List[dict]]:
+        return await asyncio.gather(*(self.search(query, limit, **options) for query in queries))
+
+    async def search_vector(self, embedding: str, limit: int = 10, **options) -> List[dict]:
+        options = _search_options(**options)
+        return await self._call("POST", "/search/vector", json=dict(options, embedding=embedding, limit=limit))
+
+    async def export(self, include_embeddings: bool = False) -> AsyncIterator[dict]:
+        """Every document, streamed; nothing is buffered beyond the current line"""
+        params = {"include_embeddings": "true"} if include_embeddings else None
+        async with self._http.stream("GET", "/export", params=params) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                _raise_for_status(response)
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+
+    async def health(self) -> dict:
+        return await self._call("GET", "/health")
+
+    async def stats(self) -> dict:
+        return await self._call("GET", "/stats")
+
+
+class ChannelClient:
+    """asyncio client multiplexing add, get and search over one WebSocket.
+
+    Every call is sent at once as a frame with its own tag, so any number
+    can be in flight; the server coalesces concurrent adds and searches
+    into batches itself. Calls are not retried, and a dropped connection
+    fails the calls still waiting on it.
+    """
+
+    def __init__(self, base_url: str, api_key: str, path: str = "/ws"):
+        if websockets is None:
+            raise ImportError("ChannelClient requires websockets (pip install websockets)")
+        url = base_url.rstrip("/")
+        if url.startswith("http"):
+            # http -> ws, https -> wss
+            url = "ws" + url[len("http"):]
+        self.url = url + path
+        self._headers = {"Authorization": f"Bearer {api_key}"}
+        self._socket = None
+        self._reader: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._tags = itertools.count()
+
+    async def __aenter__(self) -> "ChannelClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def connect(self):
+        # websockets 14 renamed the handshake headers option
+        option = "additional_headers" if int(websockets_version.split(".")[0]) >= 14 else "extra_headers"
+        self._socket = await websockets.connect(self.url, **{option: self._headers})
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def close(self):
+        if self._socket is not None:
+            await self._socket.close()
+        if self._reader is not None:
+            await self._reader
+
+    async def _read(self):
+        try:
+            async for message in self._socket:
+                reply = json.loads(message)
+                future = self._pending.pop(reply.get("tag"), None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("WebSocket connection closed"))
+
+    async def _call(self, op: str, **fields) -> dict:
+        if self._socket is None:
+            raise RuntimeError("ChannelClient is not connected")
+        tag = next(self._tags)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = future
+        try:
+            await self._socket.send(json.dumps(dict(fields, tag=tag, op=op)))
+            reply = await future
+        finally:
+            self._pending.pop(tag, None)
+        if reply["status"] >= 400:
+            raise ChromaApiError(reply["status"], reply.get("error"))
+        return reply
+
+    async def add(self, text: str, id: Optional[str] = None, embedding: Optional[str] = None) -> dict:
+        return (await self._call("add", **_document(text, id, embedding)))["result"]
+
+    async def get(self, doc_id: str, version: Optional[int] = None) -> Optional[dict]:
+        """The document with its "version", or None if version is still current"""
+        fields = {"id": doc_id} if version is None else {"id": doc_id, "version": version}
+        reply = await self._call("get", **fields)
+        if reply["status"] == 304:
+            return None
+        return dict(reply["result"], version=int(reply["etag"].strip('"')))
+
+    async def search(self, query: str, limit: int = 10, mode: Optional[str] = None, ef: Optional[int] = None,
+                     profile: Optional[str] = None, include: Optional[List[str]] = None,
+                     max_distance: Optional[float] = None) -> List[dict]:
+        options = _search_options(mode=mode, ef=ef, profile=profile, include=include, max_distance=max_distance)
+        return (await self._call("search", query=query, limit=limit, **options))["result"]
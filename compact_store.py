@@ -0,0 +1,236 @@
+"""
+Compact in-memory document store.
+
+A drop-in ``MutableMapping[str, str]`` replacement for a plain dict of
+documents that avoids per-document Python objects:
+
+- each document is one record ``<id bytes><UTF-8 text>`` in a single
+  growable byte arena, addressed by offset/length arrays indexed by a
+  dense integer slot;
+- canonical UUID IDs are stored as their 16 raw bytes;
+- IDs are looked up through an open-addressing hash table of slot
+  numbers held in an ``array``;
+- deleted slots are reused through a free list, replacement texts that
+  fit are written in place, and the arena is compacted once too much of
+  it is garbage.
+"""
+import sys
+import uuid
+from array import array
+from collections.abc import MutableMapping
+from typing import Iterator, Tuple
+
+EMPTY = -1
+TOMBSTONE = -2
+
+KIND_FREE = 0
+KIND_UUID = 1
+KIND_STR = 2
+
+# Compact once garbage exceeds this fraction of the arena (and COMPACT_MIN_BYTES)
+COMPACT_RATIO = 0.5
+COMPACT_MIN_BYTES = 1 << 20
+
+# Grow the hash table when live + deleted entries exceed this load factor
+MAX_LOAD = 0.7
+
+
+def encode_id(doc_id: str) -> Tuple[bytes, int]:
+    """Canonical UUID strings become 16 bytes; anything else is stored as UTF-8"""
+    if len(doc_id) == 36 and doc_id[8] == "-":
+        try:
+            parsed = uuid.UUID(doc_id)
+        except ValueError:
+            parsed = None
+        if parsed is not None and str(parsed) == doc_id:
+            return parsed.bytes, KIND_UUID
+    return doc_id.encode("utf-8"), KIND_STR
+
+
+def decode_id(key: bytes, kind: int) -> str:
+    return str(uuid.UUID(bytes=key)) if kind == KIND_UUID else key.decode("utf-8")
+
+
+class CompactDocumentStore(MutableMapping):
+    """Dict-like ``id -> text`` store with low per-document overhead"""
+
+    def __init__(self):
+        self._arena = bytearray()
+        self._offsets = array("Q")
+        self._key_lengths = array("H")
+        self._text_lengths = array("I")
+        self._kinds = array("B")
+        self._free = array("I")
+        self._table = array("q", [EMPTY]) * 8
+        self._table_used = 0
+        self._count = 0
+        self._live_bytes = 0
+
+    # Mapping interface
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, doc_id) -> bool:
+        return isinstance(doc_id, str) and self._find(*encode_id(doc_id))[1] >= 0
+
+    def __getitem__(self, doc_id: str) -> str:
+        slot = self._find(*encode_id(doc_id))[1]
+        if slot < 0:
+            raise KeyError(doc_id)
+        return self._text(slot)
+
+    def __setitem__(self, doc_id: str, text: str):
+        key, kind = encode_id(doc_id)
+        if len(key) > 0xFFFF:
+            raise ValueError("Document ID is too long")
+        data = text.encode("utf-8")
+        index, slot = self._find(key, kind)
+
+        if slot >= 0:
+            old_length = self._text_lengths[slot]
+            if len(data) <= old_length:
+                start = self._offsets[slot] + len(key)
+                self._arena[start:start + len(data)] = data
+                self._text_lengths[slot] = len(data)
+                self._live_bytes -= old_length - len(data)
+                return
+            self._live_bytes -= len(key) + old_length
+        else:
+            slot = self._allocate_slot(kind)
+            if self._table[index] == EMPTY:
+                self._table_used += 1
+            self._table[index] = slot
+            self._count += 1
+
+        self._offsets[slot] = len(self._arena)
+        self._key_lengths[slot] = len(key)
+        self._text_lengths[slot] = len(data)
+        self._arena += key
+        self._arena += data
+        self._live_bytes += len(key) + len(data)
+
+        if self._table_used > MAX_LOAD * len(self._table):
+            self._resize()
+        self._maybe_compact()
+
+    def __delitem__(self, doc_id: str):
+        index, slot = self._find(*encode_id(doc_id))
+        if slot < 0:
+            raise KeyError(doc_id)
+        self._table[index] = TOMBSTONE
+        self._live_bytes -= self._key_lengths[slot] + self._text_lengths[slot]
+        self._kinds[slot] = KIND_FREE
+        self._text_lengths[slot] = 0
+        self._free.append(slot)
+        self._count -= 1
+        self._maybe_compact()
+
+    def __iter__(self) -> Iterator[str]:
+        for slot in range(len(self._kinds)):
+            if self._kinds[slot] != KIND_FREE:
+                yield self._id(slot)
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """Iterate (id, text) pairs straight from the slot arrays"""
+        for slot in range(len(self._kinds)):
+            if self._kinds[slot] != KIND_FREE:
+                yield self._id(slot), self._text(slot)
+
+    def clear(self):
+        self.__init__()
+
+    # Internals
+
+    def _id(self, slot: int) -> str:
+        offset = self._offsets[slot]
+        return decode_id(bytes(self._arena[offset:offset + self._key_lengths[slot]]), self._kinds[slot])
+
+    def _text(self, slot: int) -> str:
+        start = self._offsets[slot] + self._key_lengths[slot]
+        return self._arena[start:start + self._text_lengths[slot]].decode("utf-8")
+
+    def _find(self, key: bytes, kind: int) -> Tuple[int, int]:
+        """Return (table index, slot) for key, or (insertion index, -1) if absent"""
+        table = self._table
+        mask = len(table) - 1
+        index = hash(key) & mask
+        insert_at = -1
+        while True:
+            slot = table[index]
+            if slot == EMPTY:
+                return (insert_at if insert_at >= 0 else index), -1
+            if slot == TOMBSTONE:
+                if insert_at < 0:
+                    insert_at = index
+            # A UUID's 16 raw bytes can equal a 16-byte string ID, so the kind must match too
+            elif self._key_lengths[slot] == len(key) and self._kinds[slot] == kind:
+                offset = self._offsets[slot]
+                if self._arena[offset:offset + len(key)] == key:
+                    return index, slot
+            index = (index + 1) & mask
+
+    def _allocate_slot(self, kind: int) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._kinds[slot] = kind
+            return slot
+        self._offsets.append(0)
+        self._key_lengths.append(0)
+        self._text_lengths.append(0)
+        self._kinds.append(kind)
+        return len(self._kinds) - 1
+
+    def _resize(self):
+        size = 8
+        while size * MAX_LOAD <= self._count * 2:
+            size *= 2
+        table = array("q", [EMPTY]) * size
+        mask = size - 1
+        for slot in range(len(self._kinds)):
+            if self._kinds[slot] == KIND_FREE:
+                continue
+            offset = self._offsets[slot]
+            index = hash(bytes(self._arena[offset:offset + self._key_lengths[slot]])) & mask
+            while table[index] != EMPTY:
+                index = (index + 1) & mask
+            table[index] = slot
+        self._table = table
+        self._table_used = self._count
+
+    def _maybe_compact(self):
+        garbage = len(self._arena) - self._live_bytes
+        if garbage > COMPACT_MIN_BYTES and garbage > COMPACT_RATIO * len(self._arena):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the arena without the bytes of deleted or replaced records"""
+        arena = bytearray()
+        for slot in range(len(self._kinds)):
+            if self._kinds[slot] == KIND_FREE:
+                continue
+            offset = self._offsets[slot]
+            length = self._key_lengths[slot] + self._text_lengths[slot]
+            self._offsets[slot] = len(arena)
+            arena += self._arena[offset:offset + length]
+        self._arena = arena
+
+    def memory_usage(self) -> dict:
+        """Bytes held by the store, broken down by structure"""
+        arena_bytes = sys.getsizeof(self._arena)
+        slot_bytes = sum(sys.getsizeof(a) for a in (
+            self._offsets, self._key_lengths, self._text_lengths, self._kinds, self._free
+        ))
+        index_bytes = sys.getsizeof(self._table)
+        total = arena_bytes + slot_bytes + index_bytes
+        return {
+            "documents": self._count,
+            "live_bytes": self._live_bytes,
+            "arena_bytes": arena_bytes,
+            "garbage_bytes": len(self._arena) - self._live_bytes,
+            "slot_bytes": slot_bytes,
+            "index_bytes": index_bytes,
+            "free_slots": len(self._free),
+            "total_bytes": total,
+            "bytes_per_document": round(total / self._count, 1) if self._count else 0.0,
+        }
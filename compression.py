@@ -0,0 +1,356 @@
+"""
+Negotiated response compression and compressed request bodies.
+
+gzip is always available; zstd and brotli are used when the optional
+``zstandard`` / ``brotli`` packages are installed. brotli request bodies
+are only accepted when the binding can bound each decompression step
+(brotli >= 1.2), so a small body cannot inflate past the size cap.
+"""
+import gzip
+import json
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Older bindings inflate each input chunk in full, which defeats MAX_DECOMPRESSED_BODY
+BROTLI_BOUNDED = brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
+
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/msgpack",
+    "application/vnd.apache.arrow.stream",
+    "text/",
+)
+
+
+class CompressionConfig:
+    """Compression settings, read from the environment once at startup"""
+
+    def __init__(self):
+        self.min_size = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+        # Bodies at or above this size are (de)compressed on the threadpool
+        self.offload_size = int(os.getenv("COMPRESSION_OFFLOAD_SIZE", 64 * 1024))
+        self.max_request_size = int(os.getenv("MAX_DECOMPRESSED_BODY", 64 * 1024 * 1024))
+        self.gzip_level = int(os.getenv("COMPRESSION_LEVEL_GZIP", 6))
+        self.zstd_level = int(os.getenv("COMPRESSION_LEVEL_ZSTD", 3))
+        self.brotli_level = int(os.getenv("COMPRESSION_LEVEL_BROTLI", 4))
+
+    def available_encodings(self) -> List[str]:
+        """Supported encodings in server preference order"""
+        encodings = []
+        if zstandard is not None:
+            encodings.append("zstd")
+        if brotli is not None:
+            encodings.append("br")
+        encodings.append("gzip")
+        return encodings
+
+
+def negotiate_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+    """Pick the best encoding from an Accept-Encoding header, or None"""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _StreamCompressor:
+    """Incremental compressor that flushes after every chunk"""
+
+    def __init__(self, encoding: str, config: CompressionConfig):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(config.gzip_level, zlib.DEFLATED, 31)
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=config.zstd_level).compressobj()
+        else:
+            self._obj = brotli.Compressor(quality=config.brotli_level)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "gzip":
+            out = self._obj.compress(data)
+            return out + self._obj.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        if self.encoding == "zstd":
+            out = self._obj.compress(data)
+            if final:
+                return out + self._obj.flush()
+            return out + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        out = self._obj.process(data)
+        return out + (self._obj.finish() if final else self._obj.flush())
+
+
+def compress_body(data: bytes, encoding: str, config: CompressionConfig) -> bytes:
+    """One-shot compression of a complete body"""
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=config.gzip_level, mtime=0)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=config.zstd_level).compress(data)
+    return brotli.compress(data, quality=config.brotli_level)
+
+
+class DecompressionError(Exception):
+    pass
+
+
+def decompress_body(data: bytes, encoding: str, max_size: int) -> bytes:
+    """Decompress a request body, refusing to inflate beyond max_size bytes"""
+    chunk = 64 * 1024
+    out = bytearray()
+    try:
+        if encoding in ("gzip", "deflate"):
+            obj = zlib.decompressobj(31 if encoding == "gzip" else 15)
+            buf = data
+            while buf:
+                out += obj.decompress(buf, max_size + 1 - len(out))
+                if len(out) > max_size:
+                    raise DecompressionError("Decompressed body too large")
+                buf = obj.unconsumed_tail
+            out += obj.flush()
+        elif encoding == "zstd":
+            reader = zstandard.ZstdDecompressor().stream_reader(data)
+            while True:
+                block = reader.read(chunk)
+                if not block:
+                    break
+                out += block
+                if len(out) > max_size:
+                    raise DecompressionError("Decompressed body too large")
+        elif BROTLI_BOUNDED:
+            obj = brotli.Decompressor()
+            for start in range(0, len(data), chunk):
+                out += obj.process(data[start:start + chunk], output_buffer_limit=max_size + 1 - len(out))
+                while len(out) <= max_size and not obj.can_accept_more_data():
+                    out += obj.process(b"", output_buffer_limit=max_size + 1 - len(out))
+                if len(out) > max_size:
+                    raise DecompressionError("Decompressed body too large")
+        else:
+            raise DecompressionError(f"Unsupported Content-Encoding: {encoding}")
+    except DecompressionError:
+        raise
+    except Exception as e:
+        raise DecompressionError(f"Invalid {encoding} body: {e}")
+
+    if len(out) > max_size:
+        raise DecompressionError("Decompressed body too large")
+    return bytes(out)
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _is_compressible(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    return content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses large responses and inflates compressed requests"""
+
+    def __init__(self, app, config: Optional[CompressionConfig] = None):
+        self.app = app
+        self.config = config or CompressionConfig()
+        self.available = self.config.available_encodings()
+        self.request_encodings = set(self.available) | {"deflate"}
+        if not BROTLI_BOUNDED:
+            self.request_encodings.discard("br")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_encoding = _header(scope["headers"], b"content-encoding")
+        if request_encoding and request_encoding.strip().lower() != "identity":
+            scope, receive = await self._decompress_request(
+                scope, receive, send, request_encoding.strip().lower()
+            )
+            if scope is None:
+                return
+
+        encoding = negotiate_encoding(
+            _header(scope["headers"], b"accept-encoding") or "", self.available
+        )
+        if encoding is None or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        await _CompressedResponder(self.config, encoding, send).run(self.app, scope, receive)
+
+    async def _decompress_request(self, scope, receive, send, encoding: str):
+        if encoding not in self.request_encodings:
+            await _plain_response(send, 415, f"Unsupported Content-Encoding: {encoding}")
+            return None, None
+
+        body = bytearray()
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None, None
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if len(body) > self.config.max_request_size:
+                await _plain_response(send, 413, "Request body too large")
+                return None, None
+
+        try:
+            if len(body) >= self.config.offload_size:
+                data = await run_in_threadpool(
+                    decompress_body, bytes(body), encoding, self.config.max_request_size
+                )
+            else:
+                data = decompress_body(bytes(body), encoding, self.config.max_request_size)
+        except DecompressionError as e:
+            await _plain_response(send, 400, str(e))
+            return None, None
+
+        headers = [
+            (key, value) for key, value in scope["headers"]
+            if key.lower() not in (b"content-encoding", b"content-length")
+        ]
+        headers.append((b"content-length", str(len(data)).encode("latin-1")))
+        scope = dict(scope, headers=headers)
+
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": data, "more_body": False}
+
+        return scope, replay
+
+
+class _CompressedResponder:
+    """Buffers the start of a response and decides whether to compress it"""
+
+    def __init__(self, config: CompressionConfig, encoding: str, send):
+        self.config = config
+        self.encoding = encoding
+        self.send = send
+        self.start_message = None
+        self.buffer = bytearray()
+        self.streamer: Optional[_StreamCompressor] = None
+        self.passthrough = False
+
+    async def run(self, app, scope, receive):
+        await app(scope, receive, self.on_send)
+
+    async def on_send(self, message):
+        if message["type"] == "http.response.start":
+            headers = message.get("headers", [])
+            status = message["status"]
+            if (
+                status < 200 or status in (204, 304)
+                or _header(headers, b"content-encoding") is not None
+                or not _is_compressible(_header(headers, b"content-type"))
+            ):
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.streamer is not None:
+            await self._send_chunk(body, more_body)
+            return
+
+        self.buffer += body
+        if more_body and len(self.buffer) < self.config.min_size:
+            return
+
+        if len(self.buffer) < self.config.min_size:
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": bytes(self.buffer)})
+            return
+
+        headers = [
+            (key, value) for key, value in self.start_message.get("headers", [])
+            if key.lower() not in (b"content-length", b"vary")
+        ]
+        # The encoded bytes differ from the identity body, so a strong ETag becomes weak
+        headers = [
+            (key, b"W/" + value if key.lower() == b"etag" and not value.startswith(b"W/") else value)
+            for key, value in headers
+        ]
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        headers.append((b"vary", b"Accept-Encoding"))
+        data, self.buffer = bytes(self.buffer), bytearray()
+
+        if not more_body:
+            compressed = await self._offload(compress_body, data, self.encoding, self.config)
+            headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+            await self.send(dict(self.start_message, headers=headers))
+            await self.send({"type": "http.response.body", "body": compressed})
+            return
+
+        self.streamer = _StreamCompressor(self.encoding, self.config)
+        await self.send(dict(self.start_message, headers=headers))
+        await self._send_chunk(data, more_body)
+
+    async def _send_chunk(self, data: bytes, more_body: bool):
+        compressed = await self._offload(self.streamer.compress, data, not more_body)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+    async def _offload(self, fn, data: bytes, *args):
+        if len(data) >= self.config.offload_size:
+            return await run_in_threadpool(fn, data, *args)
+        return fn(data, *args)
+
+
+async def _plain_response(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
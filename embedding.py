@@ -0,0 +1,152 @@
+"""
+Configurable local ONNX embedding function.
+
+Produces the same mean-pooled, L2-normalized sentence embeddings as
+Chroma's default all-MiniLM-L6-v2 function, but with control over the
+model directory, batch size, ONNX Runtime thread count and maximum
+sequence length. Batches are padded to their longest member rather than
+to the maximum sequence length, and documents are grouped by length so
+short texts are not padded up to long ones.
+"""
+import logging
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingConfig:
+    """Embedding settings, read from the environment once at startup"""
+
+    def __init__(self):
+        cpus = os.cpu_count() or 1
+        self.model_path = os.getenv("EMBEDDING_MODEL_PATH") or None
+        self.max_batch = int(os.getenv("EMBEDDING_MAX_BATCH", 32))
+        self.threads = int(os.getenv("EMBEDDING_THREADS", 0)) or cpus
+        self.max_seq_length = int(os.getenv("EMBEDDING_MAX_SEQ_LENGTH", 256))
+        # Concurrent inference calls; each may use `threads` cores
+        self.max_concurrency = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 0)) or max(1, cpus // self.threads)
+        providers = os.getenv("EMBEDDING_PROVIDERS", "CPUExecutionProvider")
+        self.providers = [p.strip() for p in providers.split(",") if p.strip()]
+
+    def describe(self) -> dict:
+        return {
+            "model_path": self.model_path or "default (all-MiniLM-L6-v2)",
+            "max_batch": self.max_batch,
+            "threads": self.threads,
+            "max_seq_length": self.max_seq_length,
+            "max_concurrency": self.max_concurrency,
+            "providers": self.providers,
+        }
+
+
+def default_model_path() -> str:
+    """Directory of Chroma's default model, downloading it on first use"""
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    default = ONNXMiniLM_L6_V2()
+    default._download_model_if_not_exists()
+    return os.path.join(default.DOWNLOAD_PATH, default.EXTRACTED_FOLDER_NAME)
+
+
+class LocalOnnxEmbeddingFunction:
+    """Chroma embedding function backed by an ONNX sentence-transformer model.
+
+    The model directory must contain ``model.onnx`` and ``tokenizer.json``.
+    """
+
+    def __init__(self, config: Optional[EmbeddingConfig] = None):
+        self.config = config or EmbeddingConfig()
+        self._session = None
+        self._tokenizer = None
+        self._input_names = set()
+        self._init_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.config.max_concurrency)
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the vectors this function produces (model and truncation)"""
+        path = self.config.model_path or "all-MiniLM-L6-v2"
+        return f"{os.path.basename(os.path.normpath(path))}@{self.config.max_seq_length}"
+
+    def fingerprint(self) -> str:
+        """model_id narrowed to one model file: its resolved path, size and mtime (keys cached vectors)"""
+        if not self.config.model_path:
+            # Chroma pins and checksums its default model
+            return self.model_id
+        path = os.path.realpath(self.config.model_path)
+        try:
+            stat = os.stat(os.path.join(path, "model.onnx"))
+            stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            stamp = "unreadable"
+        return f"{path}:{stamp}@{self.config.max_seq_length}"
+
+    def _load(self):
+        with self._init_lock:
+            if self._session is not None:
+                return
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            path = self.config.model_path or default_model_path()
+            tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=self.config.max_seq_length)
+            tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.config.threads
+            options.inter_op_num_threads = 1
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+            session = onnxruntime.InferenceSession(
+                os.path.join(path, "model.onnx"),
+                sess_options=options,
+                providers=self.config.providers,
+            )
+            self._input_names = {i.name for i in session.get_inputs()}
+            self._tokenizer = tokenizer
+            self._session = session
+            logger.info(f"Loaded embedding model from {path} ({self.config.describe()})")
+
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        with self._slots:
+            last_hidden_state = self._session.run(None, inputs)[0]
+
+        # Mean pooling over real tokens, then L2 normalization
+        mask = attention_mask[:, :, None].astype(np.float32)
+        summed = (last_hidden_state * mask).sum(axis=1)
+        embeddings = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1e-12
+        return (embeddings / norms).astype(np.float32)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts as a float32 matrix (blocking)"""
+        if self._session is None:
+            self._load()
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Group similar lengths into a batch to keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = None
+        for start in range(0, len(order), self.config.max_batch):
+            batch = order[start:start + self.config.max_batch]
+            embeddings = self._forward([texts[i] for i in batch])
+            if result is None:
+                result = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+            result[batch] = embeddings
+        return result
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embed(list(input)).tolist()
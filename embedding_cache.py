@@ -0,0 +1,261 @@
+"""
+Content-hash keyed embedding reuse and duplicate detection for ingest.
+
+``EmbeddingCache`` maps sha256(model id, text) to the float32 embedding,
+in an in-memory LRU with an optional SQLite tier that survives restarts,
+so re-sent texts are not embedded again. The model id names the model
+file (resolved path, size and mtime), so two models never share vectors.
+The SQLite tier is capped and trims its least recently used entries. ``ContentIndex`` maps content
+hashes to the IDs holding that text, for the optional dedup mode.
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def _pack(vector) -> bytes:
+    values = array("f", vector)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(data: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """Two-tier text -> embedding cache keyed by content hash and model (thread-safe)"""
+
+    def __init__(
+        self, model_id: str, max_entries: int = 10000, path: Optional[str] = None, max_disk_entries: int = 1000000
+    ):
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_entries = 0
+        # Recency stamp of disk entries; trimming drops the lowest
+        self._clock = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(embeddings)")}
+            if "used" not in columns:
+                self._db.execute("ALTER TABLE embeddings ADD COLUMN used INTEGER NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+            self._disk_entries, clock = self._db.execute("SELECT COUNT(*), MAX(used) FROM embeddings").fetchone()
+            self._clock = clock or 0
+            self._trim()
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls, model_id: str) -> "EmbeddingCache":
+        return cls(
+            model_id,
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", 10000)),
+            path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+            max_disk_entries=int(os.getenv("EMBEDDING_CACHE_DISK_MAX", 1000000)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self._db is not None
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(self.model_id.encode("utf-8") + b"\0" + text.encode("utf-8")).digest()
+
+    def _remember(self, key: bytes, data: bytes):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = data
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, bytes]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                data = self._entries.get(key)
+                if data is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = data
+            missing = [key for key in keys if key not in found]
+            if missing and self._db is not None:
+                placeholders = ",".join("?" * len(missing))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing
+                ).fetchall()
+                for key, data in rows:
+                    found[key] = data
+                    self._remember(key, data)
+                self.disk_hits += len(rows)
+                if rows:
+                    self._clock += 1
+                    self._db.executemany(
+                        "UPDATE embeddings SET used = ? WHERE key = ?", [(self._clock, key) for key, _ in rows]
+                    )
+                    self._db.commit()
+        return found
+
+    def _trim(self):
+        """Drop the least recently used disk entries beyond max_disk_entries (caller holds the lock)"""
+        excess = self._disk_entries - self.max_disk_entries
+        if self.max_disk_entries <= 0 or excess <= 0:
+            return
+        deleted = self._db.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used LIMIT ?)", (excess,)
+        ).rowcount
+        self._disk_entries -= deleted
+        self.disk_evictions += deleted
+
+    def _store(self, items: List[Tuple[bytes, bytes]]):
+        with self._lock:
+            for key, data in items:
+                self._remember(key, data)
+            if self._db is not None:
+                self._clock += 1
+                before = self._db.total_changes
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, used) VALUES (?, ?, ?)",
+                    [(key, data, self._clock) for key, data in items],
+                )
+                # Only rows actually inserted count; a key stored meanwhile keeps its (identical) vector
+                self._disk_entries += self._db.total_changes - before
+                self._trim()
+                self._db.commit()
+
+    def embed(self, texts: List[str], embed: Callable[[List[str]], list]) -> List[List[float]]:
+        """Embeddings for texts, calling embed only for texts not cached (blocking)"""
+        if not self.enabled:
+            return [list(vector) for vector in embed(texts)]
+
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+
+        # Embed each distinct missing text once
+        pending: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                pending.setdefault(key, text)
+        with self._lock:
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        if pending:
+            vectors = embed(list(pending.values()))
+            computed = [(key, _pack(vector)) for key, vector in zip(pending, vectors)]
+            self._store(computed)
+            found.update(computed)
+        return [_unpack(found[key]) for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk": self.path,
+                "disk_entries": self._disk_entries,
+                "disk_max_entries": self.max_disk_entries,
+                "disk_evictions": self.disk_evictions,
+            }
+
+
+class ContentIndex:
+    """Content hash -> IDs holding that text, for duplicate detection (thread-safe)"""
+
+    def __init__(self):
+        self._ids: Dict[bytes, Set[str]] = {}
+        self._hashes: Dict[str, bytes] = {}
+        self.ready = False
+        self._lock = threading.Lock()
+        # IDs written while the initial load is running; the loader must not overwrite them
+        self._touched = set()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def _remove(self, doc_id: str):
+        digest = self._hashes.pop(doc_id, None)
+        if digest is None:
+            return
+        ids = self._ids[digest]
+        ids.discard(doc_id)
+        if not ids:
+            del self._ids[digest]
+
+    def _add(self, doc_id: str, digest: bytes):
+        self._remove(doc_id)
+        self._hashes[doc_id] = digest
+        self._ids.setdefault(digest, set()).add(doc_id)
+
+    def add(self, doc_id: str, text: str):
+        digest = content_hash(text)
+        with self._lock:
+            if not self.ready:
+                self._touched.add(doc_id)
+            self._add(doc_id, digest)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            if not self.ready:
+                self._touched.add(doc_id)
+            self._remove(doc_id)
+
+    def claim(self, doc_id: str, text: str) -> Optional[str]:
+        """Return an existing ID with the same text, or record doc_id as holding it"""
+        digest = content_hash(text)
+        with self._lock:
+            for existing in self._ids.get(digest, ()):
+                if existing != doc_id:
+                    return existing
+            if not self.ready:
+                self._touched.add(doc_id)
+            self._add(doc_id, digest)
+            return None
+
+    def load_through(self, documents: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """Initial bulk load that may run concurrently with add/remove/claim.
+
+        Yields each document after indexing it, so one scan of the
+        collection can also feed another index.
+        """
+        for doc_id, text in documents:
+            digest = content_hash(text)
+            with self._lock:
+                if doc_id not in self._touched:
+                    self._add(doc_id, digest)
+            yield doc_id, text
+        with self._lock:
+            self.ready = True
+            self._touched.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._hashes), "distinct": len(self._ids), "ready": self.ready}
@@ -0,0 +1,205 @@
+"""
+HNSW build/query configuration and recall-versus-latency tuning.
+
+Build parameters (M, construction_ef, batch size, sync threshold) only
+take effect when a collection is created. The query-time ``ef`` can be
+changed per request through ``SearchEfController``.
+"""
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Chroma's default when hnsw:search_ef is not set
+DEFAULT_SEARCH_EF = 10
+
+_ENV_PARAMS = {
+    "hnsw:M": "HNSW_M",
+    "hnsw:construction_ef": "HNSW_CONSTRUCTION_EF",
+    "hnsw:search_ef": "HNSW_SEARCH_EF",
+    "hnsw:num_threads": "HNSW_NUM_THREADS",
+    "hnsw:batch_size": "HNSW_BATCH_SIZE",
+    "hnsw:sync_threshold": "HNSW_SYNC_THRESHOLD",
+}
+
+
+def collection_metadata_from_env() -> Dict[str, object]:
+    """Collection metadata with the HNSW parameters configured in the environment"""
+    metadata: Dict[str, object] = {"hnsw:space": os.getenv("HNSW_SPACE", "cosine")}
+    for param, env in _ENV_PARAMS.items():
+        value = os.getenv(env)
+        if value:
+            metadata[param] = int(value)
+    return metadata
+
+
+def search_profiles_from_env() -> Dict[str, int]:
+    """Named query-time ef presets, e.g. HNSW_SEARCH_PROFILES=fast:16,balanced:64,accurate:256"""
+    raw = os.getenv("HNSW_SEARCH_PROFILES", "fast:16,balanced:64,accurate:256")
+    profiles = {}
+    for entry in filter(None, raw.split(",")):
+        name, _, ef = entry.strip().partition(":")
+        profiles[name] = int(ef)
+    return profiles
+
+
+def build_params(metadata: Optional[dict]) -> Dict[str, object]:
+    return {key: value for key, value in (metadata or {}).items() if key.startswith("hnsw:")}
+
+
+class SearchEfController:
+    """Applies a per-request ef to a collection's live HNSW index.
+
+    hnswlib keeps a single ef per index, so queries are grouped: any number
+    of queries with the same ef run concurrently, and a query wanting a
+    different ef waits until those have finished. This reaches into
+    Chroma's segment manager; if the internals are unavailable, queries
+    simply run with the collection's configured ef.
+    """
+
+    def __init__(self, client, default_ef: Optional[int] = None):
+        self.client = client
+        self._default_ef = default_ef
+        self._cond = threading.Condition()
+        self._active: Dict[str, int] = {}
+        self._current: Dict[str, int] = {}
+        self._warned = False
+
+    def _index(self, collection):
+        try:
+            from chromadb.segment import VectorReader
+            segment = self.client._server._manager.get_segment(collection.id, VectorReader)
+            return getattr(segment, "_index", None)
+        except Exception as e:
+            if not self._warned:
+                logger.warning(f"Per-request ef unavailable: {e}")
+                self._warned = True
+            return None
+
+    def default_ef(self, collection) -> int:
+        if self._default_ef:
+            return self._default_ef
+        return int((collection.metadata or {}).get("hnsw:search_ef", DEFAULT_SEARCH_EF))
+
+    @contextmanager
+    def use(self, collection, ef: Optional[int]):
+        """Run a query on collection with the given ef (None = collection default)"""
+        index = self._index(collection)
+        if index is None:
+            yield
+            return
+
+        ef = ef or self.default_ef(collection)
+        key = str(collection.id)
+        with self._cond:
+            while self._active.get(key) and self._current.get(key) != ef:
+                self._cond.wait()
+            if self._current.get(key) != ef:
+                index.set_ef(ef)
+                self._current[key] = ef
+            self._active[key] = self._active.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[key] -= 1
+                if not self._active[key]:
+                    self._cond.notify_all()
+
+
+def _normalize(np, vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _ground_truth(np, base, queries, k: int, space: str):
+    if space == "cosine":
+        scores = _normalize(np, queries) @ _normalize(np, base).T
+        return np.argsort(-scores, axis=1)[:, :k]
+    if space == "ip":
+        return np.argsort(-(queries @ base.T), axis=1)[:, :k]
+    distances = (
+        (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ base.T + (base ** 2).sum(axis=1)[None, :]
+    )
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def recall_latency_sweep(
+    vectors: list,
+    space: str,
+    k: int,
+    num_queries: int,
+    m_values: List[int],
+    construction_ef_values: List[int],
+    search_ef_values: List[int],
+    target_recall: float,
+    seed: int = 0,
+) -> dict:
+    """Measure recall@k and query latency over a parameter grid (blocking; run on the threadpool).
+
+    A sample of stored vectors is split into queries and a base set; each
+    grid point builds a fresh in-memory index over the base set and is
+    compared against brute-force ground truth. The live index is untouched.
+    """
+    if k < 1 or num_queries < 1:
+        raise ValueError("k and num_queries must be at least 1")
+
+    import hnswlib
+    import numpy as np
+
+    data = np.asarray(vectors, dtype=np.float32)
+    rng = random.Random(seed)
+    order = list(range(len(data)))
+    rng.shuffle(order)
+    num_queries = min(num_queries, len(data) // 2)
+    queries = data[order[:num_queries]]
+    base = data[order[num_queries:]]
+    k = min(k, len(base))
+    truth = _ground_truth(np, base, queries, k, space)
+
+    rows = []
+    for m, construction_ef in itertools.product(m_values, construction_ef_values):
+        index = hnswlib.Index(space=space, dim=base.shape[1])
+        index.init_index(max_elements=len(base), ef_construction=construction_ef, M=m)
+        build_start = time.perf_counter()
+        index.add_items(base, np.arange(len(base)))
+        build_seconds = time.perf_counter() - build_start
+
+        for search_ef in search_ef_values:
+            index.set_ef(max(search_ef, k))
+            latencies = []
+            hits = 0
+            for i in range(num_queries):
+                start = time.perf_counter()
+                labels, _ = index.knn_query(queries[i:i + 1], k=k)
+                latencies.append(time.perf_counter() - start)
+                hits += len(set(labels[0].tolist()) & set(truth[i].tolist()))
+            latencies.sort()
+            rows.append({
+                "M": m,
+                "construction_ef": construction_ef,
+                "search_ef": search_ef,
+                "recall": round(hits / (num_queries * k), 4),
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 4),
+                "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 4),
+                "build_seconds": round(build_seconds, 3),
+            })
+
+    meeting = [row for row in rows if row["recall"] >= target_recall]
+    recommended = min(meeting, key=lambda row: row["p50_ms"]) if meeting else None
+    return {
+        "space": space,
+        "k": k,
+        "base_size": len(base),
+        "queries": num_queries,
+        "target_recall": target_recall,
+        "results": rows,
+        "recommended": recommended,
+    }
@@ -0,0 +1,366 @@
+"""
+Durable asynchronous ingest jobs.
+
+``POST /ingest`` validates a batch of documents, writes it to a local
+SQLite queue and answers ``202 Accepted`` with a job ID, so a large
+upload no longer holds its connection through embedding and indexing.
+A pool of ``INGEST_WORKERS`` background tasks takes queued jobs in
+order and feeds each through the regular batch add path, ``chunk_size``
+documents at a time, recording progress after every chunk.
+
+The queue survives restarts: a job is on disk before its 202 is sent,
+and a job that was running when the process stopped is queued again
+and resumes after its last recorded chunk; the chunk it was in the
+middle of runs again. Finished jobs keep their
+status (not their documents) for ``INGEST_RETENTION_SECONDS``.
+
+Clients poll ``GET /ingest/{id}``, or long-poll with ``?wait=<seconds>``
+to be answered as soon as the job finishes.
+
+A queue file belongs to one server process: on start it takes over every
+job left running.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+# Chunk errors kept per job
+MAX_ERRORS = 10
+
+# How often idle workers purge expired jobs
+PURGE_INTERVAL = 300
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    owner TEXT NOT NULL,
+    state TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    errors TEXT NOT NULL DEFAULT '[]',
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, seq);
+CREATE TABLE IF NOT EXISTS job_documents (
+    job_seq INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    document TEXT NOT NULL,
+    PRIMARY KEY (job_seq, position)
+) WITHOUT ROWID;
+"""
+
+
+class IngestQueueFull(Exception):
+    """Accepting the job would put more documents in the queue than allowed"""
+
+
+class ChunkFailed(Exception):
+    """Some documents of a chunk failed and the rest were added"""
+
+    def __init__(self, failed: int, detail: str):
+        super().__init__(detail)
+        self.failed = failed
+        self.detail = detail
+
+
+class IngestJobs:
+    """SQLite-backed ingest queue and its worker pool.
+
+    process(documents) adds one chunk of stored documents (dicts) and
+    raises on failure; a failed chunk is recorded and the job moves on.
+    It raises ChunkFailed when only part of the chunk failed. A chunk
+    can be replayed after a crash, so process must skip documents it
+    already added.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        process: Callable[[List[dict]], Awaitable[None]],
+        workers: int = 2,
+        chunk_size: int = 256,
+        max_queued_documents: int = 1000000,
+        retention_seconds: float = 86400,
+    ):
+        self.path = path
+        self.process = process
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_queued_documents = max_queued_documents
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        # Loop-side state: worker wake-ups, long-poll waiters, cancellations of running jobs
+        self._wake: Optional[asyncio.Event] = None
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}
+        self._cancelling: set = set()
+        self._tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def from_env(cls, directory: str, process, chunk_size: int) -> "IngestJobs":
+        path = os.getenv("INGEST_QUEUE_PATH") or os.path.join(directory, "ingest_jobs.sqlite3")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return cls(
+            path,
+            process,
+            workers=int(os.getenv("INGEST_WORKERS", 2)),
+            chunk_size=min(chunk_size, int(os.getenv("INGEST_CHUNK_SIZE", chunk_size))),
+            max_queued_documents=int(os.getenv("INGEST_MAX_QUEUED_DOCUMENTS", 1000000)),
+            retention_seconds=float(os.getenv("INGEST_RETENTION_SECONDS", 86400)),
+        )
+
+    # Storage (blocking; run on the threadpool)
+
+    def _row(self, row) -> dict:
+        job_id, owner, state, total, processed, failed, errors, created_at, started_at, finished_at = row
+        return {
+            "id": job_id,
+            "owner": owner,
+            "state": state,
+            "total": total,
+            "processed": processed,
+            "failed": failed,
+            "percent": round(100.0 * processed / total, 1) if total else 100.0,
+            "errors": json.loads(errors),
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    def _select(self, where: str, args=()) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, owner, state, total, processed, failed, errors, created_at, started_at, finished_at "
+                f"FROM jobs {where}", args
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def get(self, job_id: str) -> Optional[dict]:
+        jobs = self._select("WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def recent(self, owner: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """Most recent jobs first, all owners' when owner is None"""
+        if owner is None:
+            return self._select("ORDER BY seq DESC LIMIT ?", (limit,))
+        return self._select("WHERE owner = ? ORDER BY seq DESC LIMIT ?", (owner, limit))
+
+    def _insert(self, owner: str, documents: List[dict]) -> dict:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            queued = self._db.execute(
+                "SELECT COALESCE(SUM(total - processed), 0) FROM jobs WHERE state IN ('queued', 'running')"
+            ).fetchone()[0]
+            if queued + len(documents) > self.max_queued_documents:
+                raise IngestQueueFull(f"{queued} documents are already queued (limit {self.max_queued_documents})")
+            with self._db:
+                seq = self._db.execute(
+                    "INSERT INTO jobs (id, owner, state, total, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                    (job_id, owner, len(documents), time.time())
+                ).lastrowid
+                self._db.executemany(
+                    "INSERT INTO job_documents (job_seq, position, document) VALUES (?, ?, ?)",
+                    ((seq, position, json.dumps(document)) for position, document in enumerate(documents))
+                )
+        return self.get(job_id)
+
+    def _claim(self) -> Optional[tuple]:
+        """Mark the oldest queued job running; returns (seq, id, processed)"""
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT seq, id, processed FROM jobs WHERE state = 'queued' ORDER BY seq LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE jobs SET state = 'running', started_at = COALESCE(started_at, ?) WHERE seq = ?",
+                    (time.time(), row[0])
+                )
+        return row
+
+    def _chunk(self, seq: int, position: int) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT document FROM job_documents WHERE job_seq = ? AND position >= ? ORDER BY position LIMIT ?",
+                (seq, position, self.chunk_size)
+            ).fetchall()
+        return [json.loads(document) for document, in rows]
+
+    def _progress(self, seq: int, processed: int, failed: int, error: Optional[str]):
+        with self._lock, self._db:
+            if error is not None:
+                errors = json.loads(self._db.execute("SELECT errors FROM jobs WHERE seq = ?", (seq,)).fetchone()[0])
+                if len(errors) < MAX_ERRORS:
+                    errors.append(error)
+                self._db.execute("UPDATE jobs SET errors = ? WHERE seq = ?", (json.dumps(errors), seq))
+            self._db.execute(
+                "UPDATE jobs SET processed = ?, failed = failed + ? WHERE seq = ?", (processed, failed, seq)
+            )
+
+    def _finish(self, seq: int, state: Optional[str] = None):
+        """Record the final state (succeeded or failed by the failure count when None) and drop the documents"""
+        with self._lock, self._db:
+            if state is None:
+                failed = self._db.execute("SELECT failed FROM jobs WHERE seq = ?", (seq,)).fetchone()[0]
+                state = "failed" if failed else "succeeded"
+            self._db.execute(
+                "UPDATE jobs SET state = ?, finished_at = ? WHERE seq = ?", (state, time.time(), seq)
+            )
+            self._db.execute("DELETE FROM job_documents WHERE job_seq = ?", (seq,))
+
+    def _cancel_queued(self, job_id: str) -> bool:
+        with self._lock, self._db:
+            row = self._db.execute("SELECT seq FROM jobs WHERE id = ? AND state = 'queued'", (job_id,)).fetchone()
+            if row is None:
+                return False
+            self._db.execute(
+                "UPDATE jobs SET state = 'cancelled', finished_at = ? WHERE seq = ?", (time.time(), row[0])
+            )
+            self._db.execute("DELETE FROM job_documents WHERE job_seq = ?", row)
+        return True
+
+    def _recover(self):
+        """Queue again the jobs a previous process left running; they resume after their last chunk"""
+        with self._lock, self._db:
+            resumed = self._db.execute("UPDATE jobs SET state = 'queued' WHERE state = 'running'").rowcount
+        if resumed:
+            logger.info(f"Resuming {resumed} interrupted ingest job(s)")
+
+    def _purge(self):
+        cutoff = time.time() - self.retention_seconds
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM jobs WHERE state IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?", (cutoff,)
+            )
+
+    # Loop side
+
+    async def start(self):
+        """Recover interrupted jobs and start the workers; call from the running loop at startup"""
+        self._wake = asyncio.Event()
+        await run_in_threadpool(self._recover)
+        await run_in_threadpool(self._purge)
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        self._wake.set()
+
+    async def submit(self, owner: str, documents: List[dict]) -> dict:
+        """Queue documents as one job once they are on disk; raises IngestQueueFull"""
+        job = await run_in_threadpool(self._insert, owner, documents)
+        if self._wake is not None:
+            self._wake.set()
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancel a queued job at once, or a running one after its current chunk"""
+        if not await run_in_threadpool(self._cancel_queued, job_id):
+            job = await run_in_threadpool(self.get, job_id)
+            if job is not None and job["state"] == "running":
+                self._cancelling.add(job_id)
+        else:
+            self._notify(job_id)
+        return await run_in_threadpool(self.get, job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """The job once it has finished, or as it stands after timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            # Registered before the read, so a job finishing in between still wakes this waiter
+            event = self._finished.setdefault(job_id, asyncio.Event())
+            self._waiters[job_id] = self._waiters.get(job_id, 0) + 1
+            try:
+                job = await run_in_threadpool(self.get, job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["state"] in FINISHED_STATES or remaining <= 0:
+                    return job
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                self._leave(job_id, event)
+
+    def _leave(self, job_id: str, event: asyncio.Event):
+        """Drop a waiter; the job's event goes with the last one, whether or not the job finished"""
+        self._waiters[job_id] -= 1
+        if not self._waiters[job_id]:
+            del self._waiters[job_id]
+            if self._finished.get(job_id) is event:
+                del self._finished[job_id]
+
+    def _notify(self, job_id: str):
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _work(self):
+        while True:
+            self._wake.clear()
+            try:
+                claimed = await run_in_threadpool(self._claim)
+                if claimed is None:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), PURGE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await run_in_threadpool(self._purge)
+                    continue
+                await self._run(*claimed)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The job stays running in the table and resumes on the next start
+                logger.exception("Ingest worker failed")
+                await asyncio.sleep(1)
+
+    async def _run(self, seq: int, job_id: str, processed: int):
+        while True:
+            if job_id in self._cancelling:
+                self._cancelling.discard(job_id)
+                await run_in_threadpool(self._finish, seq, "cancelled")
+                break
+            documents = await run_in_threadpool(self._chunk, seq, processed)
+            if not documents:
+                await run_in_threadpool(self._finish, seq)
+                break
+            failed, error = 0, None
+            try:
+                await self.process(documents)
+            except Exception as e:
+                failed = e.failed if isinstance(e, ChunkFailed) else len(documents)
+                detail = getattr(e, "detail", None) or str(e)
+                error = f"documents {processed}-{processed + len(documents) - 1}: {detail}"
+            processed += len(documents)
+            await run_in_threadpool(self._progress, seq, processed, failed, error)
+        self._notify(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            queued = self._db.execute(
+                "SELECT COALESCE(SUM(total - processed), 0) FROM jobs WHERE state IN ('queued', 'running')"
+            ).fetchone()[0]
+        return {
+            "workers": self.workers,
+            "chunk_size": self.chunk_size,
+            "jobs": counts,
+            "queued_documents": queued,
+            "max_queued_documents": self.max_queued_documents,
+        }
@@ -0,0 +1,213 @@
+"""
+Runtime instrumentation for /health and /stats.
+
+Tracks per-route latency over a sliding window, event-loop lag, process
+memory, threadpool saturation and registered cache hit rates.
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import anyio.to_thread
+from starlette.routing import Match
+
+try:
+    import psutil
+except ImportError:  # optional dependency
+    psutil = None
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RouteStats:
+    """Latency samples for one route over a sliding window"""
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+
+    def record(self, seconds: float, status: int):
+        self.samples.append(seconds)
+        self.count += 1
+        if status >= 500:
+            self.errors += 1
+
+    def summary(self) -> dict:
+        values = sorted(self.samples)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+            "max_ms": round((values[-1] if values else 0.0) * 1000, 3),
+        }
+
+
+class RouteLatencyRecorder:
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.routes: Dict[str, RouteStats] = {}
+
+    def record(self, route: str, seconds: float, status: int):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats(self.window)
+        stats.record(seconds, status)
+
+    def summary(self) -> Dict[str, dict]:
+        return {route: stats.summary() for route, stats in sorted(self.routes.items())}
+
+
+class InstrumentationMiddleware:
+    """ASGI middleware recording latency per route template"""
+
+    def __init__(self, app, routes: list, recorder: Optional[RouteLatencyRecorder] = None):
+        self.app = app
+        self.routes = routes
+        self.recorder = recorder or route_latency
+
+    def _route_name(self, scope) -> str:
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return f"{scope['method']} {route.path}"
+        return f"{scope['method']} <unmatched>"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.recorder.record(self._route_name(scope), time.perf_counter() - start, status)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a periodic timer"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last = 0.0
+        self.max_recent = 0.0
+        self.samples = deque(maxlen=120)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - start - self.interval)
+            self.samples.append(self.last)
+            self.max_recent = max(self.samples)
+
+    def summary(self) -> dict:
+        return {
+            "last_ms": round(self.last * 1000, 3),
+            "max_recent_ms": round(self.max_recent * 1000, 3),
+        }
+
+
+class CacheRegistry:
+    """Caches register a callable returning at least ``hits`` and ``misses``"""
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], dict]] = {}
+
+    def register(self, name: str, stats: Callable[[], dict]):
+        self._sources[name] = stats
+
+    def summary(self) -> Dict[str, dict]:
+        report = {}
+        for name, source in self._sources.items():
+            stats = dict(source())
+            total = stats.get("hits", 0) + stats.get("misses", 0)
+            stats["hit_rate"] = round(stats.get("hits", 0) / total, 4) if total else None
+            report[name] = stats
+        return report
+
+
+def process_rss_bytes() -> Optional[int]:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is a peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def directory_size(path: str) -> int:
+    """Total size of regular files under path (blocking; run on the threadpool)"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def threadpool_stats() -> dict:
+    """Saturation of the threadpool used by run_in_threadpool (call from the event loop)"""
+    stats = anyio.to_thread.current_default_thread_limiter().statistics()
+    return {
+        "busy": stats.borrowed_tokens,
+        "size": int(stats.total_tokens),
+        "queued": stats.tasks_waiting,
+    }
+
+
+route_latency = RouteLatencyRecorder(int(os.getenv("STATS_LATENCY_WINDOW", 1024)))
+loop_lag = LoopLagMonitor()
+caches = CacheRegistry()
+
+# /health reports "degraded" once the event loop falls this far behind
+HEALTH_MAX_LOOP_LAG = float(os.getenv("HEALTH_MAX_LOOP_LAG_MS", 500)) / 1000
+
+
+def runtime_stats() -> dict:
+    """Process-level statistics shared by every app"""
+    return {
+        "process_rss_bytes": process_rss_bytes(),
+        "event_loop_lag": loop_lag.summary(),
+        "threadpool": threadpool_stats(),
+        "caches": caches.summary(),
+        "routes": route_latency.summary(),
+    }
+
+
+def loop_is_lagging() -> bool:
+    return loop_lag.max_recent > HEALTH_MAX_LOOP_LAG
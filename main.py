@@ -1,14 +1,47 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Response, WebSocket
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import chromadb
 from chromadb.config import Settings
 import os
-from typing import Optional, List
+from typing import Optional, List, Sequence, Set, Union
+import bisect
 import uuid
+import json
+import random
+import asyncio
 import logging
 from dotenv import load_dotenv
 
+from admission import AdmissionController, AdmissionRejected, ApiKey, KeyRing
+from compression import CompressionMiddleware
+from instrumentation import (
+    InstrumentationMiddleware, caches, directory_size, loop_is_lagging, loop_lag, runtime_stats,
+)
+from backup import BackupManager, SnapshotInProgress, WriteGate
+from bm25 import BM25Index, reciprocal_rank_fusion
+from embedding import LocalOnnxEmbeddingFunction
+from embedding_cache import ContentIndex, EmbeddingCache
+from ingest_jobs import ChunkFailed, IngestJobs, IngestQueueFull
+from minhash_index import MinHashIndex
+from replica import Replica, WriterForwardingMiddleware, writer_stats
+from reindex import (
+    MODEL_PATH_KEY, ReindexInProgress, Reindexer, embedding_metadata, read_active_collection,
+    recorded_embedding_function,
+)
+from search_budget import Deadline, SearchBudget, SearchExecutor, SearchTimeout
+from hnsw_tuning import (
+    SearchEfController, build_params, collection_metadata_from_env, recall_latency_sweep,
+    search_profiles_from_env,
+)
+from tracing import TracingMiddleware, authorize_trace, stage, trace_log, traced
+from vectors import EmbeddingError, decode_embedding, encode_embedding
+from versioning import UNVERSIONED, DocumentVersions, etag, etag_matches
+from websocket_channel import Operation, WebSocketChannel
+from wire_format import JSON_TYPE, ExportEncoder, WireRoute, binary_response, negotiate_format, search_batch_table
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -18,22 +51,77 @@ logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(title="ChromaDB API", version="1.0.0")
+# JSON bodies may also be sent as MessagePack or Arrow (see wire_format.py)
+app.router.route_class = WireRoute
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(InstrumentationMiddleware, routes=app.routes)
+app.add_middleware(TracingMiddleware)
+
+@app.on_event("startup")
+async def start_instrumentation():
+    loop_lag.start()
 
 # Security scheme
 security = HTTPBearer()
 
+# ChromaDB persistence directory
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_store")
+
+# One writer owns CHROMA_PATH; read replicas serve a copy of its latest snapshot
+# and forward writes to it (see replica.py)
+SERVICE_ROLE = os.getenv("SERVICE_ROLE", "writer")
+if SERVICE_ROLE not in ("writer", "replica"):
+    raise ValueError("SERVICE_ROLE must be 'writer' or 'replica'")
+replica = Replica.from_env() if SERVICE_ROLE == "replica" else None
+if replica is not None:
+    CHROMA_PATH = replica.prepare()
+    # Outermost, so forwarded requests reach the writer byte for byte
+    app.add_middleware(WriterForwardingMiddleware, replica=replica)
+
+# Local embedding function (model, batch size, threads, sequence length); a rebuild
+# (POST /admin/reindex) moves the collection onto it when it differs from the stored vectors
+configured_embedding_function = LocalOnnxEmbeddingFunction()
+embedding_function = configured_embedding_function
+
+# Collection name; a rebuild serves a successor recorded in CHROMA_PATH/active_collection
+COLLECTION_NAME = "documents"
+
 # ChromaDB client with error handling
 try:
     chroma_client = chromadb.PersistentClient(
-        path="./chroma_store",
+        path=CHROMA_PATH,
         settings=Settings(anonymized_telemetry=False)
     )
     
-    # Get or create collection
-    collection = chroma_client.get_or_create_collection(
-        name="documents",
-        metadata={"hnsw:space": "cosine"}
-    )
+    # HNSW build parameters and the embedding model only apply when a collection is created
+    collection_metadata = collection_metadata_from_env()
+    try:
+        collection = chroma_client.get_collection(
+            name=read_active_collection(CHROMA_PATH, COLLECTION_NAME),
+            embedding_function=embedding_function
+        )
+        if MODEL_PATH_KEY not in (collection.metadata or {}):
+            # Collections from before models were recorded hold the configured model's vectors
+            collection.modify(metadata=dict(collection.metadata or {}, **embedding_metadata(embedding_function)))
+        embedding_function = recorded_embedding_function(collection.metadata, configured_embedding_function)
+        if embedding_function is not configured_embedding_function:
+            # Queries must be embedded like the stored vectors until a rebuild switches models
+            collection = chroma_client.get_collection(name=collection.name, embedding_function=embedding_function)
+            logger.warning(
+                f"Collection was built with {embedding_function.model_id}; configured "
+                f"{configured_embedding_function.model_id} applies after POST /admin/reindex"
+            )
+        if build_params(collection.metadata) != collection_metadata:
+            logger.warning(
+                f"Collection keeps its original HNSW parameters {build_params(collection.metadata)}; "
+                f"configured {collection_metadata} apply after POST /admin/reindex"
+            )
+    except ValueError:
+        collection = chroma_client.create_collection(
+            name=COLLECTION_NAME,
+            metadata=dict(collection_metadata, **embedding_metadata(embedding_function)),
+            embedding_function=embedding_function
+        )
     logger.info("ChromaDB initialized successfully")
 except Exception as e:
     logger.error(f"Failed to initialize ChromaDB: {e}")
@@ -41,79 +129,642 @@ except Exception as e:
     chroma_client = None
     collection = None
 
+# Query-time ef: per request, per named profile, or HNSW_SEARCH_EF / the collection default
+search_profiles = search_profiles_from_env()
+HNSW_SEARCH_EF = int(os.getenv("HNSW_SEARCH_EF", 0)) or None
+search_ef = SearchEfController(chroma_client, HNSW_SEARCH_EF)
+
+# Writes pass through the gate so a backup can pause them while it copies index files
+write_gate = WriteGate()
+backup_manager = BackupManager.from_env(CHROMA_PATH, write_gate)
+
+# The collection searches use and the model its vectors come from, swapped together by a rebuild
+serving = (collection, embedding_function)
+
+def activate_collection(new_collection, new_embedding_function):
+    """Serve a rebuilt collection (called by the reindexer with writes paused)"""
+    global collection, embedding_function, serving, embedding_dimension
+    embedding_cache.model_id = new_embedding_function.fingerprint()
+    if not os.getenv("EMBEDDING_DIMENSION"):
+        embedding_dimension = stored_embedding_dimension(new_collection)
+    collection, embedding_function = new_collection, new_embedding_function
+    serving = (new_collection, new_embedding_function)
+
+# Background rebuilds into a new collection, mirroring writes, copying throttled
+reindexer = Reindexer.from_env(chroma_client, CHROMA_PATH, write_gate, activate_collection, loop_is_lagging)
+
+# Lexical index for hybrid search, kept in step with every write
+bm25_index = BM25Index()
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 50))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+
+# Re-sent texts reuse their embedding instead of running the model again
+embedding_cache = EmbeddingCache.from_env(embedding_function.fingerprint())
+caches.register("embeddings", embedding_cache.stats)
+
+# Duplicate content on /add: off, reject (409) or alias (answer with the existing ID)
+DEDUP_MODE = os.getenv("DEDUP_MODE", "off")
+if DEDUP_MODE not in ("off", "reject", "alias"):
+    raise ValueError("DEDUP_MODE must be 'off', 'reject' or 'alias'")
+content_index = ContentIndex() if DEDUP_MODE != "off" else None
+
+# Current version of every document, for ETags and conditional reads
+document_versions = DocumentVersions(loading=True)
+
+# Near-duplicate detection (MinHash LSH), kept in step with every write when enabled
+NEAR_DUP_INDEX = os.getenv("NEAR_DUP_INDEX", "off") == "on"
+near_dup_index = MinHashIndex.from_env(loading=True) if NEAR_DUP_INDEX else None
+
 # Pydantic models
+# Embeddings are optional base64-encoded little-endian float32 vectors
+# (raw float32 bytes in MessagePack and Arrow bodies)
 class DocumentAdd(BaseModel):
     id: Optional[str] = None
     text: str
+    embedding: Optional[Union[str, bytes]] = None
 
 class DocumentUpdate(BaseModel):
     id: str
     text: str
+    embedding: Optional[Union[str, bytes]] = None
+
+class DocumentBatch(BaseModel):
+    documents: List[DocumentAdd]
+
+class SearchBatch(BaseModel):
+    queries: List[str]
+    limit: int = 10
+    ef: Optional[int] = None
+    profile: Optional[str] = None
+    include: Optional[List[str]] = None
+    max_distance: Optional[float] = None
+    timeout_ms: Optional[int] = None
+
+class TextSearch(BaseModel):
+    # GET /search parameters, as sent in a WebSocket frame
+    query: str
+    limit: int = 10
+    mode: str = "vector"
+    ef: Optional[int] = None
+    profile: Optional[str] = None
+    include: Optional[List[str]] = None
+    max_distance: Optional[float] = None
+    timeout_ms: Optional[int] = None
+
+class VectorSearch(BaseModel):
+    embedding: Union[str, bytes]
+    limit: int = 10
+    ef: Optional[int] = None
+    profile: Optional[str] = None
+    include: Optional[List[str]] = None
+    max_distance: Optional[float] = None
+    timeout_ms: Optional[int] = None
+
+class HnswSweepRequest(BaseModel):
+    sample_size: int = 2000
+    queries: int = 100
+    k: int = 10
+    m: List[int] = [8, 16, 32]
+    construction_ef: List[int] = [100, 200]
+    search_ef: List[int] = [10, 20, 40, 80, 160]
+    target_recall: float = 0.95
+
+class ReindexRequest(BaseModel):
+    # None: re-embed only when the configured model differs from the collection's
+    reembed: Optional[bool] = None
+    batch_size: Optional[int] = None
+    workers: Optional[int] = None
+    max_docs_per_second: Optional[float] = None
 
 class DocumentResponse(BaseModel):
     id: str
     text: str
 
-class SearchResponse(BaseModel):
+class VersionedDocument(BaseModel):
     id: str
     text: str
-    distance: float
+    version: int
+
+class KnownVersion(BaseModel):
+    id: str
+    # Version the caller holds; omitted when it has none
+    version: Optional[int] = None
+
+class MultiGet(BaseModel):
+    documents: List[KnownVersion]
+
+class MultiGetResponse(BaseModel):
+    # Documents whose version differs from the one sent
+    changed: List[VersionedDocument]
+    # Requested IDs that do not exist
+    missing: List[str]
 
-# API Key authentication
-def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    api_key = os.getenv("API_KEY")
-    if not api_key:
+class SearchResponse(BaseModel):
+    id: str
+    # Omitted when left out of the search's include list
+    text: Optional[str] = None
+    metadata: Optional[dict] = None
+    distance: Optional[float] = None
+    score: Optional[float] = None
+
+# Largest number of documents or queries accepted by the batch endpoints
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 256))
+
+# API keys and limits are loaded once at startup
+key_ring = KeyRing.from_env()
+admission = AdmissionController.from_env()
+search_budget = SearchBudget.from_env()
+
+# Chroma queries cannot stop midway; they run on their own threads and are abandoned past their deadline
+search_executor = SearchExecutor.from_env()
+
+# API Key authentication and admission control
+async def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if not key_ring.keys:
         raise HTTPException(status_code=500, detail="API_KEY not configured")
     
-    if credentials.credentials != api_key:
+    api_key = key_ring.authenticate(credentials.credentials)
+    if api_key is None:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
-    return credentials.credentials
+    try:
+        admission.admit(api_key)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+    
+    authorize_trace(api_key.has_scope("trace"))
+    try:
+        yield api_key
+    finally:
+        admission.release(api_key)
 
 # Check if ChromaDB is available
 def check_chromadb():
     if collection is None:
         raise HTTPException(status_code=503, detail="ChromaDB service unavailable")
 
+# Embedding dimension from EMBEDDING_DIMENSION, or learned from the stored vectors
+embedding_dimension = int(os.getenv("EMBEDDING_DIMENSION", 0)) or None
+
+def stored_embedding_dimension(source) -> Optional[int]:
+    """Dimension of a collection's vectors, None while it is empty (blocking)"""
+    sample = source.get(limit=1, include=["embeddings"])
+    return len(sample["embeddings"][0]) if sample["embeddings"] else None
+
+@app.on_event("startup")
+async def learn_embedding_dimension():
+    """Learn the dimension off the event loop; on an empty collection the first write sets it"""
+    global embedding_dimension
+    if collection is not None and embedding_dimension is None:
+        embedding_dimension = await run_in_threadpool(stored_embedding_dimension, collection)
+
+def get_embedding_dimension() -> Optional[int]:
+    """Dimension request embeddings must have (None accepts any); never touches the collection"""
+    return embedding_dimension
+
+def parse_embedding(value: Union[str, bytes, None]) -> Optional[List[float]]:
+    """Decode an optional request embedding, checking it against the collection dimension"""
+    if value is None:
+        return None
+    try:
+        return decode_embedding(value, get_embedding_dimension())
+    except EmbeddingError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid embedding: {e}")
+
+def require_scope(api_key: ApiKey, scope: str):
+    if not api_key.has_scope(scope):
+        raise HTTPException(status_code=403, detail=f"API key lacks the '{scope}' scope")
+
+def check_near_dup_index():
+    if near_dup_index is None:
+        raise HTTPException(status_code=501, detail="Near-duplicate detection is disabled (set NEAR_DUP_INDEX=on)")
+
+def check_threshold(threshold: Optional[float]):
+    if threshold is not None and not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="threshold must be in (0, 1]")
+
+def check_batch_size(size: int):
+    if not 1 <= size <= BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batches must hold between 1 and {BATCH_MAX_SIZE} items")
+
+def resolve_search_ef(ef: Optional[int], profile: Optional[str]) -> Optional[int]:
+    """Pick the query-time ef from an explicit value or a named profile"""
+    if ef is not None:
+        if not 1 <= ef <= 10000:
+            raise HTTPException(status_code=400, detail="ef must be between 1 and 10000")
+        return ef
+    if profile is not None:
+        if profile not in search_profiles:
+            raise HTTPException(status_code=400, detail=f"Unknown search profile: {profile}")
+        return search_profiles[profile]
+    return None
+
+# Fields a search can return; the id is always included
+SEARCH_FIELDS = ("ids", "distances", "text", "metadata")
+DEFAULT_SEARCH_FIELDS = {"ids", "distances", "text"}
+
+def parse_include(include: Union[str, List[str], None]) -> Set[str]:
+    """Search fields from a comma-separated string or a list"""
+    if include is None:
+        return set(DEFAULT_SEARCH_FIELDS)
+    if isinstance(include, str):
+        include = include.split(",")
+    fields = {field.strip() for field in include if field.strip()}
+    unknown = fields.difference(SEARCH_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown include field(s) {', '.join(sorted(unknown))}; expected {', '.join(SEARCH_FIELDS)}"
+        )
+    return fields | {"ids"}
+
+def stored_fields(fields: Set[str]) -> List[str]:
+    """Chroma fields to load for the hits of a search"""
+    return [name for field, name in (("text", "documents"), ("metadata", "metadatas")) if field in fields]
+
+def check_max_distance(max_distance: Optional[float]):
+    if max_distance is not None and max_distance < 0:
+        raise HTTPException(status_code=400, detail="max_distance cannot be negative")
+
+def check_timeout(timeout_ms: Optional[int]):
+    if timeout_ms is not None and timeout_ms <= 0:
+        raise HTTPException(status_code=400, detail="timeout_ms must be positive")
+
+def fill_embeddings(kwargs: dict, missing: List[int], model):
+    """Compute the embeddings of the documents at the missing positions with model"""
+    documents = kwargs["documents"]
+    embeddings = list(kwargs.get("embeddings") or [None] * len(documents))
+    for i, embedding in zip(missing, embedding_cache.embed([documents[i] for i in missing], model)):
+        embeddings[i] = embedding
+    kwargs["embeddings"] = embeddings
+
+def gated_write(operation: str, **kwargs):
+    """Apply a collection write: "add", "update", "upsert" or "delete" (blocking; run on the threadpool)"""
+    global embedding_dimension
+    # Embed before entering the gate so a backup pause never waits on the model;
+    # None entries (or no embeddings at all) are computed, precomputed ones are kept
+    documents = kwargs.get("documents")
+    embeddings = kwargs.get("embeddings") or [None] * len(documents or [])
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None] if documents is not None else []
+    model = embedding_function
+    if missing:
+        with stage("embed"):
+            fill_embeddings(kwargs, missing, model)
+    with stage("write"), write_gate.write():
+        # Resolved inside the gate, where a rebuild cannot switch collections or models
+        if missing and embedding_function is not model:
+            fill_embeddings(kwargs, missing, embedding_function)
+        result = getattr(collection, operation)(**kwargs)
+        reindexer.mirror(operation, kwargs, missing)
+        if embedding_dimension is None and kwargs.get("embeddings"):
+            embedding_dimension = len(kwargs["embeddings"][0])
+        return result
+
+def existing_ids(doc_ids: List[str]) -> List[str]:
+    """Which of doc_ids are stored (blocking)"""
+    # Looked up in pages so a large ingest job stays under SQLite's variable limit
+    return [
+        doc_id
+        for start in range(0, len(doc_ids), 1000)
+        for doc_id in collection.get(ids=doc_ids[start:start + 1000], include=[])["ids"]
+    ]
+
+def check_new_ids(existing: List[str]):
+    # Chroma ignores an add for a stored ID and reports success; nothing may index the unstored text
+    if existing:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Document {existing[0]} already exists; use /upsert or /update to replace it"
+        )
+
+def versioned_write(operation: str, **kwargs) -> List[int]:
+    """Apply a collection write that gives its documents new versions (blocking; run on the threadpool)"""
+    def apply(versions):
+        if operation == "add":
+            # Checked again under the IDs' locks: an add racing another write to the same ID must
+            # not record a version Chroma never stored
+            check_new_ids(existing_ids(kwargs["ids"]))
+        gated_write(operation, metadatas=[{"version": version} for version in versions], **kwargs)
+        return True
+    return document_versions.write(kwargs["ids"], apply)[1]
+
+def versioned_delete(doc_id: str):
+    """Delete a document and forget its version (blocking; run on the threadpool)"""
+    def apply():
+        gated_write("delete", ids=[doc_id])
+        return True
+    document_versions.delete(doc_id, apply)
+
+def stored_version(known: Optional[int], metadata: Optional[dict]) -> int:
+    """Version to report for a fetched document.
+
+    known must be read from the table before the fetch: a version read
+    after it could be newer than the text, and a cache would then keep
+    the old text forever.
+    """
+    if known is not None:
+        return known
+    return (metadata or {}).get("version", UNVERSIONED)
+
+def fetch_fields(ids: List[str], include: List[str]) -> dict:
+    """Stored fields ("documents", "metadatas") by ID (blocking; run on the threadpool)"""
+    with stage("fetch"):
+        page = collection.get(ids=ids, include=include)
+    return {
+        doc_id: {name: page[name][i] for name in include}
+        for i, doc_id in enumerate(page['ids'])
+    }
+
+def query_collection(
+    ef: Optional[int],
+    query_texts: Optional[List[str]] = None,
+    query_embeddings: Optional[List[List[float]]] = None,
+    n_results: int = 10,
+    include: Sequence[str] = ("documents",),
+    max_distance: Optional[float] = None,
+    deadline: Optional[Deadline] = None,
+):
+    """Embed, search the index and load the hits' stored fields as separate stages (blocking; run on the threadpool).
+
+    Only the Chroma fields in include are loaded, and hits farther than
+    max_distance are cut before anything is fetched. A deadline that has
+    passed once the queries are embedded skips the index search.
+    """
+    # One read of both, so a rebuild switching over never pairs a query with the other model
+    target, embed = serving
+    if query_embeddings is None:
+        with stage("embed"):
+            query_embeddings = embed(query_texts)
+    if deadline is not None and deadline.exceeded():
+        return empty_results(len(query_embeddings))
+    with stage("hnsw"), search_ef.use(target, ef):
+        results = target.query(query_embeddings=query_embeddings, n_results=n_results, include=["distances"])
+    if max_distance is not None:
+        for q, distances in enumerate(results['distances']):
+            # Distances come back sorted, nearest first
+            keep = bisect.bisect_right(distances, max_distance)
+            results['ids'][q] = results['ids'][q][:keep]
+            results['distances'][q] = distances[:keep]
+    if include:
+        hit_ids = list({doc_id for row in results['ids'] for doc_id in row})
+        stored = fetch_fields(hit_ids, list(include)) if hit_ids else {}
+        for name in include:
+            results[name] = []
+        for q, row in enumerate(results['ids']):
+            # Drop hits deleted between the index search and the fetch
+            hits = [(doc_id, distance) for doc_id, distance in zip(row, results['distances'][q]) if doc_id in stored]
+            results['ids'][q] = [doc_id for doc_id, _ in hits]
+            results['distances'][q] = [distance for _, distance in hits]
+            for name in include:
+                results[name].append([stored[doc_id][name] for doc_id, _ in hits])
+    return results
+
+def empty_results(queries: int) -> dict:
+    """A Chroma query result without hits"""
+    return {"ids": [[] for _ in range(queries)], "distances": [[] for _ in range(queries)]}
+
+async def run_search(deadline: Deadline, timed_out, fn, /, *args, **kwargs):
+    """Run search work on the search executor; returns timed_out and abandons the work if the deadline passes first"""
+    try:
+        return await search_executor.run(deadline, fn, *args, **kwargs)
+    except SearchTimeout:
+        return timed_out
+
+def iter_collection_pages(batch_size: int = 1000, include: Optional[List[str]] = None, source=None):
+    """Yield the whole collection (or source) as pages of collection.get results (blocking)"""
+    source = collection if source is None else source
+    # Snapshot the IDs first so concurrent deletes cannot shift an offset-based scan
+    ids = source.get(include=[])["ids"]
+    for start in range(0, len(ids), batch_size):
+        yield source.get(ids=ids[start:start + batch_size], include=include or ["documents"])
+
+def iter_collection_documents(batch_size: int = 1000, source=None):
+    """Yield every stored (id, text) pair (blocking)"""
+    for page in iter_collection_pages(batch_size, source=source):
+        yield from zip(page["ids"], page["documents"])
+
+def iter_collection_versions(batch_size: int = 1000, source=None):
+    """Yield every stored (id, version) pair (blocking)"""
+    for page in iter_collection_pages(batch_size, include=["metadatas"], source=source):
+        for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+            yield doc_id, (metadata or {}).get("version", UNVERSIONED)
+
+@app.on_event("startup")
+async def load_text_indexes():
+    """Build the in-memory text indexes from the collection without delaying startup"""
+    if collection is not None:
+        documents = iter_collection_documents()
+        if content_index is not None:
+            documents = content_index.load_through(documents)
+        if near_dup_index is not None:
+            documents = near_dup_index.load_through(documents)
+        asyncio.get_running_loop().run_in_executor(None, bm25_index.load, documents)
+        asyncio.get_running_loop().run_in_executor(None, document_versions.load, iter_collection_versions())
+
+def open_replica_copy(path: str):
+    """Serve a restored snapshot on a replica and return the client it replaces (blocking; called by the replica)"""
+    global chroma_client, CHROMA_PATH, search_ef, bm25_index, document_versions, near_dup_index
+    client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+    new_collection = client.get_collection(
+        name=read_active_collection(path, COLLECTION_NAME),
+        embedding_function=configured_embedding_function
+    )
+    new_embedding_function = recorded_embedding_function(new_collection.metadata, configured_embedding_function)
+    if new_embedding_function is not configured_embedding_function:
+        new_collection = client.get_collection(name=new_collection.name, embedding_function=new_embedding_function)
+
+    # The copy never changes, so its indexes are complete before it is served
+    new_bm25_index = BM25Index()
+    new_versions = DocumentVersions(loading=True)
+    new_near_dup_index = MinHashIndex.from_env(loading=True) if NEAR_DUP_INDEX else None
+    documents = iter_collection_documents(source=new_collection)
+    if new_near_dup_index is not None:
+        documents = new_near_dup_index.load_through(documents)
+    new_bm25_index.load(documents)
+    new_versions.load(iter_collection_versions(source=new_collection))
+
+    previous_client = chroma_client
+    chroma_client, CHROMA_PATH = client, path
+    search_ef = SearchEfController(client, HNSW_SEARCH_EF)
+    bm25_index, document_versions, near_dup_index = new_bm25_index, new_versions, new_near_dup_index
+    activate_collection(new_collection, new_embedding_function)
+    return previous_client
+
+@app.on_event("startup")
+async def start_replication():
+    """Scheduled snapshots on the writer, snapshot refreshes on a replica"""
+    if replica is not None:
+        replica.start(open_replica_copy)
+    else:
+        backup_manager.start_schedule()
+
+def format_search_results(results, query: int = 0, fields: Set[str] = DEFAULT_SEARCH_FIELDS) -> List[SearchResponse]:
+    """Convert one query of a Chroma result into response models with the requested fields"""
+    if not results['ids'][query]:
+        return []
+    
+    documents = results['documents'][query] if "text" in fields else None
+    metadatas = results['metadatas'][query] if "metadata" in fields else None
+    distances = results['distances'][query] if "distances" in fields else None
+    search_results = []
+    for i, doc_id in enumerate(results['ids'][query]):
+        search_results.append(SearchResponse(
+            id=doc_id,
+            text=documents[i] if documents is not None else None,
+            metadata=metadatas[i] if metadatas is not None else None,
+            distance=distances[i] if distances is not None else None
+        ))
+    
+    return search_results
+
 # CRUD Operations
 
 @app.post("/add", response_model=DocumentResponse)
 async def add_document(
     document: DocumentAdd,
-    api_key: str = Depends(verify_api_key)
+    api_key: ApiKey = Depends(verify_api_key)
 ):
     """Add a new document to the collection"""
+    require_scope(api_key, "write")
     check_chromadb()
+    embedding = parse_embedding(document.embedding)
     
     try:
         # Generate ID if not provided
         doc_id = document.id or str(uuid.uuid4())
+        if document.id:
+            check_new_ids(await run_in_threadpool(existing_ids, [doc_id]))
         
-        # Add document to ChromaDB
-        collection.add(
-            documents=[document.text],
-            ids=[doc_id]
-        )
+        if content_index is not None:
+            duplicate = content_index.claim(doc_id, document.text)
+            if duplicate is not None:
+                if DEDUP_MODE == "reject":
+                    raise HTTPException(status_code=409, detail=f"Duplicate of document {duplicate}")
+                return DocumentResponse(id=duplicate, text=document.text)
+        
+        # Add document to ChromaDB; precomputed embeddings skip the embedding function
+        try:
+            await run_in_threadpool(
+                versioned_write,
+                "add",
+                documents=[document.text],
+                ids=[doc_id],
+                embeddings=[embedding] if embedding else None
+            )
+        except Exception:
+            if content_index is not None:
+                content_index.remove(doc_id)
+            raise
+        await run_in_threadpool(bm25_index.add, doc_id, document.text)
+        if near_dup_index is not None:
+            await run_in_threadpool(near_dup_index.add, doc_id, document.text)
         
         return DocumentResponse(id=doc_id, text=document.text)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to add document: {str(e)}")
 
+@app.post("/add/batch", response_model=List[DocumentResponse])
+async def add_documents(
+    batch: DocumentBatch,
+    accept: Optional[str] = Header(None),
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Add many documents with one embedding call and one write; answers in JSON, MessagePack or Arrow"""
+    # Ingest workers pass no key; the scope was checked when the job was submitted
+    if api_key is not None:
+        require_scope(api_key, "write")
+    check_chromadb()
+    check_batch_size(len(batch.documents))
+    embeddings = [parse_embedding(document.embedding) for document in batch.documents]
+    
+    try:
+        # Generate IDs if not provided
+        doc_ids = [document.id or str(uuid.uuid4()) for document in batch.documents]
+        if len(set(doc_ids)) != len(doc_ids):
+            raise HTTPException(status_code=400, detail="Document IDs in a batch must be unique")
+        given = [document.id for document in batch.documents if document.id]
+        if given:
+            check_new_ids(await run_in_threadpool(existing_ids, given))
+        
+        responses = [DocumentResponse(id=doc_id, text=document.text) for doc_id, document in zip(doc_ids, batch.documents)]
+        pending = list(range(len(doc_ids)))
+        if content_index is not None:
+            claimed = []
+            pending = []
+            for i, (doc_id, document) in enumerate(zip(doc_ids, batch.documents)):
+                duplicate = content_index.claim(doc_id, document.text)
+                if duplicate is None:
+                    claimed.append(doc_id)
+                    pending.append(i)
+                elif DEDUP_MODE == "reject":
+                    for claimed_id in claimed:
+                        content_index.remove(claimed_id)
+                    raise HTTPException(status_code=409, detail=f"Document {i} is a duplicate of document {duplicate}")
+                else:
+                    responses[i] = DocumentResponse(id=duplicate, text=document.text)
+        
+        if pending:
+            try:
+                await run_in_threadpool(
+                    versioned_write,
+                    "add",
+                    documents=[batch.documents[i].text for i in pending],
+                    ids=[doc_ids[i] for i in pending],
+                    embeddings=[embeddings[i] for i in pending]
+                )
+            except Exception:
+                if content_index is not None:
+                    for i in pending:
+                        content_index.remove(doc_ids[i])
+                raise
+            await run_in_threadpool(
+                bm25_index.add_many, [(doc_ids[i], batch.documents[i].text) for i in pending]
+            )
+            if near_dup_index is not None:
+                await run_in_threadpool(
+                    near_dup_index.add_many, [(doc_ids[i], batch.documents[i].text) for i in pending]
+                )
+        
+        media_type = negotiate_format(accept)
+        if media_type != JSON_TYPE:
+            return binary_response(responses, media_type)
+        return responses
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to add documents: {str(e)}")
+
 @app.get("/get/{doc_id}", response_model=DocumentResponse)
 async def get_document(
     doc_id: str,
-    api_key: str = Depends(verify_api_key)
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    api_key: ApiKey = Depends(verify_api_key)
 ):
-    """Get a document by ID"""
+    """Get a document by ID; sends an ETag and answers a matching If-None-Match with 304"""
+    require_scope(api_key, "read")
     check_chromadb()
     
+    # A cache holding the current version is answered without reading the store
+    version = document_versions.get(doc_id)
+    if version is not None and etag_matches(if_none_match, version):
+        return Response(status_code=304, headers={"ETag": etag(version)})
+    
     try:
-        result = collection.get(ids=[doc_id])
+        result = collection.get(ids=[doc_id], include=["documents", "metadatas"])
         
         if not result['ids']:
             raise HTTPException(status_code=404, detail="Document not found")
         
+        version = stored_version(version, result['metadatas'][0])
+        if etag_matches(if_none_match, version):
+            return Response(status_code=304, headers={"ETag": etag(version)})
+        response.headers["ETag"] = etag(version)
+        
         return DocumentResponse(
             id=result['ids'][0],
             text=result['documents'][0]
@@ -124,13 +775,49 @@ async def get_document(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to get document: {str(e)}")
 
+@app.post("/get/batch", response_model=MultiGetResponse)
+async def get_changed_documents(
+    request: MultiGet,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Return only the documents whose version differs from the one the caller holds"""
+    require_scope(api_key, "read")
+    check_chromadb()
+    check_batch_size(len(request.documents))
+    
+    try:
+        # Unchanged documents are skipped without reading the store
+        held = {known.id: known.version for known in request.documents}
+        current = {doc_id: document_versions.get(doc_id) for doc_id in held}
+        stale = [doc_id for doc_id, version in held.items() if version is None or version != current[doc_id]]
+        if not stale:
+            return MultiGetResponse(changed=[], missing=[])
+        
+        result = await run_in_threadpool(collection.get, ids=stale, include=["documents", "metadatas"])
+        found = set(result['ids'])
+        changed = []
+        for doc_id, text, metadata in zip(result['ids'], result['documents'], result['metadatas']):
+            version = stored_version(current[doc_id], metadata)
+            # Checked again: the table may not know documents yet while it loads
+            if version != held.get(doc_id):
+                changed.append(VersionedDocument(id=doc_id, text=text, version=version))
+        
+        return MultiGetResponse(changed=changed, missing=[doc_id for doc_id in stale if doc_id not in found])
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to get documents: {str(e)}")
+
 @app.put("/update", response_model=DocumentResponse)
 async def update_document(
     document: DocumentUpdate,
-    api_key: str = Depends(verify_api_key)
+    api_key: ApiKey = Depends(verify_api_key)
 ):
     """Update an existing document"""
+    require_scope(api_key, "write")
     check_chromadb()
+    embedding = parse_embedding(document.embedding)
     
     try:
         # Check if document exists
@@ -138,11 +825,23 @@ async def update_document(
         if not existing['ids']:
             raise HTTPException(status_code=404, detail="Document not found")
         
+        # Unchanged text and no new vector: nothing to embed or write
+        if embedding is None and existing['documents'][0] == document.text:
+            return DocumentResponse(id=document.id, text=document.text)
+        
         # Update document
-        collection.update(
+        await run_in_threadpool(
+            versioned_write,
+            "update",
             documents=[document.text],
-            ids=[document.id]
+            ids=[document.id],
+            embeddings=[embedding] if embedding else None
         )
+        await run_in_threadpool(bm25_index.add, document.id, document.text)
+        if content_index is not None:
+            content_index.add(document.id, document.text)
+        if near_dup_index is not None:
+            await run_in_threadpool(near_dup_index.add, document.id, document.text)
         
         return DocumentResponse(id=document.id, text=document.text)
     
@@ -151,12 +850,42 @@ async def update_document(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to update document: {str(e)}")
 
+@app.post("/upsert", response_model=DocumentResponse)
+async def upsert_document(
+    document: DocumentUpdate,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Add a document, or replace it if the ID already exists"""
+    require_scope(api_key, "write")
+    check_chromadb()
+    embedding = parse_embedding(document.embedding)
+    
+    try:
+        await run_in_threadpool(
+            versioned_write,
+            "upsert",
+            documents=[document.text],
+            ids=[document.id],
+            embeddings=[embedding] if embedding else None
+        )
+        await run_in_threadpool(bm25_index.add, document.id, document.text)
+        if content_index is not None:
+            content_index.add(document.id, document.text)
+        if near_dup_index is not None:
+            await run_in_threadpool(near_dup_index.add, document.id, document.text)
+        
+        return DocumentResponse(id=document.id, text=document.text)
+    
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to upsert document: {str(e)}")
+
 @app.delete("/delete/{doc_id}")
 async def delete_document(
     doc_id: str,
-    api_key: str = Depends(verify_api_key)
+    api_key: ApiKey = Depends(verify_api_key)
 ):
     """Delete a document by ID"""
+    require_scope(api_key, "write")
     check_chromadb()
     
     try:
@@ -166,7 +895,12 @@ async def delete_document(
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Delete document
-        collection.delete(ids=[doc_id])
+        await run_in_threadpool(versioned_delete, doc_id)
+        await run_in_threadpool(bm25_index.remove, doc_id)
+        if content_index is not None:
+            content_index.remove(doc_id)
+        if near_dup_index is not None:
+            await run_in_threadpool(near_dup_index.remove, doc_id)
         
         return {"message": "Document deleted successfully", "id": doc_id}
     
@@ -175,48 +909,625 @@ async def delete_document(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to delete document: {str(e)}")
 
-@app.get("/search", response_model=List[SearchResponse])
+async def hybrid_search(
+    query: str,
+    limit: int,
+    ef: Optional[int],
+    deadline: Deadline,
+    fields: Set[str] = DEFAULT_SEARCH_FIELDS,
+    max_distance: Optional[float] = None,
+) -> List[SearchResponse]:
+    """Run the vector and BM25 legs concurrently and fuse them with reciprocal rank fusion.
+
+    max_distance only trims the vector leg; BM25 hits have no distance.
+    A leg still running at the deadline is dropped and the other one ranks alone.
+    """
+    depth = min(max(limit, HYBRID_CANDIDATES), 100)
+    vector, lexical = await asyncio.gather(
+        run_search(
+            deadline, empty_results(1),
+            query_collection, ef, query_texts=[query], n_results=depth, include=(), max_distance=max_distance,
+            deadline=deadline
+        ),
+        run_search(deadline, [], traced, "bm25", bm25_index.search, query, depth, deadline=deadline),
+    )
+    
+    with stage("fusion"):
+        distances = dict(zip(vector['ids'][0], vector['distances'][0]))
+        fused = reciprocal_rank_fusion(
+            [vector['ids'][0], [doc_id for doc_id, _ in lexical]], HYBRID_RRF_K
+        )[:limit]
+    
+    # Only the requested fields of the fused page are loaded
+    include = stored_fields(fields)
+    stored = await run_in_threadpool(fetch_fields, [doc_id for doc_id, _ in fused], include) if include else None
+    
+    return [
+        SearchResponse(
+            id=doc_id,
+            text=stored[doc_id].get("documents") if stored is not None else None,
+            metadata=stored[doc_id].get("metadatas") if stored is not None else None,
+            distance=distances.get(doc_id) if "distances" in fields else None,
+            score=score
+        )
+        for doc_id, score in fused if stored is None or doc_id in stored
+    ]
+
+@app.get("/search", response_model=List[SearchResponse], response_model_exclude_none=True)
 async def search_documents(
     query: str,
+    response: Response,
     limit: int = 10,
-    api_key: str = Depends(verify_api_key)
+    mode: str = "vector",
+    ef: Optional[int] = None,
+    profile: Optional[str] = None,
+    include: Optional[str] = None,
+    max_distance: Optional[float] = None,
+    timeout_ms: Optional[int] = None,
+    api_key: ApiKey = Depends(verify_api_key)
 ):
-    """Search documents using semantic similarity"""
+    """Search documents using semantic similarity, or hybrid BM25 + vector search with mode=hybrid.
+
+    include (comma-separated ids, distances, text, metadata) picks the
+    returned fields; unrequested ones are never loaded. Hits farther than
+    max_distance are dropped. Past timeout_ms the hits found so far (none
+    for a vector search) are returned with X-Search-Partial.
+    """
+    require_scope(api_key, "read")
     check_chromadb()
+    query_ef = resolve_search_ef(ef, profile)
+    fields = parse_include(include)
+    check_max_distance(max_distance)
+    check_timeout(timeout_ms)
+    if mode not in ("vector", "hybrid"):
+        raise HTTPException(status_code=400, detail="mode must be 'vector' or 'hybrid'")
+    deadline = search_budget.deadline(timeout_ms)
     
     try:
         if not query.strip():
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
-        # Perform semantic search
-        results = collection.query(
-            query_texts=[query],
-            n_results=min(limit, 100)  # Cap at 100 results
+        if mode == "hybrid":
+            hits = await hybrid_search(query, min(limit, 100), query_ef, deadline, fields, max_distance)
+        else:
+            # Perform semantic search
+            results = await run_search(
+                deadline,
+                empty_results(1),
+                query_collection,
+                query_ef,
+                query_texts=[query],
+                n_results=min(limit, 100),  # Cap at 100 results
+                include=stored_fields(fields),
+                max_distance=max_distance,
+                deadline=deadline
+            )
+            hits = format_search_results(results, 0, fields)
+        
+        search_budget.finish(deadline, response)
+        return hits
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Search failed: {str(e)}")
+
+@app.post("/search/vector", response_model=List[SearchResponse], response_model_exclude_none=True)
+async def search_by_vector(
+    search: VectorSearch,
+    response: Response,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Search documents with a precomputed query embedding"""
+    require_scope(api_key, "read")
+    check_chromadb()
+    embedding = parse_embedding(search.embedding)
+    query_ef = resolve_search_ef(search.ef, search.profile)
+    fields = parse_include(search.include)
+    check_max_distance(search.max_distance)
+    check_timeout(search.timeout_ms)
+    deadline = search_budget.deadline(search.timeout_ms)
+    
+    try:
+        results = await run_search(
+            deadline,
+            empty_results(1),
+            query_collection,
+            query_ef,
+            query_embeddings=[embedding],
+            n_results=min(search.limit, 100),  # Cap at 100 results
+            include=stored_fields(fields),
+            max_distance=search.max_distance,
+            deadline=deadline
         )
         
-        if not results['ids'][0]:
-            return []
+        search_budget.finish(deadline, response)
+        return format_search_results(results, 0, fields)
+    
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Search failed: {str(e)}")
+
+@app.post("/search/batch", response_model=List[List[SearchResponse]], response_model_exclude_none=True)
+async def search_batch(
+    batch: SearchBatch,
+    response: Response,
+    accept: Optional[str] = Header(None),
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Run several semantic searches with one embedding call and one index query; answers in JSON, MessagePack or Arrow"""
+    require_scope(api_key, "read")
+    check_chromadb()
+    check_batch_size(len(batch.queries))
+    query_ef = resolve_search_ef(batch.ef, batch.profile)
+    fields = parse_include(batch.include)
+    check_max_distance(batch.max_distance)
+    check_timeout(batch.timeout_ms)
+    deadline = search_budget.deadline(batch.timeout_ms)
+    
+    try:
+        if any(not query.strip() for query in batch.queries):
+            raise HTTPException(status_code=400, detail="Query cannot be empty")
         
-        # Format results
-        search_results = []
-        for i, doc_id in enumerate(results['ids'][0]):
-            search_results.append(SearchResponse(
-                id=doc_id,
-                text=results['documents'][0][i],
-                distance=results['distances'][0][i]
-            ))
+        results = await run_search(
+            deadline,
+            empty_results(len(batch.queries)),
+            query_collection,
+            query_ef,
+            query_texts=batch.queries,
+            n_results=min(batch.limit, 100),  # Cap at 100 results
+            include=stored_fields(fields),
+            max_distance=batch.max_distance,
+            deadline=deadline
+        )
         
-        return search_results
+        responses = [format_search_results(results, i, fields) for i in range(len(batch.queries))]
+        media_type = negotiate_format(accept)
+        if media_type != JSON_TYPE:
+            # A returned Response does not pick up headers set on the injected one
+            encoded = binary_response(responses, media_type, search_batch_table, exclude_none=True)
+            search_budget.finish(deadline, encoded)
+            return encoded
+        search_budget.finish(deadline, response)
+        return responses
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Search failed: {str(e)}")
 
+@app.get("/export")
+async def export_documents(
+    include_embeddings: bool = False,
+    accept: Optional[str] = Header(None),
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Stream every document as newline-delimited JSON, a MessagePack sequence or an Arrow stream"""
+    require_scope(api_key, "read")
+    check_chromadb()
+    include = ["documents", "embeddings"] if include_embeddings else ["documents"]
+    
+    media_type = negotiate_format(accept)
+    if media_type != JSON_TYPE:
+        def chunks():
+            encoder = ExportEncoder(media_type, include_embeddings)
+            for page in iter_collection_pages(include=include):
+                yield encoder.encode(page["ids"], page["documents"], page["embeddings"] if include_embeddings else None)
+            yield encoder.finish()
+        
+        return StreamingResponse(chunks(), media_type=media_type)
+    
+    def lines():
+        # Sync generator: Starlette iterates it on the threadpool, one page at a time
+        for page in iter_collection_pages(include=include):
+            chunk = []
+            for i, doc_id in enumerate(page["ids"]):
+                record = {"id": doc_id, "text": page["documents"][i]}
+                if include_embeddings:
+                    record["embedding"] = encode_embedding(page["embeddings"][i])
+                chunk.append(json.dumps(record) + "\n")
+            yield "".join(chunk)
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/duplicates/{doc_id}")
+async def get_near_duplicates(
+    doc_id: str,
+    threshold: Optional[float] = None,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Near-duplicates of a document by estimated Jaccard similarity of word shingles"""
+    require_scope(api_key, "read")
+    check_near_dup_index()
+    check_threshold(threshold)
+    
+    matches = await run_in_threadpool(near_dup_index.near_duplicates, doc_id, threshold)
+    if matches is None:
+        if not near_dup_index.ready:
+            raise HTTPException(status_code=503, detail="Near-duplicate index is still loading")
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return {
+        "id": doc_id,
+        "threshold": threshold or near_dup_index.threshold,
+        "duplicates": [{"id": match_id, "similarity": similarity} for match_id, similarity in matches],
+    }
+
+# Asynchronous ingest: queued jobs run through the batch add handler above, one chunk at a time
+
+async def ingest_chunk(documents: List[dict]):
+    """Add one chunk of a job, skipping documents already stored with the same text"""
+    # A chunk is replayed when the process stopped before its progress was recorded
+    stored = await run_in_threadpool(fetch_fields, [document["id"] for document in documents], ["documents"])
+    fresh = [document for document in documents if document["id"] not in stored]
+    if fresh:
+        # Admission was paid when the job was submitted; add_documents does not use the key
+        await add_documents(DocumentBatch(documents=[DocumentAdd(**document) for document in fresh]), None, None)
+    # IDs a live /add took after the job was submitted keep their text
+    taken = [
+        document["id"] for document in documents
+        if document["id"] in stored and stored[document["id"]]["documents"] != document["text"]
+    ]
+    if taken:
+        raise ChunkFailed(len(taken), f"Document {taken[0]} already exists with another text")
+
+# Jobs live with the writer; a replica forwards /ingest
+ingest_jobs = IngestJobs.from_env(CHROMA_PATH, ingest_chunk, BATCH_MAX_SIZE) if replica is None else None
+
+# Longest long-poll on a job, in seconds; below common proxy timeouts
+INGEST_MAX_WAIT = float(os.getenv("INGEST_MAX_WAIT", 60))
+
+@app.on_event("startup")
+async def start_ingest_workers():
+    if ingest_jobs is not None:
+        await ingest_jobs.start()
+
+async def owned_job(job_id: str, api_key: ApiKey, wait: float = 0) -> dict:
+    """A job visible to the key (its own, or any with the admin scope); 404 otherwise"""
+    # Ownership first: nobody long-polls a job they cannot see
+    job = await run_in_threadpool(ingest_jobs.get, job_id)
+    if job is None or (job["owner"] != api_key.name and not api_key.has_scope("admin")):
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    if wait > 0:
+        job = await ingest_jobs.wait(job_id, min(wait, INGEST_MAX_WAIT)) or job
+    return job
+
+@app.post("/ingest", status_code=202)
+async def submit_ingest_job(
+    batch: DocumentBatch,
+    response: Response,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Validate documents and queue them durably for a background add; answers 202 with the job to poll"""
+    require_scope(api_key, "write")
+    check_chromadb()
+    if not batch.documents:
+        raise HTTPException(status_code=400, detail="An ingest job needs at least one document")
+    embeddings = [parse_embedding(document.embedding) for document in batch.documents]
+    doc_ids = [document.id or str(uuid.uuid4()) for document in batch.documents]
+    if len(set(doc_ids)) != len(doc_ids):
+        raise HTTPException(status_code=400, detail="Document IDs in a job must be unique")
+    given = [document.id for document in batch.documents if document.id]
+    if given:
+        check_new_ids(await run_in_threadpool(existing_ids, given))
+    
+    documents = [
+        {
+            "id": doc_id,
+            "text": document.text,
+            # Stored as base64 whatever the request format
+            "embedding": encode_embedding(embedding) if embedding is not None else None,
+        }
+        for doc_id, document, embedding in zip(doc_ids, batch.documents, embeddings)
+    ]
+    try:
+        job = await ingest_jobs.submit(api_key.name, documents)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Ingest queue is full: {e}", headers={"Retry-After": "30"})
+    
+    response.headers["Location"] = f"/ingest/{job['id']}"
+    return {**job, "ids": doc_ids}
+
+@app.get("/ingest")
+async def list_ingest_jobs(limit: int = 100, api_key: ApiKey = Depends(verify_api_key)):
+    """Most recent ingest jobs first: the key's own, or everyone's with the admin scope"""
+    owner = None if api_key.has_scope("admin") else api_key.name
+    return await run_in_threadpool(ingest_jobs.recent, owner, min(max(limit, 1), 1000))
+
+@app.get("/ingest/{job_id}")
+async def get_ingest_job(job_id: str, wait: float = 0, api_key: ApiKey = Depends(verify_api_key)):
+    """Progress of an ingest job; with wait (seconds) answers as soon as it finishes"""
+    return await owned_job(job_id, api_key, wait)
+
+@app.delete("/ingest/{job_id}")
+async def cancel_ingest_job(job_id: str, api_key: ApiKey = Depends(verify_api_key)):
+    """Cancel a queued job, or a running one after its current chunk"""
+    require_scope(api_key, "write")
+    job = await owned_job(job_id, api_key)
+    if job["state"] not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Ingest job already {job['state']}")
+    return await ingest_jobs.cancel(job_id)
+
+# WebSocket channel: add, get and search frames run through the HTTP handlers above
+
+async def channel_get(known: KnownVersion, api_key: ApiKey, response: Response):
+    if_none_match = etag(known.version) if known.version is not None else None
+    return await get_document(known.id, response, if_none_match, api_key)
+
+async def channel_search(search: TextSearch, api_key: ApiKey, response: Response):
+    return await search_documents(
+        search.query, response, search.limit, search.mode, search.ef, search.profile, search.include,
+        search.max_distance, search.timeout_ms, api_key
+    )
+
+async def channel_search_batch(searches: List[TextSearch], api_key: ApiKey, response: Response):
+    first = searches[0]
+    batch = SearchBatch(
+        queries=[search.query for search in searches],
+        limit=first.limit,
+        ef=first.ef,
+        profile=first.profile,
+        include=first.include,
+        max_distance=first.max_distance,
+        timeout_ms=first.timeout_ms
+    )
+    return await search_batch(batch, response, None, api_key)
+
+def channel_search_key(search: TextSearch):
+    # Hybrid searches have no batch form; a batch shares one set of options
+    if search.mode != "vector":
+        return None
+    include = tuple(search.include) if search.include is not None else None
+    return (search.limit, search.ef, search.profile, include, search.max_distance, search.timeout_ms)
+
+channel_operations = {
+    "get": Operation(KnownVersion, channel_get),
+    "search": Operation(
+        TextSearch,
+        channel_search,
+        batch=channel_search_batch,
+        batch_key=channel_search_key,
+        exclude_none=True,
+    ),
+}
+if replica is None:
+    # A replica's channel is read-only; adds go to the writer over HTTP
+    channel_operations["add"] = Operation(
+        DocumentAdd,
+        lambda document, api_key, response: add_document(document, api_key),
+        batch=lambda documents, api_key, response: add_documents(DocumentBatch(documents=documents), None, api_key),
+    )
+channel = WebSocketChannel.from_env(key_ring, admission, channel_operations, BATCH_MAX_SIZE)
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """Multiplexed add, get and search frames over one authenticated connection"""
+    await channel.serve(websocket)
+
+# Administration
+
+@app.get("/admin/hnsw")
+async def get_hnsw_config(api_key: ApiKey = Depends(verify_api_key)):
+    """Current HNSW parameters and query-time ef profiles"""
+    require_scope(api_key, "admin")
+    check_chromadb()
+    
+    return {
+        "collection": collection.name,
+        "build_params": build_params(collection.metadata),
+        "configured_params": collection_metadata_from_env(),
+        "default_search_ef": search_ef.default_ef(collection),
+        "embedding_model": embedding_function.model_id,
+        "configured_embedding_model": configured_embedding_function.model_id,
+        "profiles": search_profiles,
+    }
+
+def sample_embeddings(size: int) -> list:
+    """A contiguous sample of stored embeddings starting at a random offset"""
+    count = collection.count()
+    offset = random.randint(0, max(0, count - size))
+    return collection.get(include=["embeddings"], limit=size, offset=offset)["embeddings"]
+
+@app.post("/admin/hnsw/sweep")
+async def hnsw_sweep(
+    request: HnswSweepRequest,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Measure recall@k versus latency over an HNSW parameter grid on a sample of the collection"""
+    require_scope(api_key, "admin")
+    check_chromadb()
+    
+    if not 2 <= request.sample_size <= 20000:
+        raise HTTPException(status_code=400, detail="sample_size must be between 2 and 20000")
+    if request.queries < 1 or request.k < 1:
+        raise HTTPException(status_code=400, detail="queries and k must be at least 1")
+    if len(request.m) * len(request.construction_ef) * len(request.search_ef) > 100:
+        raise HTTPException(status_code=400, detail="Parameter grid is limited to 100 combinations")
+    
+    try:
+        vectors = await run_in_threadpool(sample_embeddings, request.sample_size)
+        if len(vectors) < 2:
+            raise HTTPException(status_code=400, detail="Not enough documents to run a sweep")
+        
+        return await run_in_threadpool(
+            recall_latency_sweep,
+            vectors,
+            (collection.metadata or {}).get("hnsw:space", "l2"),
+            request.k,
+            request.queries,
+            request.m,
+            request.construction_ef,
+            request.search_ef,
+            request.target_recall,
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Sweep failed: {str(e)}")
+
+@app.post("/admin/backup", status_code=202)
+async def create_backup(
+    full: bool = False,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Start an online snapshot of the store (incremental unless full=true)"""
+    require_scope(api_key, "admin")
+    check_chromadb()
+    
+    try:
+        snapshot_id = backup_manager.start(full)
+    except SnapshotInProgress as e:
+        raise HTTPException(status_code=409, detail=f"Snapshot {e} is already running")
+    
+    return {"id": snapshot_id, "status": "running"}
+
+@app.get("/admin/backup")
+async def get_backups(api_key: ApiKey = Depends(verify_api_key)):
+    """Running snapshot, last error and completed snapshots"""
+    require_scope(api_key, "admin")
+    return await run_in_threadpool(backup_manager.status)
+
+@app.post("/admin/reindex", status_code=202)
+async def start_reindex(
+    request: Optional[ReindexRequest] = None,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Rebuild the collection with the configured model and HNSW parameters, then switch searches to it"""
+    require_scope(api_key, "admin")
+    check_chromadb()
+    request = request or ReindexRequest()
+    
+    if request.batch_size is not None and not 1 <= request.batch_size <= 5000:
+        raise HTTPException(status_code=400, detail="batch_size must be between 1 and 5000")
+    if request.workers is not None and not 1 <= request.workers <= 16:
+        raise HTTPException(status_code=400, detail="workers must be between 1 and 16")
+    if request.max_docs_per_second is not None and request.max_docs_per_second < 0:
+        raise HTTPException(status_code=400, detail="max_docs_per_second cannot be negative")
+    
+    try:
+        job_id = await run_in_threadpool(
+            reindexer.start,
+            collection,
+            embedding_function,
+            configured_embedding_function,
+            collection_metadata_from_env(),
+            COLLECTION_NAME,
+            request.reembed,
+            request.batch_size,
+            request.workers,
+            request.max_docs_per_second,
+        )
+    except ReindexInProgress as e:
+        raise HTTPException(status_code=409, detail=f"Rebuild {e} is already running")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to start rebuild: {str(e)}")
+    
+    return {"id": job_id, "status": "running"}
+
+@app.get("/admin/reindex")
+async def get_reindex_status(api_key: ApiKey = Depends(verify_api_key)):
+    """Progress and ETA of the running rebuild, and the outcome of the last one"""
+    require_scope(api_key, "admin")
+    return reindexer.status()
+
+@app.delete("/admin/reindex")
+async def cancel_reindex(api_key: ApiKey = Depends(verify_api_key)):
+    """Stop the running rebuild and drop its unfinished collection"""
+    require_scope(api_key, "admin")
+    job_id = reindexer.cancel()
+    if job_id is None:
+        raise HTTPException(status_code=404, detail="No rebuild is running")
+    return {"id": job_id, "status": "cancelling"}
+
+@app.get("/admin/duplicates")
+async def get_duplicate_clusters(
+    threshold: Optional[float] = None,
+    min_size: int = 2,
+    limit: int = 100,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Groups of near-duplicate documents, largest first"""
+    require_scope(api_key, "admin")
+    check_near_dup_index()
+    check_threshold(threshold)
+    
+    clusters = await run_in_threadpool(near_dup_index.clusters, threshold, max(2, min_size))
+    return {
+        "threshold": threshold or near_dup_index.threshold,
+        "ready": near_dup_index.ready,
+        "clusters": len(clusters),
+        "duplicates": sum(len(ids) - 1 for ids in clusters),
+        "groups": clusters[:limit],
+    }
+
+@app.get("/admin/traces")
+async def get_traces(api_key: ApiKey = Depends(verify_api_key)):
+    """Slow request log and the IDs of captured profiles"""
+    require_scope(api_key, "admin")
+    return trace_log.summary()
+
+@app.get("/admin/traces/{trace_id}")
+async def get_trace(
+    trace_id: str,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Stage timings and sampled stacks of a request traced with X-Trace: profile"""
+    require_scope(api_key, "trace")
+    trace = trace_log.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+def chroma_store_sizes():
+    """On-disk footprint of the store, split into SQLite and HNSW segment files"""
+    total_bytes = directory_size(CHROMA_PATH)
+    sqlite_bytes = 0
+    if os.path.isdir(CHROMA_PATH):
+        for name in os.listdir(CHROMA_PATH):
+            if name.startswith("chroma.sqlite3"):
+                sqlite_bytes += os.path.getsize(os.path.join(CHROMA_PATH, name))
+    return {
+        "total_bytes": total_bytes,
+        "sqlite_bytes": sqlite_bytes,
+        "index_bytes": total_bytes - sqlite_bytes,
+    }
+
+@app.get("/stats")
+async def get_stats(api_key: ApiKey = Depends(verify_api_key)):
+    """Capacity, latency and resource statistics"""
+    # Still answered when Chroma failed to initialize; only the collection count is skipped
+    document_count = await run_in_threadpool(collection.count) if collection is not None else None
+    storage = await run_in_threadpool(chroma_store_sizes)
+    
+    return {
+        "service": "ChromaDB API",
+        "chromadb": "available" if collection is not None else "unavailable",
+        "documents": document_count,
+        "storage": storage,
+        "embedding": embedding_function.config.describe(),
+        "bm25": bm25_index.stats(),
+        "dedup": {"mode": DEDUP_MODE, **content_index.stats()} if content_index is not None else {"mode": DEDUP_MODE},
+        "near_duplicates": near_dup_index.stats() if near_dup_index is not None else None,
+        "versions": document_versions.stats(),
+        "websocket": channel.stats(),
+        "ingest": await run_in_threadpool(ingest_jobs.stats) if ingest_jobs is not None else None,
+        "replication": replica.stats() if replica is not None else await run_in_threadpool(
+            writer_stats, backup_manager.backup_dir, backup_manager.interval
+        ),
+        "search_budget": {**search_budget.stats(), "executor": search_executor.stats()},
+        "admission": admission.snapshot(),
+        **runtime_stats(),
+    }
+
 @app.get("/health")
-async def health_check():
+async def health_check(response: Response):
     """Health check endpoint (no auth required)"""
-    return {"status": "healthy", "service": "ChromaDB API"}
+    if collection is None:
+        response.status_code = 503
+        return {"status": "unavailable", "service": "ChromaDB API", "detail": "ChromaDB failed to initialize"}
+    
+    status = "degraded" if loop_is_lagging() or replica is not None and replica.lagging() else "healthy"
+    return {"status": status, "service": "ChromaDB API"}
 
 if __name__ == "__main__":
     import uvicorn
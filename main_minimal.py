@@ -1,23 +1,58 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import os
-from typing import Optional, List
+from typing import Optional, List, Set, Tuple, Union
 import uuid
+import json
+import math
+import heapq
 import logging
 
+from admission import AdmissionController, AdmissionRejected, ApiKey, KeyRing
+from compression import CompressionMiddleware
+from minhash_index import MinHashIndex
+from search_budget import Deadline, SearchBudget
+from sharded_store import ShardedDocumentStore
+from trigram_index import TrigramIndex
+from versioning import UNVERSIONED, DocumentVersions, etag, etag_matches
+from websocket_channel import Operation, WebSocketChannel
+from wire_format import JSON_TYPE, ExportEncoder, WireRoute, binary_response, negotiate_format, search_batch_table
+from instrumentation import (
+    InstrumentationMiddleware, loop_is_lagging, loop_lag, runtime_stats,
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(title="ChromaDB API", version="1.0.0")
+# JSON bodies may also be sent as MessagePack or Arrow (see wire_format.py)
+app.router.route_class = WireRoute
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(InstrumentationMiddleware, routes=app.routes)
+
+@app.on_event("startup")
+async def start_instrumentation():
+    loop_lag.start()
 
 # Security scheme
 security = HTTPBearer()
 
-# Simple in-memory storage for testing
-documents_storage = {}
+# Lock-sharded compact storage (dict-like, id -> text), safe to use from threadpool handlers
+documents_storage = ShardedDocumentStore.from_env()
+
+# Current version of every document, for ETags and conditional reads
+document_versions = DocumentVersions()
+
+# Near-duplicate detection (MinHash LSH), kept in step with every write when enabled
+near_dup_index = MinHashIndex.from_env() if os.getenv("NEAR_DUP_INDEX", "off") == "on" else None
+
+# Trigram posting lists for indexed substring search and fuzzy search, kept in step with every write when enabled
+trigram_index = TrigramIndex.from_env() if os.getenv("TRIGRAM_INDEX", "off") == "on" else None
 
 # Pydantic models
 class DocumentAdd(BaseModel):
@@ -32,75 +67,378 @@ class DocumentResponse(BaseModel):
     id: str
     text: str
 
-class SearchResponse(BaseModel):
+class VersionedDocument(BaseModel):
     id: str
     text: str
-    distance: float
+    version: int
+
+class KnownVersion(BaseModel):
+    id: str
+    # Version the caller holds; omitted when it has none
+    version: Optional[int] = None
+
+class MultiGet(BaseModel):
+    documents: List[KnownVersion]
+
+class MultiGetResponse(BaseModel):
+    # Documents whose version differs from the one sent
+    changed: List[VersionedDocument]
+    # Requested IDs that do not exist
+    missing: List[str]
+
+class SearchResponse(BaseModel):
+    id: str
+    # Omitted when left out of the search's include list
+    text: Optional[str] = None
+    distance: Optional[float] = None
 
-# API Key authentication
-def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    api_key = os.getenv("API_KEY")
-    if not api_key:
+class DocumentBatch(BaseModel):
+    documents: List[DocumentAdd]
+
+class TextSearch(BaseModel):
+    # GET /search parameters, as sent in a WebSocket frame
+    query: str
+    limit: int = 10
+    include: Optional[List[str]] = None
+    max_distance: Optional[float] = None
+    mode: str = "substring"
+    timeout_ms: Optional[int] = None
+
+class SearchBatch(BaseModel):
+    queries: List[str]
+    limit: int = 10
+    include: Optional[List[str]] = None
+    max_distance: Optional[float] = None
+    mode: str = "substring"
+    timeout_ms: Optional[int] = None
+
+# Largest number of documents or queries accepted by the batch endpoints
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 256))
+
+# API keys and limits are loaded once at startup
+key_ring = KeyRing.from_env()
+admission = AdmissionController.from_env()
+search_budget = SearchBudget.from_env()
+
+# API Key authentication and admission control
+async def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if not key_ring.keys:
         raise HTTPException(status_code=500, detail="API_KEY not configured")
     
-    if credentials.credentials != api_key:
+    api_key = key_ring.authenticate(credentials.credentials)
+    if api_key is None:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
-    return credentials.credentials
+    try:
+        admission.admit(api_key)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+    
+    try:
+        yield api_key
+    finally:
+        admission.release(api_key)
+
+def require_scope(api_key: ApiKey, scope: str):
+    if not api_key.has_scope(scope):
+        raise HTTPException(status_code=403, detail=f"API key lacks the '{scope}' scope")
+
+def versioned_put(items: List[Tuple[str, str]]) -> List[int]:
+    """Store documents under new versions (blocking; run on the threadpool)"""
+    def apply(versions):
+        documents_storage.put_many(items)
+        return True
+    return document_versions.write([doc_id for doc_id, _ in items], apply)[1]
+
+def versioned_replace(doc_id: str, text: str) -> bool:
+    """Replace an existing document under a new version (blocking; run on the threadpool)"""
+    return document_versions.write([doc_id], lambda versions: documents_storage.replace(doc_id, text))[0]
+
+def versioned_pop(doc_id: str) -> bool:
+    """Delete a document and forget its version (blocking; run on the threadpool)"""
+    return document_versions.delete(doc_id, lambda: documents_storage.pop(doc_id, None) is not None)
+
+def check_near_dup_index():
+    if near_dup_index is None:
+        raise HTTPException(status_code=501, detail="Near-duplicate detection is disabled (set NEAR_DUP_INDEX=on)")
+
+# Text search modes; fuzzy needs the trigram index
+SEARCH_MODES = ("substring", "fuzzy")
+
+def check_search_mode(mode: str):
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown search mode {mode}; expected {', '.join(SEARCH_MODES)}")
+    if mode == "fuzzy" and trigram_index is None:
+        raise HTTPException(status_code=501, detail="Fuzzy search needs the trigram index (set TRIGRAM_INDEX=on)")
+
+def check_threshold(threshold: Optional[float]):
+    if threshold is not None and not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="threshold must be in (0, 1]")
+
+def check_batch_size(size: int):
+    if not 1 <= size <= BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batches must hold between 1 and {BATCH_MAX_SIZE} items")
+
+# Fields a search can return; the id is always included
+SEARCH_FIELDS = ("ids", "distances", "text")
+
+def parse_include(include: Union[str, List[str], None]) -> Set[str]:
+    """Search fields from a comma-separated string or a list"""
+    if include is None:
+        return set(SEARCH_FIELDS)
+    if isinstance(include, str):
+        include = include.split(",")
+    fields = {field.strip() for field in include if field.strip()}
+    unknown = fields.difference(SEARCH_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown include field(s) {', '.join(sorted(unknown))}; expected {', '.join(SEARCH_FIELDS)}"
+        )
+    return fields | {"ids"}
+
+def check_max_distance(max_distance: Optional[float]):
+    if max_distance is not None and max_distance < 0:
+        raise HTTPException(status_code=400, detail="max_distance cannot be negative")
+
+def check_timeout(timeout_ms: Optional[int]):
+    if timeout_ms is not None and timeout_ms <= 0:
+        raise HTTPException(status_code=400, detail="timeout_ms must be positive")
+
+# Documents scanned or candidates verified between deadline checks
+DEADLINE_CHECK_INTERVAL = 256
+
+def search_response(doc_id: str, text: Optional[str], distance: float, fields: Set[str]) -> SearchResponse:
+    return SearchResponse(
+        id=doc_id,
+        text=text if "text" in fields else None,
+        distance=distance if "distances" in fields else None
+    )
+
+def min_match_count(max_distance: Optional[float]) -> Optional[int]:
+    """Fewest occurrences of the query a text needs to be within max_distance; None if no text can be"""
+    if max_distance is None:
+        return 1
+    if max_distance <= 0:
+        # Every match has a positive distance
+        return None
+    # distance = 1 / (count + 1) <= max_distance  <=>  count >= 1 / max_distance - 1
+    return max(1, math.ceil(1.0 / max_distance - 1 - 1e-9))
+
+def scan_matches(
+    queries_lower: List[str], limit: int, max_distance: Optional[float] = None, deadline: Optional[Deadline] = None
+) -> List[list]:
+    """Best (distance, id, text) substring matches per query, from one pass over all shards (blocking; run on the threadpool).
+
+    max_distance is turned into a minimum match count, so texts too short
+    to reach it are skipped without being lowercased or counted. Shards
+    stop scanning once the deadline passes, keeping what they found.
+    """
+    min_count = min_match_count(max_distance)
+    if min_count is None:
+        return [[] for _ in queries_lower]
+    min_length = min_count * min(len(query_lower) for query_lower in queries_lower)
+    
+    def match_shard(items):
+        matches = [[] for _ in queries_lower]
+        for scanned, (doc_id, text) in enumerate(items):
+            if scanned % DEADLINE_CHECK_INTERVAL == 0 and deadline is not None and deadline.exceeded():
+                break
+            if len(text) < min_length:
+                continue
+            text_lower = text.lower()
+            for q, query_lower in enumerate(queries_lower):
+                match_count = text_lower.count(query_lower)
+                if match_count >= min_count:
+                    # Simple distance calculation (inverse of match count); lower = better match
+                    matches[q].append((1.0 / (match_count + 1), doc_id, text))
+        return [heapq.nsmallest(limit, query_matches, key=lambda match: match[0]) for query_matches in matches]
+    
+    shard_matches = documents_storage.scan(match_shard)
+    return [
+        heapq.nsmallest(limit, (m for matches in shard_matches for m in matches[q]), key=lambda match: match[0])
+        for q in range(len(queries_lower))
+    ]
+
+def index_matches(query_lower: str, limit: int, min_count: int, deadline: Optional[Deadline] = None) -> Optional[list]:
+    """Best substring matches among the trigram index's candidates; None when the index cannot narrow the query"""
+    candidates = trigram_index.candidates(query_lower)
+    if candidates is None:
+        return None
+    matches = []
+    for start in range(0, len(candidates), DEADLINE_CHECK_INTERVAL):
+        if deadline is not None and deadline.exceeded():
+            break
+        for doc_id, text in documents_storage.get_many(candidates[start:start + DEADLINE_CHECK_INTERVAL]).items():
+            # Candidates hold every trigram of the query; only a real count confirms the match
+            match_count = text.lower().count(query_lower)
+            if match_count >= min_count:
+                matches.append((1.0 / (match_count + 1), doc_id, text))
+    return heapq.nsmallest(limit, matches, key=lambda match: match[0])
+
+def search_matches(
+    queries_lower: List[str], limit: int, max_distance: Optional[float] = None, deadline: Optional[Deadline] = None
+) -> List[list]:
+    """Best substring matches per query: from the trigram index where it narrows the query, one scan for the rest (blocking; run on the threadpool)"""
+    min_count = min_match_count(max_distance)
+    if min_count is None:
+        return [[] for _ in queries_lower]
+    matches = [
+        index_matches(query_lower, limit, min_count, deadline) if trigram_index is not None else None
+        for query_lower in queries_lower
+    ]
+    unindexed = [q for q, query_matches in enumerate(matches) if query_matches is None]
+    if unindexed:
+        scanned = scan_matches([queries_lower[q] for q in unindexed], limit, max_distance, deadline)
+        for q, query_matches in zip(unindexed, scanned):
+            matches[q] = query_matches
+    return matches
+
+def fuzzy_matches(
+    queries_lower: List[str], limit: int, max_distance: Optional[float] = None, deadline: Optional[Deadline] = None
+) -> List[list]:
+    """Best (distance, id, text) matches per query by trigram similarity, distance = 1 - similarity (blocking; run on the threadpool)"""
+    min_similarity = 1.0 - max_distance if max_distance is not None else None
+    matches = []
+    for query_lower in queries_lower:
+        if deadline is not None and deadline.exceeded():
+            matches.append([])
+            continue
+        hits = trigram_index.fuzzy(query_lower, limit, min_similarity, deadline)
+        texts = documents_storage.get_many([doc_id for _, doc_id in hits])
+        matches.append([
+            (1.0 - similarity, doc_id, texts[doc_id]) for similarity, doc_id in hits if doc_id in texts
+        ])
+    return matches
 
 # CRUD Operations
 
 @app.post("/add", response_model=DocumentResponse)
 async def add_document(
     document: DocumentAdd,
-    api_key: str = Depends(verify_api_key)
+    api_key: ApiKey = Depends(verify_api_key)
 ):
     """Add a new document to the collection"""
+    require_scope(api_key, "write")
     try:
         # Generate ID if not provided
         doc_id = document.id or str(uuid.uuid4())
         
         # Add document to storage
-        documents_storage[doc_id] = document.text
+        await run_in_threadpool(versioned_put, [(doc_id, document.text)])
+        if near_dup_index is not None:
+            await run_in_threadpool(near_dup_index.add, doc_id, document.text)
+        if trigram_index is not None:
+            await run_in_threadpool(trigram_index.add, doc_id, document.text)
         
         return DocumentResponse(id=doc_id, text=document.text)
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to add document: {str(e)}")
 
+@app.post("/add/batch", response_model=List[DocumentResponse])
+async def add_documents(
+    batch: DocumentBatch,
+    accept: Optional[str] = Header(None),
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Add many documents in one request; answers in JSON, MessagePack or Arrow"""
+    require_scope(api_key, "write")
+    check_batch_size(len(batch.documents))
+    try:
+        # Generate IDs if not provided
+        doc_ids = [document.id or str(uuid.uuid4()) for document in batch.documents]
+        
+        # Add documents to storage
+        await run_in_threadpool(
+            versioned_put,
+            [(doc_id, document.text) for doc_id, document in zip(doc_ids, batch.documents)]
+        )
+        if near_dup_index is not None:
+            await run_in_threadpool(
+                near_dup_index.add_many, [(doc_id, document.text) for doc_id, document in zip(doc_ids, batch.documents)]
+            )
+        if trigram_index is not None:
+            await run_in_threadpool(
+                trigram_index.add_many, [(doc_id, document.text) for doc_id, document in zip(doc_ids, batch.documents)]
+            )
+        
+        responses = [DocumentResponse(id=doc_id, text=document.text) for doc_id, document in zip(doc_ids, batch.documents)]
+        media_type = negotiate_format(accept)
+        if media_type != JSON_TYPE:
+            return binary_response(responses, media_type)
+        return responses
+    
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to add documents: {str(e)}")
+
 @app.get("/get/{doc_id}", response_model=DocumentResponse)
 async def get_document(
     doc_id: str,
-    api_key: str = Depends(verify_api_key)
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    api_key: ApiKey = Depends(verify_api_key)
 ):
-    """Get a document by ID"""
+    """Get a document by ID; sends an ETag and answers a matching If-None-Match with 304"""
+    require_scope(api_key, "read")
     try:
-        if doc_id not in documents_storage:
+        # Read before the text: a newer version must never be sent with older text
+        version = document_versions.get(doc_id)
+        if version is not None and etag_matches(if_none_match, version):
+            return Response(status_code=304, headers={"ETag": etag(version)})
+        
+        text = await run_in_threadpool(documents_storage.get, doc_id)
+        if text is None:
             raise HTTPException(status_code=404, detail="Document not found")
+        response.headers["ETag"] = etag(version if version is not None else UNVERSIONED)
         
-        return DocumentResponse(
-            id=doc_id,
-            text=documents_storage[doc_id]
-        )
+        return DocumentResponse(id=doc_id, text=text)
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to get document: {str(e)}")
 
+@app.post("/get/batch", response_model=MultiGetResponse)
+async def get_changed_documents(
+    request: MultiGet,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Return only the documents whose version differs from the one the caller holds"""
+    require_scope(api_key, "read")
+    check_batch_size(len(request.documents))
+    try:
+        held = {known.id: known.version for known in request.documents}
+        current = {doc_id: document_versions.get(doc_id) for doc_id in held}
+        stale = [doc_id for doc_id, version in held.items() if version is None or version != current[doc_id]]
+        
+        texts = await run_in_threadpool(documents_storage.get_many, stale)
+        return MultiGetResponse(
+            changed=[
+                VersionedDocument(id=doc_id, text=texts[doc_id], version=current[doc_id] or UNVERSIONED)
+                for doc_id in stale if doc_id in texts
+            ],
+            missing=[doc_id for doc_id in stale if doc_id not in texts]
+        )
+    
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to get documents: {str(e)}")
+
 @app.put("/update", response_model=DocumentResponse)
 async def update_document(
     document: DocumentUpdate,
-    api_key: str = Depends(verify_api_key)
+    api_key: ApiKey = Depends(verify_api_key)
 ):
     """Update an existing document"""
+    require_scope(api_key, "write")
     try:
-        # Check if document exists
-        if document.id not in documents_storage:
+        # Update the document only if it exists
+        if not await run_in_threadpool(versioned_replace, document.id, document.text):
             raise HTTPException(status_code=404, detail="Document not found")
-        
-        # Update document
-        documents_storage[document.id] = document.text
+        if near_dup_index is not None:
+            await run_in_threadpool(near_dup_index.add, document.id, document.text)
+        if trigram_index is not None:
+            await run_in_threadpool(trigram_index.add, document.id, document.text)
         
         return DocumentResponse(id=document.id, text=document.text)
     
@@ -112,16 +450,18 @@ async def update_document(
 @app.delete("/delete/{doc_id}")
 async def delete_document(
     doc_id: str,
-    api_key: str = Depends(verify_api_key)
+    api_key: ApiKey = Depends(verify_api_key)
 ):
     """Delete a document by ID"""
+    require_scope(api_key, "write")
     try:
-        # Check if document exists
-        if doc_id not in documents_storage:
+        # Delete document if it exists
+        if not await run_in_threadpool(versioned_pop, doc_id):
             raise HTTPException(status_code=404, detail="Document not found")
-        
-        # Delete document
-        del documents_storage[doc_id]
+        if near_dup_index is not None:
+            near_dup_index.remove(doc_id)
+        if trigram_index is not None:
+            trigram_index.remove(doc_id)
         
         return {"message": "Document deleted successfully", "id": doc_id}
     
@@ -130,46 +470,238 @@ async def delete_document(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to delete document: {str(e)}")
 
-@app.get("/search", response_model=List[SearchResponse])
+@app.get("/search", response_model=List[SearchResponse], response_model_exclude_none=True)
 async def search_documents(
     query: str,
+    response: Response,
     limit: int = 10,
-    api_key: str = Depends(verify_api_key)
+    include: Optional[str] = None,
+    max_distance: Optional[float] = None,
+    mode: str = "substring",
+    timeout_ms: Optional[int] = None,
+    api_key: ApiKey = Depends(verify_api_key)
 ):
-    """Search documents using simple text matching"""
+    """Search documents using simple text matching.
+
+    include (comma-separated ids, distances, text) picks the returned
+    fields; hits farther than max_distance are dropped during the scan.
+    mode=fuzzy ranks by shared trigrams instead (distance = 1 - similarity).
+    Past timeout_ms the best hits so far are returned with X-Search-Partial.
+    """
+    require_scope(api_key, "read")
+    fields = parse_include(include)
+    check_max_distance(max_distance)
+    check_search_mode(mode)
+    check_timeout(timeout_ms)
+    deadline = search_budget.deadline(timeout_ms)
     try:
         if not query.strip():
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
-        # Simple text search (case-insensitive)
-        results = []
-        query_lower = query.lower()
-        
-        for doc_id, text in documents_storage.items():
-            if query_lower in text.lower():
-                # Simple distance calculation (inverse of match count)
-                match_count = text.lower().count(query_lower)
-                distance = 1.0 / (match_count + 1)  # Lower distance = better match
-                
-                results.append(SearchResponse(
-                    id=doc_id,
-                    text=text,
-                    distance=distance
-                ))
+        # Simple text search (case-insensitive), narrowed by the trigram index when enabled
+        matcher = fuzzy_matches if mode == "fuzzy" else search_matches
+        matches = await run_in_threadpool(matcher, [query.lower()], limit, max_distance, deadline)
+        search_budget.finish(deadline, response)
+        return [search_response(doc_id, text, distance, fields) for distance, doc_id, text in matches[0]]
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Search failed: {str(e)}")
+
+@app.post("/search/batch", response_model=List[List[SearchResponse]], response_model_exclude_none=True)
+async def search_batch(
+    batch: SearchBatch,
+    response: Response,
+    accept: Optional[str] = Header(None),
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Run several text searches in one pass over the store; answers in JSON, MessagePack or Arrow"""
+    require_scope(api_key, "read")
+    check_batch_size(len(batch.queries))
+    fields = parse_include(batch.include)
+    check_max_distance(batch.max_distance)
+    check_search_mode(batch.mode)
+    check_timeout(batch.timeout_ms)
+    deadline = search_budget.deadline(batch.timeout_ms)
+    try:
+        if any(not query.strip() for query in batch.queries):
+            raise HTTPException(status_code=400, detail="Query cannot be empty")
         
-        # Sort by distance (ascending) and limit results
-        results.sort(key=lambda x: x.distance)
-        return results[:limit]
+        matcher = fuzzy_matches if batch.mode == "fuzzy" else search_matches
+        matches = await run_in_threadpool(
+            matcher, [query.lower() for query in batch.queries], batch.limit, batch.max_distance, deadline
+        )
+        responses = [
+            [search_response(doc_id, text, distance, fields) for distance, doc_id, text in query_matches]
+            for query_matches in matches
+        ]
+        media_type = negotiate_format(accept)
+        if media_type != JSON_TYPE:
+            # A returned Response does not pick up headers set on the injected one
+            encoded = binary_response(responses, media_type, search_batch_table, exclude_none=True)
+            search_budget.finish(deadline, encoded)
+            return encoded
+        search_budget.finish(deadline, response)
+        return responses
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Search failed: {str(e)}")
 
+@app.get("/export")
+async def export_documents(
+    accept: Optional[str] = Header(None),
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Stream every document as newline-delimited JSON, a MessagePack sequence or an Arrow stream"""
+    require_scope(api_key, "read")
+    media_type = negotiate_format(accept)
+    if media_type != JSON_TYPE:
+        def chunks(chunk_size: int = 1000):
+            encoder = ExportEncoder(media_type)
+            ids, texts = [], []
+            for doc_id, text in documents_storage.items():
+                ids.append(doc_id)
+                texts.append(text)
+                if len(ids) >= chunk_size:
+                    yield encoder.encode(ids, texts)
+                    ids, texts = [], []
+            yield encoder.encode(ids, texts)
+            yield encoder.finish()
+        
+        return StreamingResponse(chunks(), media_type=media_type)
+    
+    def lines(chunk_size: int = 1000):
+        # Sync generator: Starlette iterates it on the threadpool; items() copies one shard at a time
+        chunk = []
+        for doc_id, text in documents_storage.items():
+            chunk.append(json.dumps({"id": doc_id, "text": text}) + "\n")
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/duplicates/{doc_id}")
+async def get_near_duplicates(
+    doc_id: str,
+    threshold: Optional[float] = None,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Near-duplicates of a document by estimated Jaccard similarity of word shingles"""
+    require_scope(api_key, "read")
+    check_near_dup_index()
+    check_threshold(threshold)
+    
+    matches = await run_in_threadpool(near_dup_index.near_duplicates, doc_id, threshold)
+    if matches is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return {
+        "id": doc_id,
+        "threshold": threshold or near_dup_index.threshold,
+        "duplicates": [{"id": match_id, "similarity": similarity} for match_id, similarity in matches],
+    }
+
+@app.get("/admin/duplicates")
+async def get_duplicate_clusters(
+    threshold: Optional[float] = None,
+    min_size: int = 2,
+    limit: int = 100,
+    api_key: ApiKey = Depends(verify_api_key)
+):
+    """Groups of near-duplicate documents, largest first"""
+    require_scope(api_key, "admin")
+    check_near_dup_index()
+    check_threshold(threshold)
+    
+    clusters = await run_in_threadpool(near_dup_index.clusters, threshold, max(2, min_size))
+    return {
+        "threshold": threshold or near_dup_index.threshold,
+        "clusters": len(clusters),
+        "duplicates": sum(len(ids) - 1 for ids in clusters),
+        "groups": clusters[:limit],
+    }
+
+# WebSocket channel: add, get and search frames run through the HTTP handlers above
+
+async def channel_get(known: KnownVersion, api_key: ApiKey, response: Response):
+    if_none_match = etag(known.version) if known.version is not None else None
+    return await get_document(known.id, response, if_none_match, api_key)
+
+async def channel_search(search: TextSearch, api_key: ApiKey, response: Response):
+    return await search_documents(
+        search.query, response, search.limit, search.include, search.max_distance, search.mode, search.timeout_ms, api_key
+    )
+
+async def channel_search_batch(searches: List[TextSearch], api_key: ApiKey, response: Response):
+    first = searches[0]
+    batch = SearchBatch(
+        queries=[search.query for search in searches],
+        limit=first.limit,
+        include=first.include,
+        max_distance=first.max_distance,
+        mode=first.mode,
+        timeout_ms=first.timeout_ms
+    )
+    return await search_batch(batch, response, None, api_key)
+
+def channel_search_key(search: TextSearch):
+    # A batch shares one set of options
+    include = tuple(search.include) if search.include is not None else None
+    return (search.limit, include, search.max_distance, search.mode, search.timeout_ms)
+
+channel = WebSocketChannel.from_env(key_ring, admission, {
+    "add": Operation(
+        DocumentAdd,
+        lambda document, api_key, response: add_document(document, api_key),
+        batch=lambda documents, api_key, response: add_documents(DocumentBatch(documents=documents), None, api_key),
+    ),
+    "get": Operation(KnownVersion, channel_get),
+    "search": Operation(
+        TextSearch,
+        channel_search,
+        batch=channel_search_batch,
+        batch_key=channel_search_key,
+        exclude_none=True,
+    ),
+}, BATCH_MAX_SIZE)
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """Multiplexed add, get and search frames over one authenticated connection"""
+    await channel.serve(websocket)
+
+@app.get("/stats")
+async def get_stats(api_key: ApiKey = Depends(verify_api_key)):
+    """Capacity, latency and resource statistics"""
+    return {
+        "service": "ChromaDB API (Minimal Version)",
+        "documents": len(documents_storage),
+        "storage": await run_in_threadpool(documents_storage.memory_usage),
+        "near_duplicates": near_dup_index.stats() if near_dup_index is not None else None,
+        "trigram": trigram_index.stats() if trigram_index is not None else None,
+        "versions": document_versions.stats(),
+        "websocket": channel.stats(),
+        "search_budget": search_budget.stats(),
+        "admission": admission.snapshot(),
+        **runtime_stats(),
+    }
+
+@app.get("/stats/memory")
+async def get_memory_stats(api_key: ApiKey = Depends(verify_api_key)):
+    """Memory held by the document store, broken down by structure"""
+    return await run_in_threadpool(documents_storage.memory_usage)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint (no auth required)"""
-    return {"status": "healthy", "service": "ChromaDB API (Minimal Version)"}
+    status = "degraded" if loop_is_lagging() else "healthy"
+    return {"status": status, "service": "ChromaDB API (Minimal Version)"}
 
 if __name__ == "__main__":
     import uvicorn
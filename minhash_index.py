@@ -0,0 +1,313 @@
+"""
+MinHash LSH index for near-duplicate detection.
+
+Each document is reduced to the set of its word shingles (``shingle_size``
+consecutive lowercased words) and summarized by a MinHash signature of
+``permutations`` 32-bit values; the fraction of equal signature values
+estimates the Jaccard similarity of two shingle sets. Signatures are cut
+into bands, and documents sharing any band land in the same bucket, so
+the near-duplicates of a document are found by looking up its bands
+instead of comparing it with the whole corpus. Band count and width are
+picked for ``threshold`` the way datasketch does, as the split minimizing
+the weighted false positive and false negative probability mass. Missed
+duplicates are weighted heavier, since false positives only cost one
+signature comparison.
+
+Candidates from the buckets are verified against the signature estimate,
+so bucket collisions never surface as results. numpy speeds up signature
+computation considerably but is optional.
+"""
+import os
+import random
+import struct
+import threading
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Multiply-add-shift hashing of 32-bit shingle hashes: the top 32 bits of
+# (a * x + b) mod 2**64 (strongly universal, and no slow modulo)
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_SEED = 1
+
+# Weight of missed near-duplicates against candidate collisions when picking bands
+FALSE_NEGATIVE_WEIGHT = 0.9
+
+
+def shingles(text: str, size: int) -> Set[str]:
+    """Distinct word shingles; texts shorter than one shingle are a single shingle"""
+    words = text.lower().split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _integrate(fn, start: float, end: float, steps: int = 100) -> float:
+    step = (end - start) / steps
+    return sum(fn(start + step * (i + 0.5)) for i in range(steps)) * step
+
+
+def _false_positive(threshold: float, bands: int, rows: int) -> float:
+    # Probability mass of pairs below the threshold sharing a band
+    return _integrate(lambda s: 1 - (1 - s ** rows) ** bands, 0.0, threshold)
+
+
+def _false_negative(threshold: float, bands: int, rows: int) -> float:
+    # Probability mass of pairs above the threshold sharing no band
+    return _integrate(lambda s: (1 - s ** rows) ** bands, threshold, 1.0)
+
+
+def optimal_bands(threshold: float, permutations: int, fn_weight: float = FALSE_NEGATIVE_WEIGHT) -> Tuple[int, int]:
+    """(bands, rows) with bands * rows <= permutations minimizing the weighted FP + FN probability mass"""
+    best, best_error = (1, permutations), None
+    for bands in range(1, permutations + 1):
+        for rows in range(1, permutations // bands + 1):
+            error = (
+                (1 - fn_weight) * _false_positive(threshold, bands, rows)
+                + fn_weight * _false_negative(threshold, bands, rows)
+            )
+            if best_error is None or error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class MinHashIndex:
+    """Near-duplicate index over document texts (thread-safe)"""
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        permutations: int = 128,
+        shingle_size: int = 3,
+        loading: bool = False,
+    ):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.permutations = permutations
+        self.shingle_size = shingle_size
+        self.bands, self.rows = optimal_bands(threshold, permutations)
+
+        # Fixed seed: signatures must stay comparable across restarts
+        rng = random.Random(_SEED)
+        self._a = [rng.getrandbits(64) for _ in range(permutations)]
+        self._b = [rng.getrandbits(64) for _ in range(permutations)]
+        if np is not None:
+            self._a_np = np.array(self._a, dtype=np.uint64)
+            self._b_np = np.array(self._b, dtype=np.uint64)
+
+        self._signatures: Dict[str, bytes] = {}
+        # One dict per band: band bytes -> ID, or a set of IDs once shared
+        self._buckets: List[dict] = [{} for _ in range(self.bands)]
+        self._lock = threading.Lock()
+        # While the initial load runs, IDs written by requests must not be overwritten by it
+        self.ready = not loading
+        self._touched = set()
+
+    @classmethod
+    def from_env(cls, loading: bool = False) -> "MinHashIndex":
+        return cls(
+            threshold=float(os.getenv("NEAR_DUP_THRESHOLD", 0.8)),
+            permutations=int(os.getenv("MINHASH_PERMUTATIONS", 128)),
+            shingle_size=int(os.getenv("MINHASH_SHINGLE_SIZE", 3)),
+            loading=loading,
+        )
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._signatures
+
+    # Signatures
+
+    def signature(self, text: str) -> bytes:
+        """MinHash signature of text, packed as little-endian uint32"""
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text, self.shingle_size)]
+        if np is not None:
+            values = np.array(hashes, dtype=np.uint64)[:, None]
+            # uint64 arithmetic wraps, which is the mod 2**64
+            products = (values * self._a_np + self._b_np) >> np.uint64(32)
+            return products.min(axis=0).astype("<u4").tobytes()
+        return struct.pack(
+            f"<{self.permutations}I",
+            *(min(((a * h + b) & _MASK64) >> 32 for h in hashes) for a, b in zip(self._a, self._b))
+        )
+
+    def similarity(self, first: bytes, second: bytes) -> float:
+        """Estimated Jaccard similarity of two signatures"""
+        if np is not None:
+            return float(np.count_nonzero(np.frombuffer(first, "<u4") == np.frombuffer(second, "<u4"))) / self.permutations
+        layout = f"<{self.permutations}I"
+        return sum(1 for x, y in zip(struct.unpack(layout, first), struct.unpack(layout, second)) if x == y) / self.permutations
+
+    def _bands(self, signature: bytes) -> List[bytes]:
+        width = self.rows * 4
+        return [signature[i * width:(i + 1) * width] for i in range(self.bands)]
+
+    # Maintenance (callers hold the lock)
+
+    def _remove(self, doc_id: str):
+        signature = self._signatures.pop(doc_id, None)
+        if signature is None:
+            return
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            members = buckets.get(band)
+            if members == doc_id:
+                del buckets[band]
+            elif isinstance(members, set):
+                members.discard(doc_id)
+                if len(members) == 1:
+                    buckets[band] = members.pop()
+
+    def _add(self, doc_id: str, signature: bytes):
+        self._remove(doc_id)
+        self._signatures[doc_id] = signature
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            members = buckets.get(band)
+            if members is None:
+                buckets[band] = doc_id
+            elif isinstance(members, set):
+                members.add(doc_id)
+            else:
+                buckets[band] = {members, doc_id}
+
+    def add(self, doc_id: str, text: str):
+        """Index a document, replacing any previous version"""
+        signature = self.signature(text)
+        with self._lock:
+            if not self.ready:
+                self._touched.add(doc_id)
+            self._add(doc_id, signature)
+
+    def add_many(self, documents: Iterable[Tuple[str, str]]):
+        """Index several documents, hashing them before taking the lock (blocking)"""
+        signed = [(doc_id, self.signature(text)) for doc_id, text in documents]
+        with self._lock:
+            for doc_id, signature in signed:
+                if not self.ready:
+                    self._touched.add(doc_id)
+                self._add(doc_id, signature)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            if not self.ready:
+                self._touched.add(doc_id)
+            self._remove(doc_id)
+
+    def load_through(self, documents: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """Initial bulk load that may run concurrently with add/remove.
+
+        Yields each document after indexing it, so one scan of the
+        collection can also feed another index.
+        """
+        for doc_id, text in documents:
+            signature = self.signature(text)
+            with self._lock:
+                if doc_id not in self._touched:
+                    self._add(doc_id, signature)
+            yield doc_id, text
+        with self._lock:
+            self.ready = True
+            self._touched.clear()
+
+    # Queries
+
+    def _candidates(self, signature: bytes) -> Set[str]:
+        candidates: Set[str] = set()
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            members = buckets.get(band)
+            if isinstance(members, set):
+                candidates.update(members)
+            elif members is not None:
+                candidates.add(members)
+        return candidates
+
+    def _verified(self, signature: bytes, candidates: Iterable[str], threshold: float) -> List[Tuple[str, float]]:
+        matches = []
+        for doc_id in candidates:
+            score = self.similarity(signature, self._signatures[doc_id])
+            if score >= threshold:
+                matches.append((doc_id, score))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches
+
+    def near_duplicates(self, doc_id: str, threshold: Optional[float] = None) -> Optional[List[Tuple[str, float]]]:
+        """(id, estimated Jaccard) of the near-duplicates of doc_id, most similar first; None if unknown"""
+        with self._lock:
+            signature = self._signatures.get(doc_id)
+            if signature is None:
+                return None
+            candidates = self._candidates(signature)
+            candidates.discard(doc_id)
+            return self._verified(signature, candidates, threshold or self.threshold)
+
+    def query(self, text: str, threshold: Optional[float] = None) -> List[Tuple[str, float]]:
+        """(id, estimated Jaccard) of indexed documents near-duplicating text"""
+        signature = self.signature(text)
+        with self._lock:
+            return self._verified(signature, self._candidates(signature), threshold or self.threshold)
+
+    def clusters(self, threshold: Optional[float] = None, min_size: int = 2) -> List[List[str]]:
+        """Groups of near-duplicate IDs, largest first (blocking).
+
+        Within each bucket, members join the first earlier member ("leader")
+        they match, so a bucket of k copies of one text costs k comparisons
+        rather than k squared. Groups are the connected components of those
+        links across all buckets.
+        """
+        threshold = threshold or self.threshold
+        parent: Dict[str, str] = {}
+
+        def find(doc_id: str) -> str:
+            root = doc_id
+            while parent[root] != root:
+                root = parent[root]
+            while doc_id != root:
+                parent[doc_id], doc_id = root, parent[doc_id]
+            return root
+
+        with self._lock:
+            for buckets in self._buckets:
+                for members in buckets.values():
+                    if not isinstance(members, set):
+                        continue
+                    leaders: List[str] = []
+                    for doc_id in sorted(members):
+                        signature = self._signatures[doc_id]
+                        for leader in leaders:
+                            if self.similarity(signature, self._signatures[leader]) >= threshold:
+                                parent.setdefault(leader, leader)
+                                parent.setdefault(doc_id, doc_id)
+                                first, second = find(leader), find(doc_id)
+                                if first != second:
+                                    parent[second] = first
+                                break
+                        else:
+                            leaders.append(doc_id)
+
+        groups: Dict[str, List[str]] = {}
+        for doc_id in parent:
+            groups.setdefault(find(doc_id), []).append(doc_id)
+        result = [sorted(ids) for ids in groups.values() if len(ids) >= min_size]
+        result.sort(key=lambda ids: (-len(ids), ids[0]))
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            shared = sum(1 for buckets in self._buckets for members in buckets.values() if isinstance(members, set))
+            return {
+                "documents": len(self._signatures),
+                "threshold": self.threshold,
+                "permutations": self.permutations,
+                "bands": self.bands,
+                "rows": self.rows,
+                "shingle_size": self.shingle_size,
+                "shared_buckets": shared,
+                "accelerated": np is not None,
+                "ready": self.ready,
+            }
@@ -0,0 +1,361 @@
+"""
+Quantized in-memory vector index for the lightweight engine.
+
+Vectors are L2-normalized and compared by cosine similarity. Three
+storage modes trade memory for accuracy:
+
+- ``float32``: the exact vectors (4 bytes per dimension), scanned directly;
+- ``int8``: per-vector symmetric scalar quantization (1 byte per dimension
+  plus a float32 scale, ~4x smaller); the scan scores int8 codes against
+  the float query;
+- ``binary``: sign bits packed 8 per byte (~32x smaller); the scan ranks by
+  Hamming distance with a popcount.
+
+Quantized scans keep ``limit * rescore_factor`` candidates and rescore them
+exactly against the float32 originals. The originals are kept by default in
+a memory-mapped file (``originals_path``, or an anonymous temporary file),
+so they live in the page cache rather than on the heap and only candidate
+rows are read. They cost 4 bytes per dimension on disk and buy exact
+rescoring, ``exact`` searches and the recall report. With
+``keep_originals=False`` int8 candidates keep their int8 scores, binary
+candidates are rescored asymmetrically (float query against the +/-1
+codes), and neither exact search nor recall can be measured.
+
+A search given a ``Deadline`` stops scanning at the first block boundary
+past it and ranks the rows scanned so far.
+"""
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from search_budget import Deadline
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+MODES = ("float32", "int8", "binary")
+
+# Candidates kept per requested result for rescoring; sign codes need many more
+DEFAULT_RESCORE_FACTOR = {"float32": 1, "int8": 4, "binary": 40}
+
+# Rows scored per block; keeps the float copy of an int8 block in cache
+SCAN_BLOCK = 4096
+INITIAL_CAPACITY = 1024
+
+
+class VectorIndexUnavailable(RuntimeError):
+    pass
+
+
+def _blocks(count: int, deadline: Optional[Deadline]):
+    """(start, end) row blocks of SCAN_BLOCK rows; the first always, the rest while the deadline holds"""
+    for start in range(0, count, SCAN_BLOCK):
+        if start and deadline is not None and deadline.exceeded():
+            return
+        yield start, min(count, start + SCAN_BLOCK)
+
+
+def _row_popcount(words):
+    """Set bits per row of a uint64 matrix"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    # SWAR popcount, one 64-bit word at a time
+    v = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    v = (v & np.uint64(0x3333333333333333)) + ((v >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    v = (v + (v >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v * np.uint64(0x0101010101010101)) >> np.uint64(56)
+    return v.sum(axis=1, dtype=np.int32)
+
+
+class QuantizedVectorIndex:
+    """ID -> vector index with float32, int8 or binary storage (thread-safe)"""
+
+    def __init__(
+        self,
+        mode: str = "int8",
+        dimension: Optional[int] = None,
+        originals_path: Optional[str] = None,
+        rescore_factor: Optional[int] = None,
+        keep_originals: bool = True,
+    ):
+        if np is None:
+            raise VectorIndexUnavailable("numpy is required for vector search")
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        self.mode = mode
+        self.dimension = dimension
+        # float32 codes are the originals
+        self.keep_originals = keep_originals and mode != "float32"
+        self.originals_path = originals_path if self.keep_originals else None
+        self.rescore_factor = max(1, rescore_factor or DEFAULT_RESCORE_FACTOR[mode])
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._capacity = 0
+        self._codes = None
+        self._scales = None
+        self._originals = None
+        self._originals_file = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_env(cls) -> "QuantizedVectorIndex":
+        dimension = os.getenv("EMBEDDING_DIMENSION")
+        rescore_factor = os.getenv("VECTOR_RESCORE_FACTOR")
+        # Unset: a temporary file; "off": no originals, so no exact rescoring or recall report
+        originals_path = os.getenv("VECTOR_ORIGINALS_PATH") or None
+        return cls(
+            mode=os.getenv("VECTOR_INDEX_MODE", "int8"),
+            dimension=int(dimension) if dimension else None,
+            originals_path=originals_path if originals_path != "off" else None,
+            rescore_factor=int(rescore_factor) if rescore_factor else None,
+            keep_originals=originals_path != "off",
+        )
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._rows
+
+    @property
+    def has_originals(self) -> bool:
+        return self.mode == "float32" or self.keep_originals
+
+    # Storage
+
+    def _allocate(self, capacity: int):
+        d = self.dimension
+        if self.mode == "float32":
+            codes = np.zeros((capacity, d), dtype=np.float32)
+        elif self.mode == "int8":
+            codes = np.zeros((capacity, d), dtype=np.int8)
+        else:
+            # Sign bits padded to whole 64-bit words; padding bits stay zero
+            codes = np.zeros((capacity, (d + 63) // 64), dtype=np.uint64)
+        count = len(self._ids)
+        if self._codes is not None:
+            codes[:count] = self._codes[:count]
+        self._codes = codes
+
+        if self.mode == "int8":
+            scales = np.zeros(capacity, dtype=np.float32)
+            if self._scales is not None:
+                scales[:count] = self._scales[:count]
+            self._scales = scales
+
+        if self.keep_originals:
+            if self._originals is not None:
+                self._originals.flush()
+                self._originals = None
+            if self.originals_path is None:
+                # Unlinked on creation, so it goes away with the process
+                if self._originals_file is None:
+                    self._originals_file = tempfile.TemporaryFile(prefix="vector_originals_")
+                self._originals_file.truncate(capacity * d * 4)
+                self._originals = np.memmap(self._originals_file, dtype=np.float32, mode="r+", shape=(capacity, d))
+            else:
+                mode = "r+" if os.path.exists(self.originals_path) and count else "w+"
+                if mode == "r+":
+                    # Grow the backing file in place; existing rows keep their offsets
+                    with open(self.originals_path, "r+b") as f:
+                        f.truncate(capacity * d * 4)
+                self._originals = np.memmap(self.originals_path, dtype=np.float32, mode=mode, shape=(capacity, d))
+        self._capacity = capacity
+
+    def _encode(self, row: int, vector):
+        if self.mode == "float32":
+            self._codes[row] = vector
+        elif self.mode == "int8":
+            peak = float(np.abs(vector).max()) or 1.0
+            self._codes[row] = np.round(vector * (127.0 / peak)).astype(np.int8)
+            self._scales[row] = peak / 127.0
+        else:
+            self._codes[row] = self._sign_words(vector)
+        if self._originals is not None:
+            self._originals[row] = vector
+
+    def _sign_words(self, vector):
+        packed = np.zeros(((self.dimension + 63) // 64) * 8, dtype=np.uint8)
+        bits = np.packbits(vector > 0)
+        packed[:len(bits)] = bits
+        return packed.view(np.uint64)
+
+    def _normalize(self, vector: Sequence[float]):
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.ndim != 1 or (self.dimension is not None and vector.shape[0] != self.dimension):
+            raise ValueError(f"vector must have dimension {self.dimension}")
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def add(self, doc_id: str, vector: Sequence[float]):
+        """Insert or replace the vector for doc_id"""
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = len(vector)
+            vector = self._normalize(vector)
+            row = self._rows.get(doc_id)
+            if row is None:
+                if len(self._ids) == self._capacity:
+                    self._allocate(max(INITIAL_CAPACITY, self._capacity * 2))
+                row = len(self._ids)
+                self._ids.append(doc_id)
+                self._rows[doc_id] = row
+            self._encode(row, vector)
+
+    def remove(self, doc_id: str) -> bool:
+        """Drop doc_id's vector; the last row moves into its place"""
+        with self._lock:
+            row = self._rows.pop(doc_id, None)
+            if row is None:
+                return False
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+                self._codes[row] = self._codes[last]
+                if self._scales is not None:
+                    self._scales[row] = self._scales[last]
+                if self._originals is not None:
+                    self._originals[row] = self._originals[last]
+            self._ids.pop()
+            return True
+
+    # Search
+
+    def _scan(self, query, count: int, deadline: Optional[Deadline] = None):
+        """Approximate scores for every row scanned before the deadline (a prefix of the rows), higher is better"""
+        scanned = 0
+        if self.mode == "binary":
+            words = self._sign_words(query)
+            distances = np.empty(count, dtype=np.int32)
+            for start, scanned in _blocks(count, deadline):
+                distances[start:scanned] = _row_popcount(self._codes[start:scanned] ^ words)
+            return -distances[:scanned]
+
+        scores = np.empty(count, dtype=np.float32)
+        for start, scanned in _blocks(count, deadline):
+            scores[start:scanned] = self._codes[start:scanned] @ query
+        scores = scores[:scanned]
+        if self.mode == "int8":
+            scores *= self._scales[:scanned]
+        return scores
+
+    def _rescore(self, query, rows):
+        if self._originals is not None:
+            return np.asarray(self._originals[np.sort(rows)] @ query)[np.argsort(np.argsort(rows))]
+        if self.mode == "binary":
+            signs = np.unpackbits(self._codes[rows].view(np.uint8), axis=1, count=self.dimension).astype(np.float32) * 2 - 1
+            return (signs @ query) / np.sqrt(self.dimension)
+        return None
+
+    @staticmethod
+    def _top(scores, limit: int):
+        if limit >= len(scores):
+            return np.argsort(-scores, kind="stable")
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def search(
+        self, vector: Sequence[float], limit: int, exact: bool = False, max_distance: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> List[Tuple[str, float]]:
+        """Nearest documents as (id, cosine distance), nearest first, none farther than max_distance (blocking)"""
+        hits = self._search(vector, limit, exact, deadline)
+        if max_distance is not None:
+            hits = [hit for hit in hits if hit[1] <= max_distance]
+        return hits
+
+    def _search(self, vector: Sequence[float], limit: int, exact: bool, deadline: Optional[Deadline]) -> List[Tuple[str, float]]:
+        with self._lock:
+            count = len(self._ids)
+            if not count or limit <= 0:
+                return []
+            query = self._normalize(vector)
+
+            if exact or self.mode == "float32":
+                if not self.has_originals:
+                    raise VectorIndexUnavailable("exact search needs the float32 originals (VECTOR_ORIGINALS_PATH is off)")
+                source = self._codes if self.mode == "float32" else self._originals
+                scores = np.empty(count, dtype=np.float32)
+                scanned = 0
+                for start, scanned in _blocks(count, deadline):
+                    scores[start:scanned] = source[start:scanned] @ query
+                scores = scores[:scanned]
+                rows = self._top(scores, limit)
+                return [(self._ids[r], float(1.0 - scores[r])) for r in rows]
+
+            scores = self._scan(query, count, deadline)
+            candidates = self._top(scores, min(len(scores), limit * self.rescore_factor))
+            rescored = self._rescore(query, candidates)
+            if rescored is None:
+                rows = candidates[:limit]
+                return [(self._ids[r], float(1.0 - scores[r])) for r in rows]
+            order = self._top(rescored, limit)
+            return [(self._ids[candidates[i]], float(1.0 - rescored[i])) for i in order]
+
+    def recall_report(self, k: int = 10, queries: int = 100, seed: int = 0) -> dict:
+        """recall@k and latency of the quantized path against exact search (blocking).
+
+        Queries are stored vectors sampled at random, so this needs the
+        float32 originals.
+        """
+        with self._lock:
+            if not self.has_originals:
+                raise VectorIndexUnavailable("recall needs the float32 originals (VECTOR_ORIGINALS_PATH is off)")
+            count = len(self._ids)
+            if not count:
+                raise VectorIndexUnavailable("index is empty")
+            source = self._codes if self.mode == "float32" else self._originals
+            rows = random.Random(seed).sample(range(count), min(queries, count))
+            samples = [np.array(source[row]) for row in rows]
+
+        k = min(k, count)
+        hits = 0
+        exact_seconds = 0.0
+        approx_seconds = 0.0
+        for vector in samples:
+            start = time.perf_counter()
+            truth = {doc_id for doc_id, _ in self.search(vector, k, exact=True)}
+            exact_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            found = {doc_id for doc_id, _ in self.search(vector, k)}
+            approx_seconds += time.perf_counter() - start
+            hits += len(truth & found)
+        return {
+            "mode": self.mode,
+            "k": k,
+            "queries": len(samples),
+            "rescore_factor": self.rescore_factor,
+            "recall": round(hits / (len(samples) * k), 4),
+            "exact_ms": round(exact_seconds / len(samples) * 1000, 3),
+            "quantized_ms": round(approx_seconds / len(samples) * 1000, 3),
+        }
+
+    def memory_usage(self) -> dict:
+        """Bytes held by the index; originals are reported separately since they live on disk"""
+        with self._lock:
+            count = len(self._ids)
+            code_bytes = self._codes.nbytes if self._codes is not None else 0
+            scale_bytes = self._scales.nbytes if self._scales is not None else 0
+            float32_bytes = count * (self.dimension or 0) * 4
+            used = (code_bytes + scale_bytes) * count // self._capacity if self._capacity else 0
+            return {
+                "mode": self.mode,
+                "vectors": count,
+                "dimension": self.dimension,
+                "capacity": self._capacity,
+                "code_bytes": code_bytes,
+                "scale_bytes": scale_bytes,
+                "originals_bytes_on_disk": self._originals.nbytes if self._originals is not None else 0,
+                "float32_equivalent_bytes": float32_bytes,
+                "compression_ratio": round(float32_bytes / used, 1) if used else None,
+            }
@@ -0,0 +1,370 @@
+"""
+Background rebuild of the Chroma collection with an atomic switch-over.
+
+Changing the embedding model or the HNSW build parameters needs a new
+collection. ``Reindexer`` builds it while the service keeps serving the
+current one:
+
+1. The IDs of the live collection are snapshotted and copied into a new
+   collection in parallel batches, with the configured HNSW parameters.
+   Texts are embedded again with the target model; when the model is
+   unchanged, the stored embeddings are copied instead. Copying is
+   throttled (documents per second) and pauses while the event loop
+   lags, so live requests keep their latency.
+2. Writes that arrive meanwhile are applied to the live collection and
+   mirrored into the new one. A document a mirrored update or delete
+   touched is not copied again, so the copy can never overwrite it with
+   the text it read earlier.
+3. When every batch is copied, writes are paused through the
+   ``WriteGate``, the new collection's name is written to the
+   ``active_collection`` file next to the store (which is how a restart
+   finds it) and the application swaps it in. The old collection is
+   dropped after a grace period for in-flight reads.
+
+Collections record the embedding model they were built with in their
+metadata, so after a restart with a new model configured the service
+keeps embedding queries with the old one until the rebuild switches
+over.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from backup import Throttle, WriteGate
+from embedding import EmbeddingConfig, LocalOnnxEmbeddingFunction
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_FILE = "active_collection"
+
+MODEL_PATH_KEY = "embedding:model_path"
+SEQ_LENGTH_KEY = "embedding:max_seq_length"
+
+# How long a lagging event loop may hold back the next batch, in seconds
+MAX_YIELD = 5.0
+
+
+def read_active_collection(chroma_path: str, default: str) -> str:
+    """Name of the collection to serve, as recorded by the last switch-over"""
+    try:
+        with open(os.path.join(chroma_path, ACTIVE_FILE)) as f:
+            return f.read().strip() or default
+    except FileNotFoundError:
+        return default
+
+
+def write_active_collection(chroma_path: str, name: str):
+    path = os.path.join(chroma_path, ACTIVE_FILE)
+    with open(path + ".tmp", "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def embedding_metadata(embedding_function: LocalOnnxEmbeddingFunction) -> dict:
+    """Collection metadata recording the model that produced its vectors"""
+    return {
+        MODEL_PATH_KEY: embedding_function.config.model_path or "",
+        SEQ_LENGTH_KEY: embedding_function.config.max_seq_length,
+    }
+
+
+def recorded_embedding_function(
+    metadata: Optional[dict], configured: LocalOnnxEmbeddingFunction
+) -> LocalOnnxEmbeddingFunction:
+    """The embedding function a collection was built with; configured if it matches or is not recorded"""
+    metadata = metadata or {}
+    if MODEL_PATH_KEY not in metadata:
+        return configured
+    config = EmbeddingConfig()
+    config.model_path = metadata[MODEL_PATH_KEY] or None
+    config.max_seq_length = int(metadata.get(SEQ_LENGTH_KEY, config.max_seq_length))
+    recorded = LocalOnnxEmbeddingFunction(config)
+    return configured if recorded.model_id == configured.model_id else recorded
+
+
+class ReindexInProgress(Exception):
+    pass
+
+
+class ReindexJob:
+    """Progress of one rebuild; counters are updated from the copy workers"""
+
+    def __init__(self, job_id: str, source, target, target_ef, reembed: bool):
+        self.id = job_id
+        self.source = source
+        self.target = target
+        self.target_ef = target_ef
+        self.reembed = reembed
+        self.state = "running"
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.total = 0
+        self.copied = 0
+        self.skipped = 0
+        self.mirrored = 0
+        self.cancelled = threading.Event()
+        # IDs a mirrored update or delete touched; the copy leaves them alone
+        self.dirty = set()
+
+    def progress(self) -> dict:
+        done = self.copied + self.skipped
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        rate = self.copied / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - done)
+        return {
+            "id": self.id,
+            "state": self.state,
+            "source": self.source.name,
+            "target": self.target.name,
+            "model": self.target_ef.model_id,
+            "reembed": self.reembed,
+            "total": self.total,
+            "copied": self.copied,
+            "skipped": self.skipped,
+            "mirrored": self.mirrored,
+            "percent": round(100.0 * done / self.total, 1) if self.total else (100.0 if self.state == "succeeded" else 0.0),
+            "docs_per_second": round(rate, 1),
+            "eta_seconds": round(remaining / rate, 1) if self.state == "running" and rate > 0 else None,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class Reindexer:
+    """Runs one collection rebuild at a time on a background thread.
+
+    activate(collection, embedding_function) is called with writes paused
+    to make the application serve the new collection; should_yield() is
+    polled before every batch and holds the copy back while it is true.
+    """
+
+    def __init__(
+        self,
+        client,
+        chroma_path: str,
+        gate: WriteGate,
+        activate: Callable,
+        should_yield: Callable[[], bool] = lambda: False,
+        batch_size: int = 256,
+        workers: int = 2,
+        max_docs_per_second: float = 0,
+        retire_delay: float = 30.0,
+    ):
+        self.client = client
+        self.chroma_path = chroma_path
+        self.gate = gate
+        self.activate = activate
+        self.should_yield = should_yield
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_docs_per_second = max_docs_per_second
+        self.retire_delay = retire_delay
+        self.current: Optional[ReindexJob] = None
+        self.last: Optional[ReindexJob] = None
+        self._lock = threading.Lock()
+        # Orders copied batches against mirrored writes
+        self._write_lock = threading.Lock()
+        self._throttle_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, client, chroma_path: str, gate: WriteGate, activate: Callable,
+                 should_yield: Callable[[], bool] = lambda: False) -> "Reindexer":
+        return cls(
+            client,
+            chroma_path,
+            gate,
+            activate,
+            should_yield,
+            int(os.getenv("REINDEX_BATCH_SIZE", 256)),
+            int(os.getenv("REINDEX_WORKERS", 2)),
+            float(os.getenv("REINDEX_MAX_DOCS_PER_SEC", 0)),
+            float(os.getenv("REINDEX_RETIRE_DELAY", 30)),
+        )
+
+    def status(self) -> dict:
+        return {
+            "running": self.current.progress() if self.current is not None else None,
+            "last": self.last.progress() if self.last is not None else None,
+        }
+
+    def start(
+        self,
+        source,
+        source_ef: LocalOnnxEmbeddingFunction,
+        target_ef: LocalOnnxEmbeddingFunction,
+        metadata: dict,
+        base_name: str,
+        reembed: Optional[bool] = None,
+        batch_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        max_docs_per_second: Optional[float] = None,
+    ) -> str:
+        """Create the target collection and start copying into it; returns the job ID"""
+        with self._lock:
+            if self.current is not None:
+                raise ReindexInProgress(self.current.id)
+            job_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + uuid.uuid4().hex[:6]
+            self._drop_leftovers(base_name, source.name)
+            target = self.client.create_collection(
+                name=f"{base_name}-{job_id}",
+                metadata=dict(metadata, **embedding_metadata(target_ef)),
+                embedding_function=target_ef,
+            )
+            if reembed is None:
+                reembed = target_ef.model_id != source_ef.model_id
+            job = ReindexJob(job_id, source, target, target_ef, reembed)
+            self.current = job
+        threading.Thread(
+            target=self._run,
+            args=(job, batch_size or self.batch_size, workers or self.workers,
+                  self.max_docs_per_second if max_docs_per_second is None else max_docs_per_second),
+            daemon=True,
+        ).start()
+        return job_id
+
+    def cancel(self) -> Optional[str]:
+        """Stop the running rebuild and drop its collection; returns its ID"""
+        job = self.current
+        if job is None:
+            return None
+        job.cancelled.set()
+        return job.id
+
+    def _drop_leftovers(self, base_name: str, active_name: str):
+        # Unfinished targets, and sources whose drop a restart interrupted
+        for collection in self.client.list_collections():
+            name = collection.name
+            if (name == base_name or name.startswith(f"{base_name}-")) and name != active_name:
+                logger.info(f"Dropping collection {name} left by an earlier rebuild")
+                self.client.delete_collection(name)
+
+    # Mirroring
+
+    def mirror(self, operation: str, kwargs: dict, embedded: List[int]):
+        """Apply a live write to the collection being built (call with the write gate held).
+
+        embedded lists the documents whose embeddings the live model
+        computed; they are embedded again when the target model differs.
+        """
+        job = self.current
+        if job is None or job.state != "running":
+            return
+        try:
+            kwargs = dict(kwargs)
+            if job.reembed and embedded:
+                embeddings = list(kwargs["embeddings"])
+                vectors = job.target_ef([kwargs["documents"][i] for i in embedded])
+                for i, vector in zip(embedded, vectors):
+                    embeddings[i] = vector
+                kwargs["embeddings"] = embeddings
+            with self._write_lock:
+                if operation == "add":
+                    # An add of an existing ID leaves the live text alone, and so does the copy
+                    job.target.add(**kwargs)
+                else:
+                    job.dirty.update(kwargs["ids"])
+                    if operation == "delete":
+                        job.target.delete(**kwargs)
+                    else:
+                        job.target.upsert(**kwargs)
+                job.mirrored += len(kwargs["ids"])
+        except Exception as e:
+            # The new collection would miss this write; it must not be switched to
+            logger.exception(f"Rebuild {job.id} failed to mirror a write")
+            job.error = f"Failed to mirror a write: {e}"
+            job.cancelled.set()
+
+    # Copying
+
+    def _run(self, job: ReindexJob, batch_size: int, workers: int, max_docs_per_second: float):
+        try:
+            ids = job.source.get(include=[])["ids"]
+            job.total = len(ids)
+            throttle = Throttle(max_docs_per_second)
+            batches = [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+            with ThreadPoolExecutor(max(1, workers), "reindex") as executor:
+                running = set()
+                for batch in batches:
+                    if len(running) >= workers:
+                        done, running = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    if job.cancelled.is_set():
+                        break
+                    running.add(executor.submit(self._copy_batch, job, batch, throttle))
+                for future in running:
+                    future.result()
+            if job.cancelled.is_set():
+                raise RuntimeError(job.error or "Cancelled")
+            self._switch(job)
+        except Exception as e:
+            job.state = "cancelled" if job.cancelled.is_set() and job.error is None else "failed"
+            job.error = job.error or str(e)
+            job.finished_at = time.time()
+            if job.state == "failed":
+                logger.exception(f"Rebuild {job.id} failed")
+            self._drop(job.target)
+            with self._lock:
+                self.current, self.last = None, job
+            return
+
+        with self._lock:
+            self.current, self.last = None, job
+        # Reads that started on the old collection finish before it goes away
+        time.sleep(self.retire_delay)
+        self._drop(job.source)
+
+    def _copy_batch(self, job: ReindexJob, batch: List[str], throttle: Throttle):
+        waited = 0.0
+        while self.should_yield() and waited < MAX_YIELD and not job.cancelled.is_set():
+            time.sleep(0.05)
+            waited += 0.05
+        if job.cancelled.is_set():
+            return
+
+        include = ["documents", "metadatas"] if job.reembed else ["documents", "metadatas", "embeddings"]
+        page = job.source.get(ids=batch, include=include)
+        if page["ids"]:
+            embeddings = job.target_ef(page["documents"]) if job.reembed else page["embeddings"]
+            with self._write_lock:
+                keep = [i for i, doc_id in enumerate(page["ids"]) if doc_id not in job.dirty]
+                if keep:
+                    job.target.upsert(
+                        ids=[page["ids"][i] for i in keep],
+                        documents=[page["documents"][i] for i in keep],
+                        metadatas=[page["metadatas"][i] for i in keep],
+                        embeddings=[embeddings[i] for i in keep],
+                    )
+                job.copied += len(keep)
+                job.skipped += len(batch) - len(keep)
+        else:
+            with self._write_lock:
+                job.skipped += len(batch)
+
+        with self._throttle_lock:
+            throttle.consume(len(batch))
+
+    def _switch(self, job: ReindexJob):
+        with self.gate.pause():
+            # No write is in flight, so nothing is left to mirror
+            job.state = "switching"
+            write_active_collection(self.chroma_path, job.target.name)
+            self.activate(job.target, job.target_ef)
+            job.state = "succeeded"
+            job.finished_at = time.time()
+        logger.info(f"Rebuild {job.id} done: serving {job.target.name} ({job.copied} copied, {job.mirrored} mirrored)")
+
+    def _drop(self, collection):
+        try:
+            self.client.delete_collection(collection.name)
+        except Exception as e:
+            logger.warning(f"Failed to drop collection {collection.name}: {e}")
@@ -0,0 +1,329 @@
+"""
+Read replicas serving searches from the writer's snapshots.
+
+Only one process can own a Chroma persistence directory, so the service
+runs as one writer (``SERVICE_ROLE=writer``, the default) and any number
+of read replicas (``SERVICE_ROLE=replica``):
+
+1. The writer takes an incremental snapshot every
+   ``BACKUP_INTERVAL_SECONDS`` into ``BACKUP_DIR`` (see backup.py), a
+   directory the replicas can read: the same disk on one machine, a
+   shared volume across nodes.
+2. Every ``REPLICA_REFRESH_SECONDS`` a replica looks for a newer
+   snapshot, restores it into a fresh directory under ``REPLICA_PATH``,
+   opens it with its own Chroma client, builds its text indexes and
+   swaps it in. Requests keep using the previous copy until the swap;
+   it is closed and deleted after ``REPLICA_RETIRE_DELAY`` seconds.
+3. Reads (``/get``, ``/search``, ``/export``, ``/duplicates``) are served
+   from the copy. Write routes, ingest jobs, backups and rebuilds are
+   forwarded to ``REPLICA_WRITER_URL`` with the caller's headers and
+   body, so clients may send everything to any process.
+
+A replica's lag is the age of the snapshot it serves: writes the writer
+acknowledged after that snapshot started are not visible yet. It stays
+below the snapshot interval plus the refresh interval plus the time a
+snapshot and a restore take.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from chromadb.api.client import SharedSystemClient
+from starlette.concurrency import run_in_threadpool
+
+from backup import list_snapshots, restore
+from compression import CompressionConfig
+
+logger = logging.getLogger(__name__)
+
+# Reads that send their arguments in a POST body; every other POST, PUT, PATCH and DELETE is a write
+READ_POSTS = {"/search/vector", "/search/batch", "/get/batch", "/admin/hnsw/sweep"}
+
+# Routes whose state only the writer has, whatever their method
+WRITER_PREFIXES = ("/ingest", "/admin/backup", "/admin/reindex")
+
+# Headers that describe one connection, not the request or response
+HOP_BY_HOP = {"connection", "keep-alive", "transfer-encoding", "te", "upgrade", "host", "content-length"}
+
+
+def close_client(client):
+    """Stop a Chroma client's system so its indexes and file handles are released"""
+    system = SharedSystemClient._identifer_to_system.pop(client._identifier, None)
+    if system is not None:
+        system.stop()
+
+
+def snapshot_age(manifest: Optional[dict]) -> Optional[float]:
+    if manifest is None:
+        return None
+    return max(0.0, time.time() - datetime.fromisoformat(manifest["created_at"]).timestamp())
+
+
+def file_hashes(manifest: dict) -> dict:
+    return {rel: entry["sha256"] for rel, entry in manifest["files"].items()}
+
+
+def writer_stats(backup_dir: str, interval: float) -> dict:
+    """Replication stats of the writer: how often it snapshots and how old its latest snapshot is"""
+    snapshots = list_snapshots(backup_dir)
+    latest = snapshots[-1] if snapshots else None
+    return {
+        "role": "writer",
+        "snapshot_interval_seconds": interval,
+        "latest_snapshot": latest["id"] if latest else None,
+        "latest_snapshot_age_seconds": snapshot_age(latest),
+    }
+
+
+class WriterUnavailable(Exception):
+    """The writer could not be reached"""
+
+
+class Replica:
+    """Keeps a read-only copy of the writer's latest snapshot and forwards writes to the writer.
+
+    open_copy(path) is called on the refresh thread with a restored
+    snapshot; it must start serving it and return the Chroma client it
+    replaces, which is closed after the retire delay.
+    """
+
+    def __init__(
+        self,
+        backup_dir: str,
+        path: str,
+        writer_url: str,
+        refresh_seconds: float = 10.0,
+        retire_delay: float = 30.0,
+        forward_timeout: float = 120.0,
+        max_lag_seconds: float = 0,
+    ):
+        self.backup_dir = backup_dir
+        self.path = path
+        self.writer_url = writer_url.rstrip("/")
+        self.refresh_seconds = refresh_seconds
+        self.retire_delay = retire_delay
+        self.forward_timeout = forward_timeout
+        # Lag above which /health reports degraded (0: never)
+        self.max_lag_seconds = max_lag_seconds
+        self.snapshot: Optional[dict] = None
+        self.copy_path: Optional[str] = None
+        self.refreshed_at: Optional[float] = None
+        self.refresh_duration: Optional[float] = None
+        self.refreshes = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._forwarded = 0
+        self._forward_errors = 0
+        self._lock_file = None
+
+    @classmethod
+    def from_env(cls) -> "Replica":
+        writer_url = os.getenv("REPLICA_WRITER_URL")
+        if not writer_url:
+            raise ValueError("SERVICE_ROLE=replica requires REPLICA_WRITER_URL")
+        return cls(
+            os.getenv("BACKUP_DIR", "./backups"),
+            os.getenv("REPLICA_PATH", "./replica_store"),
+            writer_url,
+            float(os.getenv("REPLICA_REFRESH_SECONDS", 10)),
+            float(os.getenv("REPLICA_RETIRE_DELAY", 30)),
+            float(os.getenv("REPLICA_FORWARD_TIMEOUT", 120)),
+            float(os.getenv("REPLICA_MAX_LAG_SECONDS", 0)),
+        )
+
+    # Snapshot copies
+
+    def prepare(self) -> str:
+        """Directory of the copy to open at startup: the latest snapshot, or an empty store before the first one"""
+        os.makedirs(self.path, exist_ok=True)
+        self._lock_file = open(os.path.join(self.path, ".lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f"{self.path} is used by another replica; give each replica its own REPLICA_PATH")
+
+        snapshots = list_snapshots(self.backup_dir)
+        latest = snapshots[-1] if snapshots else None
+        copy_path = os.path.join(self.path, latest["id"] if latest else "empty")
+        # Copies left by a previous run are stale, except one of the latest snapshot (restores are atomic)
+        for name in os.listdir(self.path):
+            if name != ".lock" and os.path.join(self.path, name) != copy_path:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        if latest is not None and not os.path.isdir(copy_path):
+            restore(self.backup_dir, copy_path, latest["id"])
+        os.makedirs(copy_path, exist_ok=True)
+        self.snapshot, self.copy_path = latest, copy_path
+        self.refreshed_at = time.time()
+        return copy_path
+
+    def start(self, open_copy: Callable[[str], object]):
+        """Refresh from newer snapshots every refresh_seconds on a background thread"""
+        threading.Thread(target=self._run, args=(open_copy,), daemon=True).start()
+
+    def _run(self, open_copy: Callable[[str], object]):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                self.refresh(open_copy)
+                self.last_error = None
+            except Exception as e:
+                logger.exception("Replica refresh failed")
+                self.last_error = str(e)
+
+    def refresh(self, open_copy: Callable[[str], object]) -> bool:
+        """Serve the latest snapshot if it is newer than the current copy (blocking)"""
+        snapshots = list_snapshots(self.backup_dir)
+        if not snapshots or self.snapshot is not None and snapshots[-1]["id"] == self.snapshot["id"]:
+            return False
+        started = time.monotonic()
+        manifest = snapshots[-1]
+        if self.snapshot is not None and file_hashes(manifest) == file_hashes(self.snapshot):
+            # Nothing changed since the served snapshot; only the lag moves
+            with self._lock:
+                self.snapshot = manifest
+            return False
+        copy_path = os.path.join(self.path, manifest["id"])
+        restore(self.backup_dir, copy_path, manifest["id"], force=True)
+        try:
+            previous_client = open_copy(copy_path)
+        except Exception:
+            shutil.rmtree(copy_path, ignore_errors=True)
+            raise
+        previous_path, self.copy_path = self.copy_path, copy_path
+        with self._lock:
+            self.snapshot = manifest
+            self.refreshed_at = time.time()
+            self.refresh_duration = time.monotonic() - started
+            self.refreshes += 1
+        logger.info(f"Replica serving snapshot {manifest['id']} (refresh took {self.refresh_duration:.1f}s)")
+        # Requests that started on the previous copy finish before it goes away
+        timer = threading.Timer(self.retire_delay, self._retire, args=(previous_client, previous_path))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def _retire(self, client, path: Optional[str]):
+        try:
+            if client is not None:
+                close_client(client)
+        finally:
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def lag(self) -> Optional[float]:
+        """Age of the served snapshot in seconds (None before the first one)"""
+        return snapshot_age(self.snapshot)
+
+    def lagging(self) -> bool:
+        lag = self.lag()
+        return self.max_lag_seconds > 0 and (lag is None or lag > self.max_lag_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "role": "replica",
+                "writer": self.writer_url,
+                "snapshot": self.snapshot["id"] if self.snapshot else None,
+                "snapshot_created_at": self.snapshot["created_at"] if self.snapshot else None,
+                "lag_seconds": self.lag(),
+                "refresh_seconds": self.refresh_seconds,
+                "refreshed_at": self.refreshed_at,
+                "last_refresh_duration": self.refresh_duration,
+                "refreshes": self.refreshes,
+                "last_error": self.last_error,
+                "forwarded": self._forwarded,
+                "forward_errors": self._forward_errors,
+            }
+
+    # Forwarding
+
+    def forwards(self, method: str, path: str) -> bool:
+        """Whether a request belongs to the writer"""
+        if path.startswith(WRITER_PREFIXES):
+            return True
+        return method not in ("GET", "HEAD", "OPTIONS") and path not in READ_POSTS
+
+    def forward(self, method: str, path: str, headers: List[Tuple[str, str]],
+                body: bytes) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """Send a request to the writer and return its status, headers and body (blocking)"""
+        request = urllib.request.Request(
+            self.writer_url + path,
+            data=body or None,
+            headers={name: value for name, value in headers if name.lower() not in HOP_BY_HOP},
+            method=method,
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.forward_timeout) as reply:
+                status, reply_headers, content = reply.status, reply.headers.items(), reply.read()
+        except urllib.error.HTTPError as e:
+            # Error statuses are answers too; they go back to the client unchanged
+            status, reply_headers, content = e.code, e.headers.items(), e.read()
+        except (urllib.error.URLError, OSError) as e:
+            with self._lock:
+                self._forward_errors += 1
+            raise WriterUnavailable(str(getattr(e, "reason", e))) from e
+        with self._lock:
+            self._forwarded += 1
+        return status, [(name, value) for name, value in reply_headers if name.lower() not in HOP_BY_HOP], content
+
+
+class WriterForwardingMiddleware:
+    """Passes write requests through to the writer untouched: compressed bodies, auth and errors included"""
+
+    def __init__(self, app, replica: Replica, max_body_size: Optional[int] = None):
+        self.app = app
+        self.replica = replica
+        # Bodies are buffered before forwarding; the same cap as the compression middleware (MAX_DECOMPRESSED_BODY)
+        self.max_body_size = CompressionConfig().max_request_size if max_body_size is None else max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.replica.forwards(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > self.max_body_size:
+                await _reply(send, 413, [("content-type", "application/json")],
+                             json.dumps({"detail": "Request body too large"}).encode())
+                return
+            if not message.get("more_body"):
+                break
+        # Some servers leave the query string in raw_path; it is appended once below
+        path = (scope.get("raw_path") or scope["path"].encode("latin-1")).partition(b"?")[0]
+        if scope.get("query_string"):
+            path += b"?" + scope["query_string"]
+        headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]]
+
+        try:
+            status, reply_headers, content = await run_in_threadpool(
+                self.replica.forward, scope["method"], path.decode("latin-1"), headers, b"".join(chunks)
+            )
+        except WriterUnavailable as e:
+            status, content = 502, json.dumps({"detail": f"Writer unavailable: {e}"}).encode()
+            reply_headers = [("content-type", "application/json")]
+        await _reply(send, status, reply_headers, content)
+
+
+async def _reply(send, status: int, headers: List[Tuple[str, str]], content: bytes):
+    headers = headers + [("content-length", str(len(content)))]
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+    })
+    await send({"type": "http.response.body", "body": content})
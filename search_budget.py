@@ -0,0 +1,138 @@
+"""
+Time budgets for searches.
+
+Every search gets a deadline: the request's ``timeout_ms``, or
+``SEARCH_TIMEOUT_MS`` (default 10s) when it sends none, capped at
+``SEARCH_MAX_TIMEOUT_MS``. A slow query or an overloaded node then costs
+its client a bounded wait instead of a connection held until the client
+gives up and retries, adding to the load.
+
+- Work that loops (store scans, trigram candidate checks, quantized
+  vector blocks) polls ``Deadline.exceeded()`` between steps and stops
+  early, keeping the best results found so far.
+- Work that cannot poll (a Chroma query) runs on a ``SearchExecutor`` and
+  is abandoned when the deadline passes: a call still queued is
+  cancelled, a running one finishes in the background and its result is
+  dropped. Its threads are dedicated to search, so abandoned calls never
+  hold up the writes on the shared threadpool.
+
+A response cut short carries ``X-Search-Partial: true`` (``"partial":
+true`` in a WebSocket reply).
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import Response
+
+PARTIAL_HEADER = "X-Search-Partial"
+
+
+class SearchTimeout(Exception):
+    """The deadline passed before abandoned search work finished"""
+
+
+class Deadline:
+    """Point in time a search must answer by; work polls exceeded() and stops early"""
+
+    __slots__ = ("expires_at", "partial")
+
+    def __init__(self, timeout_ms: Optional[float]):
+        self.expires_at = time.monotonic() + timeout_ms / 1000.0 if timeout_ms else None
+        # Set once some work stopped short because of the deadline
+        self.partial = False
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a budget"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def exceeded(self) -> bool:
+        """True once the budget is spent; the caller is expected to stop, so the results become partial"""
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.partial = True
+        return self.partial
+
+
+class SearchBudget:
+    """Default and maximum search budgets, and how often they ran out"""
+
+    def __init__(self, default_timeout_ms: int = 10000, max_timeout_ms: int = 60000):
+        self.default_timeout_ms = default_timeout_ms
+        self.max_timeout_ms = max_timeout_ms
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._partial = 0
+
+    @classmethod
+    def from_env(cls) -> "SearchBudget":
+        return cls(
+            int(os.getenv("SEARCH_TIMEOUT_MS", 10000)),
+            int(os.getenv("SEARCH_MAX_TIMEOUT_MS", 60000)),
+        )
+
+    def deadline(self, timeout_ms: Optional[int] = None) -> Deadline:
+        """Deadline for a search starting now (0 budgets mean no deadline)"""
+        timeout_ms = self.default_timeout_ms if timeout_ms is None else timeout_ms
+        if self.max_timeout_ms:
+            timeout_ms = min(timeout_ms, self.max_timeout_ms) if timeout_ms else self.max_timeout_ms
+        return Deadline(timeout_ms)
+
+    def finish(self, deadline: Deadline, response: Response):
+        """Count the search and flag its response when the results are partial"""
+        with self._lock:
+            self._searches += 1
+            self._partial += deadline.partial
+        if deadline.partial:
+            response.headers[PARTIAL_HEADER] = "true"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "default_timeout_ms": self.default_timeout_ms,
+                "max_timeout_ms": self.max_timeout_ms,
+                "searches": self._searches,
+                "partial": self._partial,
+            }
+
+
+class SearchExecutor:
+    """Dedicated search threads whose calls are abandoned, not awaited, past their deadline"""
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="search")
+        self._lock = threading.Lock()
+        self._cancelled = 0
+        self._abandoned = 0
+
+    @classmethod
+    def from_env(cls) -> "SearchExecutor":
+        return cls(int(os.getenv("SEARCH_WORKERS", 4)))
+
+    async def run(self, deadline: Deadline, fn, /, *args, **kwargs):
+        """Call fn on a search thread; raises SearchTimeout if the deadline passes first"""
+        # Carry the request's context (its trace) onto the search thread
+        context = contextvars.copy_context()
+        future = self._pool.submit(context.run, functools.partial(fn, *args, **kwargs))
+        try:
+            # Cancelling the wrapper on timeout also cancels the call if it has not started
+            return await asyncio.wait_for(asyncio.wrap_future(future), deadline.remaining())
+        except asyncio.TimeoutError:
+            deadline.partial = True
+            with self._lock:
+                if future.cancelled():
+                    self._cancelled += 1
+                else:
+                    self._abandoned += 1
+            raise SearchTimeout() from None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "cancelled": self._cancelled, "abandoned": self._abandoned}
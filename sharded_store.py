@@ -0,0 +1,257 @@
+"""
+Thread-safe, lock-sharded document store.
+
+Documents are spread over ``CompactDocumentStore`` shards by a hash of
+their ID. Each shard has a readers-writer lock, so writes to different
+shards proceed in parallel and point reads never wait for each other.
+
+``scan`` read-locks every shard for the duration of a search, so it sees
+one consistent snapshot; writes queue behind it (and new scans queue
+behind waiting writes, so writers are not starved). Shards are scanned in
+parallel on a thread pool when that helps: on free-threaded builds, or
+when the scan function releases the GIL.
+
+With a memory budget, shards are ``TieredDocumentStore``s sharing the
+budget equally: cold texts spill to disk, and texts a point read found on
+disk are promoted back under the shard's write lock once the read is done.
+"""
+import os
+import sys
+import threading
+import zlib
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple, TypeVar
+
+from compact_store import CompactDocumentStore
+from tiered_store import TieredDocumentStore
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+def gil_enabled() -> bool:
+    is_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_enabled is None else is_enabled()
+
+
+class RWLock:
+    """Readers-writer lock; waiting writers block new readers"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class _Shard:
+    __slots__ = ("store", "lock")
+
+    def __init__(self, store: CompactDocumentStore):
+        self.store = store
+        self.lock = RWLock()
+
+
+class ShardedDocumentStore(MutableMapping):
+    """Dict-like ``id -> text`` store that is safe to use from many threads"""
+
+    def __init__(self, shards: int = 16, scan_threads: Optional[int] = None,
+                 memory_budget: int = 0, spill_dir: Optional[str] = None):
+        shards = max(1, shards)
+        # memory_budget caps resident text bytes across all shards; 0 keeps everything in RAM
+        self.memory_budget = max(0, memory_budget)
+        if self.memory_budget:
+            self._shards = [
+                _Shard(TieredDocumentStore(self.memory_budget // shards, spill_dir)) for _ in range(shards)
+            ]
+        else:
+            self._shards = [_Shard(CompactDocumentStore()) for _ in range(shards)]
+        if scan_threads is None:
+            # Parallel Python scans only pay off without the GIL
+            scan_threads = min(len(self._shards), os.cpu_count() or 1) if not gil_enabled() else 1
+        self.scan_threads = max(1, scan_threads)
+        self._executor = ThreadPoolExecutor(self.scan_threads, "store-scan") if self.scan_threads > 1 else None
+
+    @classmethod
+    def from_env(cls) -> "ShardedDocumentStore":
+        threads = os.getenv("STORE_SCAN_THREADS")
+        return cls(
+            int(os.getenv("STORE_SHARDS", 16)),
+            int(threads) if threads else None,
+            int(os.getenv("STORE_MEMORY_BUDGET", 0)),
+            os.getenv("STORE_SPILL_DIR") or None,
+        )
+
+    def _shard(self, doc_id: str) -> _Shard:
+        return self._shards[zlib.crc32(doc_id.encode("utf-8")) % len(self._shards)]
+
+    def _promote(self, shard: _Shard):
+        """Bring texts the last reads found on disk back into RAM"""
+        if self.memory_budget and shard.store.has_pending_promotions:
+            with shard.lock.write():
+                shard.store.promote_pending()
+
+    # Mapping interface; every operation is atomic
+
+    def __len__(self) -> int:
+        return sum(len(shard.store) for shard in self._shards)
+
+    def __contains__(self, doc_id) -> bool:
+        if not isinstance(doc_id, str):
+            return False
+        shard = self._shard(doc_id)
+        with shard.lock.read():
+            return doc_id in shard.store
+
+    def __getitem__(self, doc_id: str) -> str:
+        shard = self._shard(doc_id)
+        with shard.lock.read():
+            text = shard.store[doc_id]
+        self._promote(shard)
+        return text
+
+    def get(self, doc_id: str, default=None):
+        shard = self._shard(doc_id)
+        with shard.lock.read():
+            text = shard.store.get(doc_id, default)
+        self._promote(shard)
+        return text
+
+    def __setitem__(self, doc_id: str, text: str):
+        shard = self._shard(doc_id)
+        with shard.lock.write():
+            shard.store[doc_id] = text
+
+    def put(self, doc_id: str, text: str):
+        """Insert or replace a document (same as item assignment)"""
+        self[doc_id] = text
+
+    def put_many(self, items: List[Tuple[str, str]]):
+        """Insert or replace several documents, taking each shard's lock once"""
+        by_shard: dict = {}
+        for doc_id, text in items:
+            by_shard.setdefault(self._shard(doc_id), []).append((doc_id, text))
+        for shard, pairs in by_shard.items():
+            with shard.lock.write():
+                for doc_id, text in pairs:
+                    shard.store[doc_id] = text
+
+    def get_many(self, doc_ids: List[str]) -> dict:
+        """Texts of the IDs that exist"""
+        found = {}
+        for doc_id in doc_ids:
+            text = self.get(doc_id)
+            if text is not None:
+                found[doc_id] = text
+        return found
+
+    def replace(self, doc_id: str, text: str) -> bool:
+        """Set the text only if doc_id exists; returns whether it did"""
+        shard = self._shard(doc_id)
+        with shard.lock.write():
+            if doc_id not in shard.store:
+                return False
+            shard.store[doc_id] = text
+            return True
+
+    def __delitem__(self, doc_id: str):
+        shard = self._shard(doc_id)
+        with shard.lock.write():
+            del shard.store[doc_id]
+
+    def pop(self, doc_id: str, default=_MISSING):
+        shard = self._shard(doc_id)
+        with shard.lock.write():
+            if doc_id in shard.store:
+                text = shard.store[doc_id]
+                del shard.store[doc_id]
+                return text
+        if default is _MISSING:
+            raise KeyError(doc_id)
+        return default
+
+    def __iter__(self) -> Iterator[str]:
+        # A list per shard, so no lock is held while the caller iterates
+        for shard in self._shards:
+            with shard.lock.read():
+                ids = list(shard.store)
+            yield from ids
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        for shard in self._shards:
+            with shard.lock.read():
+                pairs = list(shard.store.items())
+            yield from pairs
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock.write():
+                shard.store.clear()
+
+    # Scans
+
+    def scan(self, fn: Callable[[Iterator[Tuple[str, str]]], T]) -> List[T]:
+        """Run fn over every shard's (id, text) pairs against one consistent snapshot.
+
+        Returns one result per shard. Writes wait until the scan completes,
+        so fn must not call back into the store.
+        """
+        with ExitStack() as stack:
+            # Shards are always locked in the same order; writers hold one lock at a time
+            for shard in self._shards:
+                stack.enter_context(shard.lock.read())
+            if self._executor is None:
+                return [fn(shard.store.items()) for shard in self._shards]
+            futures = [self._executor.submit(fn, shard.store.items()) for shard in self._shards]
+            return [future.result() for future in futures]
+
+    def memory_usage(self) -> dict:
+        """Summed byte breakdown of all shards"""
+        totals: dict = {}
+        for shard in self._shards:
+            with shard.lock.read():
+                usage = shard.store.memory_usage()
+            for key, value in usage.items():
+                if key != "bytes_per_document":
+                    totals[key] = totals.get(key, 0) + value
+        count = totals.get("documents", 0)
+        totals["bytes_per_document"] = round(totals.get("total_bytes", 0) / count, 1) if count else 0.0
+        if self.memory_budget:
+            totals["memory_budget"] = self.memory_budget
+            reads = totals["hits"] + totals["misses"]
+            totals["hit_ratio"] = round(totals["hits"] / reads, 4) if reads else None
+        totals["shards"] = len(self._shards)
+        totals["scan_threads"] = self.scan_threads
+        return totals
@@ -0,0 +1,21 @@
+"""
+Shared fixtures.
+
+Run from the repository root: python -m pytest tests
+"""
+import importlib
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def main_app(tmp_path_factory):
+    """main.py imported once, against an empty store in a temporary directory"""
+    pytest.importorskip("chromadb")
+    root = tmp_path_factory.mktemp("main_app")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("CHROMA_PATH", str(root / "chroma_store"))
+        patch.setenv("BACKUP_DIR", str(root / "backups"))
+        patch.setenv("API_KEY", "test-key")
+        patch.setenv("RATE_LIMIT_PER_SECOND", "0")
+        return importlib.import_module("main")
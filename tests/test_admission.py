@@ -0,0 +1,84 @@
+"""
+Tests for the API key registry and admission control.
+
+Run from the repository root: python -m pytest tests
+"""
+import json
+
+import pytest
+
+from admission import ALL_SCOPES, DEFAULT_SCOPES, AdmissionController, AdmissionRejected, ApiKey, KeyRing, TokenBucket
+
+
+def _key(rate=0.0, burst=1.0, concurrency=0):
+    return ApiKey("client", "secret", rate, burst, concurrency)
+
+
+def test_keys_from_every_source(monkeypatch, tmp_path):
+    path = tmp_path / "keys.json"
+    path.write_text(json.dumps([{"name": "ops", "key": "s3", "rate": 5, "concurrency": 2, "scopes": ["admin"]}]))
+    monkeypatch.setenv("API_KEY", "legacy")
+    monkeypatch.setenv("API_KEYS", "alice:s1, s2")
+    monkeypatch.setenv("API_KEYS_FILE", str(path))
+    monkeypatch.setenv("RATE_LIMIT_PER_SECOND", "7")
+
+    keys = KeyRing.from_env().keys
+    assert [key.name for key in keys] == ["default", "alice", "key-2", "ops"]
+    assert keys[0].scopes == frozenset(ALL_SCOPES)
+    assert keys[1].scopes == frozenset(DEFAULT_SCOPES)
+    assert keys[1].bucket.rate == 7
+    assert (keys[3].bucket.rate, keys[3].concurrency) == (5, 2)
+    assert keys[3].has_scope("admin") and not keys[3].has_scope("write")
+
+
+def test_authenticate_matches_only_the_exact_secret(monkeypatch):
+    monkeypatch.delenv("API_KEY", raising=False)
+    monkeypatch.delenv("API_KEYS_FILE", raising=False)
+    monkeypatch.setenv("API_KEYS", "alice:one,bob:two")
+    ring = KeyRing.from_env()
+    assert ring.authenticate("two").name == "bob"
+    assert ring.authenticate("tw") is None
+    assert ring.authenticate("") is None
+    assert KeyRing([]).authenticate("one") is None
+
+
+def test_token_bucket_allows_a_burst_then_waits():
+    bucket = TokenBucket(rate=2.0, burst=3.0)
+    assert [bucket.try_take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = bucket.try_take()
+    assert 0 < wait <= 0.5
+    assert TokenBucket(rate=0, burst=0).try_take() == 0.0
+
+
+def test_global_cap_sheds_with_503():
+    admission = AdmissionController(max_in_flight=1)
+    first, second = _key(), _key()
+    admission.admit(first)
+    with pytest.raises(AdmissionRejected) as error:
+        admission.admit(second)
+    assert error.value.status_code == 503
+    assert error.value.headers == {"Retry-After": "1"}
+    admission.release(first)
+    admission.admit(second)
+    assert admission.snapshot() == {"in_flight": 1, "max_in_flight": 1, "admitted": 2, "shed": 1, "rate_limited": 0}
+
+
+def test_per_key_concurrency_and_rate_give_429():
+    admission = AdmissionController(max_in_flight=0)
+    key = _key(concurrency=1)
+    admission.admit(key)
+    with pytest.raises(AdmissionRejected) as error:
+        admission.admit(key)
+    assert error.value.status_code == 429
+    admission.release(key)
+
+    limited = _key(rate=0.5, burst=1)
+    admission.admit(limited)
+    admission.release(limited)
+    with pytest.raises(AdmissionRejected) as error:
+        admission.admit(limited)
+    assert error.value.status_code == 429
+    assert error.value.headers == {"Retry-After": "2"}
+    assert limited.rejected == 1
+    assert admission.snapshot()["rate_limited"] == 2
+    assert (admission.in_flight, key.in_flight, limited.in_flight) == (0, 0, 0)
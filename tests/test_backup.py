@@ -0,0 +1,154 @@
+"""
+Tests for incremental snapshots and restores.
+
+Run from the repository root: python -m pytest tests
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from backup import SQLITE_FILE, BackupManager, WriteGate, list_snapshots, restore
+
+
+def _store(path):
+    """A directory shaped like Chroma's: the SQLite file and one directory per segment"""
+    os.makedirs(path / "segment-a")
+    os.makedirs(path / "segment-b")
+    (path / "segment-a" / "data_level0.bin").write_bytes(b"a" * 1000)
+    (path / "segment-b" / "data_level0.bin").write_bytes(b"b" * 1000)
+    (path / "active_collection").write_text("documents")
+    db = sqlite3.connect(path / SQLITE_FILE)
+    db.execute("CREATE TABLE embeddings (id TEXT PRIMARY KEY, text TEXT)")
+    db.execute("INSERT INTO embeddings VALUES ('1', 'first')")
+    db.commit()
+    db.close()
+
+
+def _manager(tmp_path, keep=0):
+    return BackupManager(str(tmp_path / "store"), str(tmp_path / "backups"), WriteGate(), 0, keep=keep)
+
+
+def _rows(path):
+    db = sqlite3.connect(path / SQLITE_FILE)
+    try:
+        return db.execute("SELECT id, text FROM embeddings ORDER BY id").fetchall()
+    finally:
+        db.close()
+
+
+def test_incremental_snapshot_copies_only_changed_files(tmp_path):
+    _store(tmp_path / "store")
+    manager = _manager(tmp_path)
+    first = manager.create_snapshot("s1")
+    assert first["parent"] is None
+    assert first["bytes_copied"] == first["bytes_total"]
+
+    time.sleep(0.01)
+    (tmp_path / "store" / "segment-b" / "data_level0.bin").write_bytes(b"c" * 1000)
+    second = manager.create_snapshot("s2")
+    assert second["parent"] == "s1"
+    files = second["files"]
+    assert files["segment-a/data_level0.bin"]["stored_in"] == "s1"
+    assert files["segment-b/data_level0.bin"]["stored_in"] == "s2"
+    assert files["active_collection"]["stored_in"] == "s1"
+    assert not os.path.exists(tmp_path / "backups" / "s2" / "files" / "segment-a")
+
+    full = manager.create_snapshot("s3", full=True)
+    assert full["parent"] is None
+    assert {entry["stored_in"] for entry in full["files"].values()} == {"s3"}
+    assert [m["id"] for m in list_snapshots(str(tmp_path / "backups"))] == ["s1", "s2", "s3"]
+
+
+def test_restore_walks_the_snapshot_chain(tmp_path):
+    _store(tmp_path / "store")
+    manager = _manager(tmp_path)
+    manager.create_snapshot("s1")
+    db = sqlite3.connect(tmp_path / "store" / SQLITE_FILE)
+    db.execute("INSERT INTO embeddings VALUES ('2', 'second')")
+    db.commit()
+    db.close()
+    manager.create_snapshot("s2")
+
+    target = tmp_path / "restored"
+    assert restore(str(tmp_path / "backups"), str(target))["id"] == "s2"
+    assert _rows(target) == [("1", "first"), ("2", "second")]
+    assert (target / "segment-a" / "data_level0.bin").read_bytes() == b"a" * 1000
+    assert (target / "active_collection").read_text() == "documents"
+
+    with pytest.raises(ValueError, match="already exists"):
+        restore(str(tmp_path / "backups"), str(target), "s1")
+    restore(str(tmp_path / "backups"), str(target), "s1", force=True)
+    assert _rows(target) == [("1", "first")]
+
+
+def test_restore_rejects_corrupt_and_unknown_snapshots(tmp_path):
+    _store(tmp_path / "store")
+    _manager(tmp_path).create_snapshot("s1")
+    with pytest.raises(ValueError, match="not found"):
+        restore(str(tmp_path / "backups"), str(tmp_path / "restored"), "nope")
+
+    (tmp_path / "backups" / "s1" / "files" / "segment-a" / "data_level0.bin").write_bytes(b"tampered")
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        restore(str(tmp_path / "backups"), str(tmp_path / "restored"))
+    assert not os.path.exists(tmp_path / "restored")
+    assert [name for name in os.listdir(tmp_path) if ".restore-" in name] == []
+
+    with pytest.raises(ValueError, match="No snapshots"):
+        restore(str(tmp_path / "empty"), str(tmp_path / "restored"))
+
+
+def test_prune_keeps_snapshots_that_kept_ones_reference(tmp_path):
+    _store(tmp_path / "store")
+    manager = _manager(tmp_path)
+    manager.create_snapshot("s1")
+    manager.create_snapshot("s2", full=True)
+    manager.create_snapshot("s3")
+    # s3 references s2's files, s1 is referenced by nothing kept
+    assert manager.prune(2) == ["s1"]
+    assert manager.prune(1) == []
+    assert [m["id"] for m in list_snapshots(str(tmp_path / "backups"))] == ["s2", "s3"]
+
+
+def test_background_snapshot_and_status(tmp_path):
+    _store(tmp_path / "store")
+    manager = _manager(tmp_path, keep=1)
+    manager.start()
+    deadline = time.monotonic() + 10
+    while manager.current is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    status = manager.status()
+    assert status["running"] is None
+    assert status["last_error"] is None
+    assert len(status["snapshots"]) == 1
+
+
+def test_pause_waits_for_running_writes():
+    gate = WriteGate()
+    events = []
+    writing = threading.Event()
+    finish = threading.Event()
+
+    def writer():
+        with gate.write():
+            writing.set()
+            finish.wait(5)
+            events.append("write done")
+
+    def pauser():
+        with gate.pause():
+            events.append("paused")
+
+    first = threading.Thread(target=writer)
+    first.start()
+    writing.wait(5)
+    backup = threading.Thread(target=pauser)
+    backup.start()
+    time.sleep(0.05)
+    assert events == []
+    finish.set()
+    first.join()
+    backup.join()
+    assert events == ["write done", "paused"]
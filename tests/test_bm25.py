@@ -0,0 +1,117 @@
+"""
+Tests for the BM25 index and reciprocal rank fusion.
+
+Run from the repository root: python -m pytest tests
+"""
+import threading
+import time
+
+import pytest
+
+from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from search_budget import Deadline
+
+
+def _index(**documents):
+    index = BM25Index()
+    index.load(documents.items())
+    return index
+
+
+def test_tokenize_lowercases_and_splits_on_non_word_characters():
+    assert tokenize("Hello, World! foo_bar v2.0") == ["hello", "world", "foo_bar", "v2", "0"]
+    assert tokenize("  ...  ") == []
+
+
+def test_rare_terms_outrank_common_ones():
+    index = _index(
+        a="the cat sat on the mat",
+        b="the dog sat on the log",
+        c="the zebra",
+    )
+    assert [doc_id for doc_id, _ in index.search("the zebra", 3)][0] == "c"
+    assert {doc_id for doc_id, _ in index.search("sat", 3)} == {"a", "b"}
+    assert index.search("unicorn", 3) == []
+    assert index.search("", 3) == []
+
+
+def test_shorter_documents_score_higher_for_the_same_term_frequency():
+    index = _index(short="apple pie", long="apple " + "filler " * 50)
+    [(best, best_score), (_, other_score)] = index.search("apple", 2)
+    assert best == "short"
+    assert best_score > other_score
+
+
+def test_limit_and_ordering():
+    index = _index(**{f"d{i}": "word " * (i + 1) for i in range(10)})
+    hits = index.search("word", 3)
+    assert len(hits) == 3
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_add_replaces_and_remove_forgets():
+    index = _index(a="red apple")
+    index.add("a", "green pear")
+    assert index.search("apple", 5) == []
+    assert [doc_id for doc_id, _ in index.search("pear", 5)] == ["a"]
+
+    index.add_many([("b", "green grape"), ("c", "green lime")])
+    assert {doc_id for doc_id, _ in index.search("green", 5)} == {"a", "b", "c"}
+
+    index.remove("a")
+    index.remove("missing")
+    assert {doc_id for doc_id, _ in index.search("green", 5)} == {"b", "c"}
+    assert index.stats() == {"documents": 2, "terms": 3, "ready": True}
+    assert index.total_length == 4
+
+
+def test_writes_during_load_win_over_the_loader():
+    index = BM25Index()
+    index.add("a", "fresh text")
+    index.remove("b")
+    index.load([("a", "stale text"), ("b", "deleted text"), ("c", "other text")])
+    assert index.ready
+    assert [doc_id for doc_id, _ in index.search("fresh", 5)] == ["a"]
+    assert index.search("stale", 5) == []
+    assert index.search("deleted", 5) == []
+    assert len(index) == 2
+
+
+def test_expired_deadline_scores_only_the_first_term():
+    index = _index(a="alpha", b="beta")
+    deadline = Deadline(1)
+    time.sleep(0.01)
+    hits = index.search("alpha beta", 5, deadline=deadline)
+    assert len(hits) == 1
+    assert deadline.partial
+    assert len(index.search("alpha beta", 5, deadline=Deadline(None))) == 2
+
+
+def test_writes_proceed_while_a_search_is_scoring():
+    index = _index(**{f"d{i}": "common term" for i in range(100)})
+    writes = []
+
+    class Lengths(dict):
+        """Runs a write on another thread the first time scoring looks up a length"""
+        def get(self, key, default=None):
+            if not writes:
+                writer = threading.Thread(target=index.add, args=("new", "common"))
+                writer.start()
+                writer.join(timeout=5)
+                writes.append(not writer.is_alive())
+            return super().get(key, default)
+
+    with index._lock:
+        index.doc_lengths = Lengths(index.doc_lengths)
+    assert len(index.search("common", 200)) == 100
+    assert writes == [True]
+    assert len(index.search("common", 200)) == 101
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[2][1] == pytest.approx(1 / 62)
+    assert reciprocal_rank_fusion([]) == []
+    assert [doc_id for doc_id, _ in reciprocal_rank_fusion([[], ["x", "y"]])] == ["x", "y"]
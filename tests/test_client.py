@@ -0,0 +1,170 @@
+"""
+Tests for the Python client against an in-process fake server.
+
+Run from the repository root: python -m pytest tests
+"""
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from client import AsyncChromaClient, ChromaApiError, ChromaClient
+
+
+class FakeServer:
+    """Stores adds like the API (409 for a stored ID); can lose the answer to the next writes"""
+
+    def __init__(self, batch=True):
+        self.batch = batch
+        self.documents = {}
+        self.requests = []
+        # Statuses answered to the next writes after storing them, as a proxy timing out would
+        self.lost_answers = []
+        self.busy = 0
+
+    def __call__(self, request):
+        path = request.url.path
+        body = json.loads(request.content) if request.content else None
+        self.requests.append(path)
+        if self.busy:
+            self.busy -= 1
+            return httpx.Response(429, headers={"Retry-After": "0"}, json={"detail": "busy"})
+        if path == "/add":
+            return self._add([body], lambda stored: stored[0])
+        if path == "/add/batch":
+            if not self.batch:
+                return httpx.Response(404, json={"detail": "Not Found"})
+            return self._add(body["documents"], lambda stored: stored)
+        if path == "/get/batch":
+            ids = [known["id"] for known in body["documents"]]
+            return httpx.Response(200, json={
+                "changed": [{"id": i, "text": self.documents[i], "version": 1} for i in ids if i in self.documents],
+                "missing": [i for i in ids if i not in self.documents],
+            })
+        if path == "/search/batch":
+            return httpx.Response(200, json=[[{"id": query}] for query in body["queries"]])
+        if path == "/search":
+            return httpx.Response(200, json=[{"id": request.url.params["query"]}])
+        if path == "/export":
+            lines = "".join(json.dumps({"id": i, "text": t}) + "\n" for i, t in self.documents.items())
+            return httpx.Response(200, content=lines.encode())
+        return httpx.Response(404, json={"detail": "Not Found"})
+
+    def _add(self, documents, answer):
+        for document in documents:
+            if document["id"] in self.documents:
+                return httpx.Response(409, json={"detail": f"Document {document['id']} already exists"})
+        for document in documents:
+            self.documents[document["id"]] = document["text"]
+        stored = [{"id": d["id"], "text": d["text"]} for d in documents]
+        if self.lost_answers:
+            return httpx.Response(self.lost_answers.pop(0), json={"detail": "Bad Gateway"})
+        return httpx.Response(200, json=answer(stored))
+
+
+def _sync_client(server):
+    client = ChromaClient("http://test", "key", backoff=0)
+    client._http = httpx.Client(base_url="http://test", transport=httpx.MockTransport(server))
+    return client
+
+
+def _async_client(server):
+    client = AsyncChromaClient("http://test", "key", backoff=0)
+    client._http = httpx.AsyncClient(base_url="http://test", transport=httpx.MockTransport(server))
+    return client
+
+
+def test_add_generates_ids_and_retries_busy_answers():
+    server = FakeServer()
+    server.busy = 2
+    document = _sync_client(server).add("hello")
+    assert server.documents == {document["id"]: "hello"}
+    assert server.requests == ["/add"] * 3
+
+
+@pytest.mark.parametrize("status", [502, 504])
+def test_resent_add_whose_first_attempt_was_stored_succeeds(status):
+    server = FakeServer()
+    server.lost_answers = [status]
+    assert _sync_client(server).add("hello", id="a") == {"id": "a", "text": "hello"}
+    assert server.requests == ["/add", "/add", "/get/batch"]
+
+
+def test_resent_add_conflicting_with_another_text_still_fails():
+    server = FakeServer()
+    server.documents["a"] = "someone else's text"
+    server.busy = 1
+    with pytest.raises(ChromaApiError) as error:
+        _sync_client(server).add("hello", id="a")
+    assert error.value.status_code == 409
+
+
+def test_first_attempt_conflict_is_not_second_guessed():
+    server = FakeServer()
+    server.documents["a"] = "hello"
+    with pytest.raises(ChromaApiError) as error:
+        _sync_client(server).add("hello", id="a")
+    assert error.value.status_code == 409
+    assert "/get/batch" not in server.requests
+
+
+def test_add_many_batches_and_survives_a_lost_answer():
+    server = FakeServer()
+    server.lost_answers = [502]
+    client = _sync_client(server)
+    client.batch_size = 2
+    results = client.add_many([{"text": "a"}, {"text": "b"}, {"text": "c"}])
+    assert [result["text"] for result in results] == ["a", "b", "c"]
+    assert len(server.documents) == 3
+    assert server.requests.count("/add/batch") == 3
+
+
+def test_missing_batch_endpoint_falls_back_to_single_calls():
+    server = FakeServer(batch=False)
+    client = _sync_client(server)
+    client.add_many([{"text": "a"}, {"text": "b"}])
+    assert sorted(server.documents.values()) == ["a", "b"]
+    assert "/add/batch" in client._unsupported
+    client.add_many([{"text": "c"}])
+    assert server.requests.count("/add/batch") == 1
+
+
+def test_retries_give_up_after_max_retries():
+    server = FakeServer()
+    server.busy = 10
+    with pytest.raises(ChromaApiError) as error:
+        _sync_client(server).add("hello")
+    assert error.value.status_code == 429
+    assert len(server.requests) == 4
+
+
+def test_export_streams_every_document():
+    server = FakeServer()
+    server.documents = {"a": "one", "b": "two"}
+    assert list(_sync_client(server).export()) == [{"id": "a", "text": "one"}, {"id": "b", "text": "two"}]
+
+
+def test_async_adds_coalesce_and_survive_a_lost_answer():
+    server = FakeServer()
+    server.lost_answers = [502]
+
+    async def run():
+        async with _async_client(server) as client:
+            return await asyncio.gather(*(client.add(text) for text in ["a", "b", "c"]))
+
+    results = asyncio.run(run())
+    assert [result["text"] for result in results] == ["a", "b", "c"]
+    assert server.requests == ["/add/batch", "/add/batch", "/get/batch"]
+
+
+def test_async_searches_coalesce():
+    server = FakeServer()
+
+    async def run():
+        async with _async_client(server) as client:
+            return await client.search_many(["x", "y", "z"])
+
+    assert asyncio.run(run()) == [[{"id": "x"}], [{"id": "y"}], [{"id": "z"}]]
+    assert server.requests == ["/search/batch"]
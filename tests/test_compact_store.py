@@ -0,0 +1,34 @@
+"""
+Regression tests for ID handling in the in-memory document stores.
+
+Run from the repository root: python -m pytest tests
+"""
+import pytest
+
+from compact_store import CompactDocumentStore
+from sharded_store import ShardedDocumentStore
+from tiered_store import TieredDocumentStore
+
+# Packs to the 16 raw bytes b"aaaa..." that the 16-character string ID encodes to
+UUID_ID = "61616161-6161-6161-6161-616161616161"
+STRING_ID = "aaaaaaaaaaaaaaaa"
+
+
+@pytest.mark.parametrize("make_store", [
+    CompactDocumentStore,
+    ShardedDocumentStore,
+    lambda: TieredDocumentStore(memory_budget=0),
+], ids=["compact", "sharded", "tiered"])
+def test_uuid_and_string_ids_with_equal_bytes_are_distinct(make_store):
+    store = make_store()
+    store[UUID_ID] = "uuid document"
+    store[STRING_ID] = "string document"
+
+    assert len(store) == 2
+    assert store[UUID_ID] == "uuid document"
+    assert store[STRING_ID] == "string document"
+    assert sorted(store) == sorted([UUID_ID, STRING_ID])
+
+    del store[STRING_ID]
+    assert STRING_ID not in store
+    assert store[UUID_ID] == "uuid document"
@@ -0,0 +1,105 @@
+"""
+Tests for request/response compression.
+
+Run from the repository root: python -m pytest tests
+"""
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import compression
+from compression import (
+    CompressionConfig, CompressionMiddleware, DecompressionError, compress_body, decompress_body,
+    negotiate_encoding,
+)
+
+PAYLOAD = b'{"text": "the quick brown fox"}' * 2000
+
+
+def test_negotiate_prefers_server_order_and_honours_q():
+    available = ["zstd", "br", "gzip"]
+    assert negotiate_encoding("gzip, br", available) == "br"
+    assert negotiate_encoding("gzip;q=1.0, zstd;q=0", available) == "gzip"
+    assert negotiate_encoding("*", available) == "zstd"
+    assert negotiate_encoding("identity", available) is None
+    assert negotiate_encoding("", available) is None
+
+
+@pytest.mark.parametrize("encoding", CompressionConfig().available_encodings())
+def test_compress_round_trip(encoding):
+    compressed = compress_body(PAYLOAD, encoding, CompressionConfig())
+    assert len(compressed) < len(PAYLOAD)
+    assert decompress_body(compressed, encoding, len(PAYLOAD)) == PAYLOAD
+
+
+def test_deflate_round_trip():
+    assert decompress_body(zlib.compress(PAYLOAD), "deflate", len(PAYLOAD)) == PAYLOAD
+
+
+@pytest.mark.parametrize("encoding", CompressionConfig().available_encodings())
+def test_decompression_is_capped(encoding):
+    compressed = compress_body(PAYLOAD, encoding, CompressionConfig())
+    with pytest.raises(DecompressionError, match="too large"):
+        decompress_body(compressed, encoding, len(PAYLOAD) - 1)
+
+
+@pytest.mark.skipif(not compression.BROTLI_BOUNDED, reason="needs brotli >= 1.2")
+def test_brotli_bomb_stops_near_the_cap():
+    # ~100 bytes that expand to 64 MiB; the cap must stop it long before that
+    bomb = compression.brotli.compress(b"\0" * (64 * 1024 * 1024))
+    with pytest.raises(DecompressionError, match="too large"):
+        decompress_body(bomb, "br", 1024 * 1024)
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate"])
+def test_invalid_body_is_rejected(encoding):
+    with pytest.raises(DecompressionError, match="Invalid"):
+        decompress_body(b"not compressed", encoding, 1024)
+
+
+def _echo_client(max_request_size=1024 * 1024):
+    app = FastAPI()
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        body = await request.body()
+        return {"size": len(body), "text": body.decode()}
+
+    config = CompressionConfig()
+    config.max_request_size = max_request_size
+    app.add_middleware(CompressionMiddleware, config=config)
+    return TestClient(app)
+
+
+def test_middleware_inflates_request_and_compresses_response():
+    client = _echo_client()
+    response = client.post(
+        "/echo", content=gzip.compress(PAYLOAD),
+        headers={"Content-Encoding": "gzip", "Accept-Encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json()["size"] == len(PAYLOAD)
+
+
+def test_middleware_leaves_small_responses_alone():
+    response = _echo_client().post("/echo", content=b"hi", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json()["text"] == "hi"
+
+
+def test_middleware_rejects_unknown_and_oversized_bodies():
+    client = _echo_client(max_request_size=100)
+    response = client.post("/echo", content=b"x", headers={"Content-Encoding": "lz4"})
+    assert response.status_code == 415
+
+    response = client.post("/echo", content=gzip.compress(b"x" * 5000), headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 400
+    assert "too large" in response.json()["detail"]
+
+    response = client.post("/echo", content=b"x" * 200, headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 413
@@ -0,0 +1,138 @@
+"""
+Tests for embedding reuse and content-hash duplicate detection.
+
+Run from the repository root: python -m pytest tests
+"""
+import os
+import sqlite3
+
+from embedding import EmbeddingConfig, LocalOnnxEmbeddingFunction
+from embedding_cache import ContentIndex, EmbeddingCache
+
+
+class CountingEmbedder:
+    def __init__(self, offset=0.0):
+        self.offset = offset
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)) + self.offset, 0.5] for text in texts]
+
+
+def _function(model_path):
+    config = EmbeddingConfig()
+    config.model_path = model_path
+    return LocalOnnxEmbeddingFunction(config)
+
+
+def test_texts_are_embedded_once():
+    cache = EmbeddingCache("model")
+    embed = CountingEmbedder()
+    assert cache.embed(["a", "bb", "a"], embed) == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert cache.embed(["bb", "ccc"], embed) == [[2.0, 0.5], [3.0, 0.5]]
+    assert embed.calls == [["a", "bb"], ["ccc"]]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 4
+
+
+def test_disabled_cache_always_embeds():
+    cache = EmbeddingCache("model", max_entries=0)
+    embed = CountingEmbedder()
+    cache.embed(["a"], embed)
+    cache.embed(["a"], embed)
+    assert len(embed.calls) == 2
+
+
+def test_models_with_the_same_directory_name_do_not_share_vectors(tmp_path):
+    for version in ("v1", "v2"):
+        (tmp_path / version / "model").mkdir(parents=True)
+        (tmp_path / version / "model" / "model.onnx").write_bytes(version.encode())
+    v1 = _function(str(tmp_path / "v1" / "model"))
+    v2 = _function(str(tmp_path / "v2" / "model"))
+    assert v1.model_id == v2.model_id
+    assert v1.fingerprint() != v2.fingerprint()
+
+    path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache(v1.fingerprint(), path=path).embed(["text"], CountingEmbedder(offset=100.0))
+    embed = CountingEmbedder()
+    assert EmbeddingCache(v2.fingerprint(), path=path).embed(["text"], embed) == [[4.0, 0.5]]
+    assert embed.calls == [["text"]]
+
+
+def test_replacing_the_model_file_changes_the_fingerprint(tmp_path):
+    (tmp_path / "model.onnx").write_bytes(b"old")
+    function = _function(str(tmp_path))
+    before = function.fingerprint()
+    os.utime(tmp_path / "model.onnx", ns=(0, 10 ** 9))
+    assert function.fingerprint() != before
+    assert _function(None).fingerprint() == _function(None).model_id
+
+
+def test_disk_tier_survives_restarts(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache("model", path=path).embed(["a", "bb"], CountingEmbedder())
+
+    cache = EmbeddingCache("model", max_entries=10, path=path)
+    embed = CountingEmbedder()
+    assert cache.embed(["bb", "a"], embed) == [[2.0, 0.5], [1.0, 0.5]]
+    assert embed.calls == []
+    assert cache.stats()["disk_hits"] == 2
+    assert cache.stats()["disk_entries"] == 2
+
+
+def test_disk_tier_trims_least_recently_used(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache("model", max_entries=0, path=path, max_disk_entries=3)
+    embed = CountingEmbedder()
+    cache.embed(["a", "bb"], embed)
+    cache.embed(["ccc"], embed)
+    cache.embed(["a"], embed)
+    cache.embed(["dddd"], embed)
+
+    stats = cache.stats()
+    assert stats["disk_entries"] == 3
+    assert stats["disk_evictions"] == 1
+    calls = len(embed.calls)
+    cache.embed(["a", "ccc", "dddd"], embed)
+    assert len(embed.calls) == calls
+    cache.embed(["bb"], embed)
+    assert embed.calls[-1] == ["bb"]
+
+    # A smaller cap on reopening trims straight away
+    assert EmbeddingCache("model", path=path, max_disk_entries=1).stats()["disk_entries"] == 1
+
+
+def test_disk_tier_from_before_the_cap_is_migrated(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+    db.commit()
+    db.close()
+    EmbeddingCache("model", path=path).embed(["a"], CountingEmbedder())
+    embed = CountingEmbedder()
+    assert EmbeddingCache("model", path=path).embed(["a"], embed) == [[1.0, 0.5]]
+    assert embed.calls == []
+
+
+def test_content_index_claims_and_removes():
+    index = ContentIndex()
+    list(index.load_through([("a", "same text")]))
+    assert index.claim("b", "same text") == "a"
+    assert index.claim("a", "same text") is None
+    assert index.claim("c", "other text") is None
+    index.remove("a")
+    assert index.claim("b", "same text") is None
+    assert index.stats() == {"documents": 2, "distinct": 2, "ready": True}
+
+
+def test_content_index_load_does_not_overwrite_live_writes():
+    index = ContentIndex()
+    index.add("a", "fresh")
+    index.remove("b")
+    loaded = list(index.load_through([("a", "stale"), ("b", "gone"), ("c", "kept")]))
+    assert [doc_id for doc_id, _ in loaded] == ["a", "b", "c"]
+    assert index.claim("x", "fresh") == "a"
+    assert index.claim("y", "stale") is None
+    assert index.claim("z", "kept") == "c"
+    assert len(index) == 3
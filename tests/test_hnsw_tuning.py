@@ -0,0 +1,46 @@
+"""
+Tests for HNSW configuration and the recall/latency sweep.
+
+Run from the repository root: python -m pytest tests
+"""
+import random
+
+import pytest
+
+from hnsw_tuning import collection_metadata_from_env, recall_latency_sweep, search_profiles_from_env
+
+
+def _vectors(count, dim=8, seed=1):
+    rng = random.Random(seed)
+    return [[rng.random() for _ in range(dim)] for _ in range(count)]
+
+
+def test_metadata_and_profiles_from_env(monkeypatch):
+    monkeypatch.setenv("HNSW_SPACE", "l2")
+    monkeypatch.setenv("HNSW_M", "24")
+    monkeypatch.setenv("HNSW_SEARCH_PROFILES", "fast:8,slow:512")
+    assert collection_metadata_from_env() == {"hnsw:space": "l2", "hnsw:M": 24}
+    assert search_profiles_from_env() == {"fast": 8, "slow": 512}
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine"])
+def test_exhaustive_grid_point_reaches_full_recall(space):
+    report = recall_latency_sweep(_vectors(200), space, 5, 20, [16], [200], [200], 0.9)
+    assert report["queries"] == 20
+    assert report["base_size"] == 180
+    [row] = report["results"]
+    assert row["recall"] >= 0.99
+    assert report["recommended"] == row
+
+
+def test_queries_are_capped_to_half_the_sample():
+    report = recall_latency_sweep(_vectors(10), "l2", 3, 100, [8], [50], [10, 20], 2.0)
+    assert report["queries"] == 5
+    assert len(report["results"]) == 2
+    assert report["recommended"] is None
+
+
+@pytest.mark.parametrize("k, queries", [(0, 10), (5, 0)])
+def test_empty_sweeps_are_rejected(k, queries):
+    with pytest.raises(ValueError):
+        recall_latency_sweep(_vectors(20), "l2", k, queries, [8], [50], [10], 0.9)
@@ -0,0 +1,74 @@
+"""
+Tests for hybrid search dropping a leg that misses the deadline.
+
+Run from the repository root: python -m pytest tests
+"""
+import asyncio
+import threading
+
+from bm25 import BM25Index
+from search_budget import Deadline
+
+
+def _bm25(**documents):
+    index = BM25Index()
+    index.load(documents.items())
+    return index
+
+
+def _hybrid(main_app, deadline):
+    return asyncio.run(main_app.hybrid_search("red apple", 10, None, deadline, {"ids", "distances"}))
+
+
+def test_both_legs_are_fused(main_app, monkeypatch):
+    monkeypatch.setattr(main_app, "bm25_index", _bm25(lexical="red apple", both="apple"))
+    monkeypatch.setattr(
+        main_app, "query_collection",
+        lambda *args, **kwargs: {"ids": [["both", "vector"]], "distances": [[0.1, 0.2]]},
+    )
+    deadline = Deadline(5000)
+    hits = _hybrid(main_app, deadline)
+    assert [hit.id for hit in hits][0] == "both"
+    assert {hit.id for hit in hits} == {"both", "lexical", "vector"}
+    assert {hit.id: hit.distance for hit in hits}["lexical"] is None
+    assert not deadline.partial
+
+
+def test_slow_vector_leg_is_dropped(main_app, monkeypatch):
+    release = threading.Event()
+
+    def stuck_query(*args, **kwargs):
+        release.wait(5)
+        return {"ids": [["vector"]], "distances": [[0.1]]}
+
+    monkeypatch.setattr(main_app, "bm25_index", _bm25(lexical="red apple", other="pear"))
+    monkeypatch.setattr(main_app, "query_collection", stuck_query)
+    deadline = Deadline(200)
+    try:
+        hits = _hybrid(main_app, deadline)
+    finally:
+        release.set()
+    assert [hit.id for hit in hits] == ["lexical"]
+    assert deadline.partial
+
+
+def test_slow_lexical_leg_is_dropped(main_app, monkeypatch):
+    release = threading.Event()
+
+    class StuckIndex:
+        def search(self, query, limit, deadline=None):
+            release.wait(5)
+            return [("lexical", 1.0)]
+
+    monkeypatch.setattr(main_app, "bm25_index", StuckIndex())
+    monkeypatch.setattr(
+        main_app, "query_collection",
+        lambda *args, **kwargs: {"ids": [["v1", "v2"]], "distances": [[0.1, 0.2]]},
+    )
+    deadline = Deadline(200)
+    try:
+        hits = _hybrid(main_app, deadline)
+    finally:
+        release.set()
+    assert [(hit.id, hit.distance) for hit in hits] == [("v1", 0.1), ("v2", 0.2)]
+    assert deadline.partial
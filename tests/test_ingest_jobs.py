@@ -0,0 +1,133 @@
+"""
+Tests for durable ingest jobs, including resuming a job killed mid-chunk.
+
+Run from the repository root: python -m pytest tests
+"""
+import asyncio
+import random
+import uuid
+
+import pytest
+
+from ingest_jobs import ChunkFailed, IngestJobs, IngestQueueFull
+from vectors import encode_embedding
+
+# The default embedding model's dimension; documents carry their own vectors so no model is loaded
+DIMENSION = 384
+
+
+def _vector():
+    return [random.random() for _ in range(DIMENSION)]
+
+
+def _documents(count):
+    prefix = uuid.uuid4().hex[:8]
+    return [
+        {"id": f"{prefix}-{i}", "text": f"ingested document {prefix} number {i}", "embedding": encode_embedding(_vector())}
+        for i in range(count)
+    ]
+
+
+async def _finished(jobs, job_id):
+    job = await jobs.wait(job_id, 30)
+    assert job["state"] in ("succeeded", "failed", "cancelled")
+    return job
+
+
+def test_job_runs_in_chunks(tmp_path):
+    chunks = []
+
+    async def process(documents):
+        chunks.append([document["id"] for document in documents])
+
+    async def run():
+        jobs = IngestJobs(str(tmp_path / "jobs.sqlite3"), process, workers=1, chunk_size=2)
+        await jobs.start()
+        job = await jobs.submit("owner", _documents(5))
+        return await _finished(jobs, job["id"])
+
+    job = asyncio.run(run())
+    assert (job["state"], job["processed"], job["failed"], job["percent"]) == ("succeeded", 5, 0, 100.0)
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+
+def test_partly_failed_chunk_counts_only_its_failures(tmp_path):
+    async def process(documents):
+        if documents[0]["id"].endswith("-0"):
+            raise ChunkFailed(1, "Document taken")
+
+    async def run():
+        jobs = IngestJobs(str(tmp_path / "jobs.sqlite3"), process, workers=1, chunk_size=3)
+        await jobs.start()
+        job = await jobs.submit("owner", _documents(4))
+        return await _finished(jobs, job["id"])
+
+    job = asyncio.run(run())
+    assert (job["state"], job["processed"], job["failed"]) == ("failed", 4, 1)
+    assert job["errors"] == ["documents 0-2: Document taken"]
+
+
+def test_full_queue_and_cancelling_a_queued_job(tmp_path):
+    async def process(documents):
+        pass
+
+    async def run():
+        # Not started, so jobs stay queued
+        jobs = IngestJobs(str(tmp_path / "jobs.sqlite3"), process, max_queued_documents=3)
+        job = await jobs.submit("owner", _documents(2))
+        with pytest.raises(IngestQueueFull):
+            await jobs.submit("owner", _documents(2))
+        cancelled = await jobs.cancel(job["id"])
+        await jobs.submit("owner", _documents(3))
+        return cancelled, jobs.stats()
+
+    cancelled, stats = asyncio.run(run())
+    assert cancelled["state"] == "cancelled"
+    assert stats["jobs"] == {"cancelled": 1, "queued": 1}
+    assert stats["queued_documents"] == 3
+
+
+def test_job_killed_mid_chunk_resumes_without_conflicts(main_app, tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    documents = _documents(5)
+
+    async def killed_after_second_chunk(chunk):
+        await main_app.ingest_chunk(chunk)
+        if chunk[0]["id"] == documents[2]["id"]:
+            # The process dies after the add and before the chunk's progress is recorded
+            raise asyncio.CancelledError
+
+    async def first_run():
+        jobs = IngestJobs(path, killed_after_second_chunk, workers=1, chunk_size=2)
+        await jobs.start()
+        job = await jobs.submit("owner", documents)
+        await asyncio.gather(*jobs._tasks, return_exceptions=True)
+        return jobs.get(job["id"])
+
+    interrupted = asyncio.run(first_run())
+    assert (interrupted["state"], interrupted["processed"]) == ("running", 2)
+
+    async def resumed_run():
+        jobs = IngestJobs(path, main_app.ingest_chunk, workers=1, chunk_size=2)
+        await jobs.start()
+        return await _finished(jobs, interrupted["id"])
+
+    job = asyncio.run(resumed_run())
+    assert (job["state"], job["processed"], job["failed"], job["errors"]) == ("succeeded", 5, 0, [])
+    stored = main_app.collection.get(ids=[document["id"] for document in documents], include=["documents"])
+    assert sorted(stored["documents"]) == sorted(document["text"] for document in documents)
+
+
+def test_chunk_keeps_an_id_taken_by_another_add(main_app):
+    documents = _documents(3)
+    main_app.collection.add(ids=[documents[1]["id"]], documents=["written by a live add"], embeddings=[_vector()])
+
+    with pytest.raises(ChunkFailed) as error:
+        asyncio.run(main_app.ingest_chunk(documents))
+    assert error.value.failed == 1
+    assert documents[1]["id"] in error.value.detail
+
+    stored = main_app.fetch_fields([document["id"] for document in documents], ["documents"])
+    assert stored[documents[0]["id"]]["documents"] == documents[0]["text"]
+    assert stored[documents[1]["id"]]["documents"] == "written by a live add"
+    assert stored[documents[2]["id"]]["documents"] == documents[2]["text"]
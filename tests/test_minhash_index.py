@@ -0,0 +1,80 @@
+"""
+Tests for MinHash LSH near-duplicate detection.
+
+Run from the repository root: python -m pytest tests
+"""
+import pytest
+
+import minhash_index
+from minhash_index import MinHashIndex, optimal_bands, shingles
+
+BASE = "the quick brown fox jumps over the lazy dog near the old river bank at dawn every single day"
+
+
+def test_shingles():
+    assert shingles("A b C d", 3) == {"a b c", "b c d"}
+    assert shingles("Short text", 3) == {"short text"}
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.8, 0.95])
+def test_bands_fit_the_signature(threshold):
+    bands, rows = optimal_bands(threshold, 64)
+    assert bands * rows <= 64
+    # A higher threshold needs wider bands to keep dissimilar pairs apart
+    assert rows >= optimal_bands(0.3, 64)[1]
+
+
+def test_identical_and_near_texts_are_found_unrelated_ones_are_not():
+    index = MinHashIndex(threshold=0.5)
+    index.add("a", BASE)
+    index.add("b", BASE + " again")
+    index.add("c", "an entirely different sentence about cooking pasta with garlic and olive oil")
+    assert index.similarity(index.signature(BASE), index.signature(BASE)) == 1.0
+
+    matches = index.near_duplicates("a")
+    assert [doc_id for doc_id, _ in matches] == ["b"]
+    assert 0.5 <= matches[0][1] < 1.0
+    assert index.query(BASE)[0] == ("a", 1.0)
+    assert index.near_duplicates("missing") is None
+
+
+def test_remove_and_replace():
+    index = MinHashIndex(threshold=0.5)
+    index.add("a", BASE)
+    index.add("b", BASE)
+    index.remove("b")
+    assert index.near_duplicates("a") == []
+    index.add("a", "something else entirely with no words in common at all here")
+    assert index.query(BASE) == []
+    assert len(index) == 1
+
+
+def test_clusters_group_near_duplicates():
+    index = MinHashIndex(threshold=0.5)
+    index.add_many([("a1", BASE), ("a2", BASE), ("a3", BASE + " again"), ("x", "unrelated words only here")])
+    index.add_many([("p1", "pasta with garlic and olive oil is a simple dinner"),
+                    ("p2", "pasta with garlic and olive oil is a simple dinner")])
+    assert index.clusters() == [["a1", "a2", "a3"], ["p1", "p2"]]
+    assert index.clusters(min_size=3) == [["a1", "a2", "a3"]]
+
+
+def test_load_does_not_overwrite_live_writes():
+    index = MinHashIndex(threshold=0.5, loading=True)
+    index.add("a", "fresh text written while the index loads from the store")
+    index.remove("b")
+    loaded = list(index.load_through([("a", BASE), ("b", BASE), ("c", BASE)]))
+    assert [doc_id for doc_id, _ in loaded] == ["a", "b", "c"]
+    assert [doc_id for doc_id, _ in index.query(BASE)] == ["c"]
+    assert index.stats()["ready"]
+
+
+def test_signatures_agree_with_and_without_numpy(monkeypatch):
+    pytest.importorskip("numpy")
+    accelerated = MinHashIndex().signature(BASE)
+    monkeypatch.setattr(minhash_index, "np", None)
+    assert MinHashIndex().signature(BASE) == accelerated
+
+
+def test_threshold_is_validated():
+    with pytest.raises(ValueError):
+        MinHashIndex(threshold=0)
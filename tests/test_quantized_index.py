@@ -0,0 +1,115 @@
+"""
+Tests for the quantized vector index.
+
+Run from the repository root: python -m pytest tests
+"""
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from quantized_index import INITIAL_CAPACITY, MODES, QuantizedVectorIndex, VectorIndexUnavailable
+from search_budget import Deadline
+
+
+def _vectors(count, dimension=32, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+
+def _index(mode, vectors, **kwargs):
+    index = QuantizedVectorIndex(mode, vectors.shape[1], **kwargs)
+    for i, vector in enumerate(vectors):
+        index.add(f"d{i}", vector)
+    return index
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_stored_vector_is_its_own_nearest_neighbour(mode):
+    vectors = _vectors(200)
+    index = _index(mode, vectors)
+    [(doc_id, distance)] = index.search(vectors[17], 1)
+    assert doc_id == "d17"
+    assert distance == pytest.approx(0.0, abs=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["int8", "binary"])
+def test_originals_are_kept_by_default(mode):
+    vectors = _vectors(INITIAL_CAPACITY + 100)
+    index = _index(mode, vectors)
+    assert index.has_originals
+    # Rows written before the backing file grew survive the growth
+    assert np.allclose(index._originals[3], vectors[3] / np.linalg.norm(vectors[3]))
+
+    exact = index.search(vectors[0], 5, exact=True)
+    assert exact[0][0] == "d0"
+    report = index.recall_report(k=5, queries=20)
+    assert report["queries"] == 20
+    # Random Gaussian vectors are the worst case for sign codes
+    assert report["recall"] >= (0.9 if mode == "int8" else 0.3)
+
+
+def test_originals_at_a_path(tmp_path):
+    path = str(tmp_path / "originals.f32")
+    vectors = _vectors(50)
+    index = _index("int8", vectors, originals_path=path)
+    assert (tmp_path / "originals.f32").stat().st_size >= 50 * 32 * 4
+    assert index.search(vectors[5], 1, exact=True)[0][0] == "d5"
+
+
+def test_without_originals_exact_and_recall_are_unavailable():
+    vectors = _vectors(50)
+    index = _index("int8", vectors, keep_originals=False)
+    assert not index.has_originals
+    assert index.memory_usage()["originals_bytes_on_disk"] == 0
+    assert index.search(vectors[5], 1)[0][0] == "d5"
+    with pytest.raises(VectorIndexUnavailable):
+        index.search(vectors[5], 1, exact=True)
+    with pytest.raises(VectorIndexUnavailable):
+        index.recall_report()
+
+
+def test_from_env_switches_originals_off(monkeypatch):
+    monkeypatch.setenv("VECTOR_ORIGINALS_PATH", "off")
+    assert not QuantizedVectorIndex.from_env().has_originals
+    monkeypatch.delenv("VECTOR_ORIGINALS_PATH")
+    assert QuantizedVectorIndex.from_env().has_originals
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_replace_and_remove(mode):
+    vectors = _vectors(10)
+    index = _index(mode, vectors)
+    index.add("d0", vectors[9])
+    assert {doc_id for doc_id, _ in index.search(vectors[9], 2)} == {"d0", "d9"}
+
+    assert index.remove("d3")
+    assert not index.remove("d3")
+    assert "d3" not in index
+    assert len(index) == 9
+    # The last row moved into the freed slot and is still found
+    assert index.search(vectors[9], 2, exact=True)[0][1] == pytest.approx(0.0, abs=1e-5)
+    assert "d3" not in {doc_id for doc_id, _ in index.search(vectors[3], 9)}
+
+
+def test_max_distance_and_dimension_checks():
+    vectors = _vectors(20)
+    index = _index("float32", vectors)
+    hits = index.search(vectors[0], 20, max_distance=0.5)
+    assert hits[0][0] == "d0"
+    assert all(distance <= 0.5 for _, distance in hits)
+    with pytest.raises(ValueError):
+        index.add("bad", [1.0, 2.0])
+    assert QuantizedVectorIndex("int8").search([1.0], 3) == []
+
+
+def test_expired_deadline_scans_only_the_first_block():
+    from quantized_index import SCAN_BLOCK
+
+    vectors = _vectors(SCAN_BLOCK + 10, dimension=8)
+    index = _index("float32", vectors)
+    deadline = Deadline(1)
+    time.sleep(0.01)
+    hits = index.search(vectors[SCAN_BLOCK + 5], 1, deadline=deadline)
+    assert deadline.partial
+    assert hits[0][0] != f"d{SCAN_BLOCK + 5}"
@@ -0,0 +1,129 @@
+"""
+Tests for the background collection rebuild and its switch-over.
+
+Run from the repository root: python -m pytest tests
+"""
+import threading
+import time
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+
+from backup import WriteGate
+from embedding import EmbeddingConfig
+from reindex import ReindexInProgress, Reindexer, read_active_collection, recorded_embedding_function
+
+
+class FakeEmbedding:
+    """Stands in for the ONNX model: one fixed vector per text, shifted per model"""
+
+    def __init__(self, model_id, offset=0.0):
+        self.model_id = model_id
+        self.offset = offset
+        self.config = EmbeddingConfig()
+
+    def __call__(self, input):
+        return [[float(len(text)) + self.offset, 1.0, 0.0] for text in input]
+
+
+TEXTS = {f"d{i}": f"document number {i}" for i in range(7)}
+
+
+class Harness:
+    def __init__(self, tmp_path, **kwargs):
+        self.path = str(tmp_path / "store")
+        self.client = chromadb.PersistentClient(path=self.path)
+        self.ef = FakeEmbedding("model-a")
+        self.source = self.client.create_collection("documents", embedding_function=self.ef)
+        self.source.add(ids=list(TEXTS), documents=list(TEXTS.values()), metadatas=[{"n": i} for i in range(7)])
+        self.activated = []
+        self.reindexer = Reindexer(
+            self.client, self.path, WriteGate(), lambda collection, ef: self.activated.append((collection, ef)),
+            batch_size=2, retire_delay=0, **kwargs
+        )
+
+    def start(self, target_ef=None, **kwargs):
+        return self.reindexer.start(self.source, self.ef, target_ef or self.ef, {"hnsw:space": "l2"}, "documents", **kwargs)
+
+    def finish(self):
+        deadline = time.monotonic() + 30
+        while self.reindexer.current is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.reindexer.status()["last"]
+
+
+def test_rebuild_copies_everything_and_switches_over(tmp_path):
+    harness = Harness(tmp_path)
+    job_id = harness.start()
+    job = harness.finish()
+    assert (job["id"], job["state"], job["reembed"]) == (job_id, "succeeded", False)
+    assert (job["total"], job["copied"], job["percent"]) == (7, 7, 100.0)
+
+    [(target, ef)] = harness.activated
+    assert target.name == f"documents-{job_id}"
+    assert read_active_collection(harness.path, "documents") == target.name
+    stored = target.get(include=["documents", "metadatas", "embeddings"])
+    assert dict(zip(stored["ids"], stored["documents"])) == TEXTS
+    assert sorted(m["n"] for m in stored["metadatas"]) == list(range(7))
+    # The model is unchanged, so the stored vectors are copied
+    assert stored["embeddings"][0] == harness.ef([stored["documents"][0]])[0]
+    # The old collection is dropped once the grace period is over
+    deadline = time.monotonic() + 5
+    while "documents" in {c.name for c in harness.client.list_collections()} and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert {c.name for c in harness.client.list_collections()} == {target.name}
+
+
+def test_new_model_reembeds_and_is_recorded(tmp_path):
+    harness = Harness(tmp_path)
+    target_ef = FakeEmbedding("model-b", offset=100.0)
+    harness.start(target_ef)
+    job = harness.finish()
+    assert job["reembed"] and job["model"] == "model-b"
+    [(target, ef)] = harness.activated
+    assert ef is target_ef
+    stored = target.get(ids=["d1"], include=["embeddings"])
+    assert stored["embeddings"][0][0] == len(TEXTS["d1"]) + 100.0
+    # After a restart, a collection built with another model keeps being queried with it
+    assert recorded_embedding_function(target.metadata, harness.ef) is not harness.ef
+    assert recorded_embedding_function(None, harness.ef) is harness.ef
+
+
+def test_mirrored_writes_win_over_the_copy(tmp_path):
+    release = threading.Event()
+    harness = Harness(tmp_path, should_yield=lambda: not release.is_set())
+    harness.start()
+    with pytest.raises(ReindexInProgress):
+        harness.start()
+
+    vector = [1.0, 2.0, 3.0]
+    harness.reindexer.mirror("upsert", {"ids": ["d1"], "documents": ["rewritten"], "embeddings": [vector]}, [])
+    harness.reindexer.mirror("delete", {"ids": ["d2"]}, [])
+    harness.reindexer.mirror("add", {"ids": ["new"], "documents": ["added live"], "embeddings": [vector]}, [])
+    release.set()
+    job = harness.finish()
+    assert job["state"] == "succeeded"
+    assert (job["copied"], job["skipped"], job["mirrored"]) == (5, 2, 3)
+
+    [(target, _)] = harness.activated
+    stored = target.get(include=["documents"])
+    texts = dict(zip(stored["ids"], stored["documents"]))
+    assert texts["d1"] == "rewritten"
+    assert "d2" not in texts
+    assert texts["new"] == "added live"
+    assert len(texts) == 7
+
+
+def test_cancel_drops_the_new_collection(tmp_path):
+    release = threading.Event()
+    harness = Harness(tmp_path, should_yield=lambda: not release.is_set())
+    job_id = harness.start()
+    assert harness.reindexer.cancel() == job_id
+    release.set()
+    job = harness.finish()
+    assert job["state"] == "cancelled"
+    assert harness.activated == []
+    assert {c.name for c in harness.client.list_collections()} == {"documents"}
+    assert read_active_collection(harness.path, "documents") == "documents"
+    assert harness.reindexer.cancel() is None
@@ -0,0 +1,186 @@
+"""
+Tests for read replicas: snapshot refreshes and forwarding writes to the writer.
+
+Run from the repository root: python -m pytest tests
+"""
+import json
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("chromadb")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backup import SQLITE_FILE, BackupManager, WriteGate
+from replica import Replica, WriterForwardingMiddleware, writer_stats
+
+
+def _store(path, content=b"a"):
+    os.makedirs(path / "segment", exist_ok=True)
+    (path / "segment" / "data_level0.bin").write_bytes(content * 100)
+    (path / SQLITE_FILE).touch()
+
+
+def _snapshot(tmp_path, snapshot_id, content=b"a"):
+    _store(tmp_path / "writer", content)
+    manager = BackupManager(str(tmp_path / "writer"), str(tmp_path / "backups"), WriteGate(), 0)
+    return manager.create_snapshot(snapshot_id)
+
+
+def _replica(tmp_path, writer_url="http://writer", **kwargs):
+    return Replica(str(tmp_path / "backups"), str(tmp_path / "replica"), writer_url, retire_delay=0, **kwargs)
+
+
+@pytest.mark.parametrize("method, path, forwarded", [
+    ("GET", "/search", False),
+    ("POST", "/search/batch", False),
+    ("POST", "/get/batch", False),
+    ("POST", "/add", True),
+    ("DELETE", "/delete/a", True),
+    ("GET", "/ingest/job", True),
+    ("GET", "/admin/backup", True),
+])
+def test_writes_and_writer_state_are_forwarded(tmp_path, method, path, forwarded):
+    assert _replica(tmp_path).forwards(method, path) is forwarded
+
+
+def test_prepare_before_the_first_snapshot_opens_an_empty_store(tmp_path):
+    replica = _replica(tmp_path)
+    path = replica.prepare()
+    assert path.endswith("empty") and os.path.isdir(path)
+    assert replica.lag() is None
+    with pytest.raises(RuntimeError, match="another replica"):
+        _replica(tmp_path).prepare()
+
+
+def test_refresh_serves_only_newer_changed_snapshots(tmp_path):
+    _snapshot(tmp_path, "s1")
+    replica = _replica(tmp_path, max_lag_seconds=3600)
+    first = replica.prepare()
+    assert first.endswith("s1")
+    assert (tmp_path / "replica" / "s1" / "segment" / "data_level0.bin").read_bytes() == b"a" * 100
+    assert not replica.lagging()
+
+    opened = []
+
+    def open_copy(path):
+        opened.append(path)
+        return None
+
+    assert not replica.refresh(open_copy)
+    # A newer snapshot with the same files only moves the lag
+    _snapshot(tmp_path, "s2")
+    assert not replica.refresh(open_copy)
+    assert replica.stats()["snapshot"] == "s2"
+    assert opened == []
+
+    _snapshot(tmp_path, "s3", b"b")
+    assert replica.refresh(open_copy)
+    assert opened == [str(tmp_path / "replica" / "s3")]
+    assert (tmp_path / "replica" / "s3" / "segment" / "data_level0.bin").read_bytes() == b"b" * 100
+    stats = replica.stats()
+    assert (stats["snapshot"], stats["refreshes"]) == ("s3", 1)
+    # The previous copy is deleted after the retire delay
+    deadline = time.monotonic() + 5
+    while os.path.exists(first) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not os.path.exists(first)
+
+
+def test_failed_open_keeps_serving_the_previous_copy(tmp_path):
+    _snapshot(tmp_path, "s1")
+    replica = _replica(tmp_path)
+    first = replica.prepare()
+    _snapshot(tmp_path, "s2", b"b")
+
+    def broken(path):
+        raise RuntimeError("cannot open")
+
+    with pytest.raises(RuntimeError):
+        replica.refresh(broken)
+    assert replica.copy_path == first
+    assert replica.stats()["snapshot"] == "s1"
+    assert not os.path.exists(tmp_path / "replica" / "s2")
+
+
+def test_writer_stats_report_the_latest_snapshot(tmp_path):
+    assert writer_stats(str(tmp_path / "backups"), 60)["latest_snapshot"] is None
+    _snapshot(tmp_path, "s1")
+    stats = writer_stats(str(tmp_path / "backups"), 60)
+    assert stats["latest_snapshot"] == "s1"
+    assert 0 <= stats["latest_snapshot_age_seconds"] < 60
+
+
+class _Writer(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        status = 409 if self.path == "/add/conflict" else 200
+        content = json.dumps({
+            "path": self.path,
+            "body": body.decode(),
+            "authorization": self.headers["Authorization"],
+        }).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Writer", "yes")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def writer():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Writer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _client(replica, max_body_size=1000):
+    app = FastAPI()
+
+    @app.get("/search")
+    def search():
+        return {"served": "locally"}
+
+    app.add_middleware(WriterForwardingMiddleware, replica=replica, max_body_size=max_body_size)
+    return TestClient(app)
+
+
+def test_writes_reach_the_writer_unchanged(tmp_path, writer):
+    replica = _replica(tmp_path, writer)
+    client = _client(replica)
+    assert client.get("/search").json() == {"served": "locally"}
+
+    response = client.post("/add?x=1", content=b'{"text": "hi"}', headers={"Authorization": "Bearer k"})
+    assert response.status_code == 200
+    assert response.headers["x-writer"] == "yes"
+    assert response.json() == {"path": "/add?x=1", "body": '{"text": "hi"}', "authorization": "Bearer k"}
+
+    assert client.post("/add/conflict", content=b"{}").status_code == 409
+    assert replica.stats()["forwarded"] == 2
+
+
+def test_unreachable_writer_and_oversized_bodies(tmp_path):
+    with socket.socket() as free:
+        free.bind(("127.0.0.1", 0))
+        port = free.getsockname()[1]
+    replica = _replica(tmp_path, f"http://127.0.0.1:{port}")
+    client = _client(replica, max_body_size=10)
+
+    response = client.post("/add", content=b"{}")
+    assert response.status_code == 502
+    assert response.json()["detail"].startswith("Writer unavailable")
+    assert replica.stats()["forward_errors"] == 1
+
+    assert client.post("/add", content=b"x" * 11).status_code == 413
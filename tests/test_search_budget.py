@@ -0,0 +1,75 @@
+"""
+Tests for search deadlines and the search executor.
+
+Run from the repository root: python -m pytest tests
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import Response
+
+from search_budget import PARTIAL_HEADER, Deadline, SearchBudget, SearchExecutor, SearchTimeout
+
+
+def test_deadline_without_budget_never_expires():
+    deadline = Deadline(None)
+    assert deadline.remaining() is None
+    assert not deadline.exceeded()
+    assert not deadline.partial
+
+
+def test_exceeded_deadline_marks_results_partial():
+    deadline = Deadline(1)
+    time.sleep(0.01)
+    assert deadline.remaining() == 0.0
+    assert deadline.exceeded()
+    assert deadline.partial
+
+
+@pytest.mark.parametrize("requested, expected", [(None, 10000), (500, 500), (90000, 60000), (0, 60000)])
+def test_budgets_are_capped(requested, expected):
+    deadline = SearchBudget(10000, 60000).deadline(requested)
+    assert deadline.remaining() == pytest.approx(expected / 1000, abs=0.5)
+
+
+def test_zero_budgets_mean_no_deadline():
+    assert SearchBudget(0, 0).deadline().remaining() is None
+
+
+def test_finish_flags_partial_responses():
+    budget = SearchBudget()
+    complete, partial = Deadline(None), Deadline(None)
+    partial.partial = True
+    responses = [Response(), Response()]
+    budget.finish(complete, responses[0])
+    budget.finish(partial, responses[1])
+    assert PARTIAL_HEADER not in responses[0].headers
+    assert responses[1].headers[PARTIAL_HEADER] == "true"
+    assert budget.stats()["searches"] == 2
+    assert budget.stats()["partial"] == 1
+
+
+def test_executor_returns_results_in_time():
+    executor = SearchExecutor(1)
+    assert asyncio.run(executor.run(Deadline(5000), lambda a, b=0: a + b, 2, b=3)) == 5
+
+
+def test_executor_abandons_a_running_call_and_cancels_a_queued_one():
+    executor = SearchExecutor(1)
+    release = threading.Event()
+
+    async def run():
+        deadline = Deadline(100)
+        stuck = executor.run(deadline, release.wait, 5)
+        queued = executor.run(deadline, lambda: "never")
+        return deadline, await asyncio.gather(stuck, queued, return_exceptions=True)
+
+    try:
+        deadline, results = asyncio.run(run())
+    finally:
+        release.set()
+    assert all(isinstance(result, SearchTimeout) for result in results)
+    assert deadline.partial
+    assert executor.stats() == {"workers": 1, "cancelled": 1, "abandoned": 1}
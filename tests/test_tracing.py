@@ -0,0 +1,96 @@
+"""
+Tests for request tracing and the slow request log.
+
+Run from the repository root: python -m pytest tests
+"""
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from tracing import SamplingProfiler, TraceLog, TracingMiddleware, authorize_trace, stage
+
+
+def _client(log: TraceLog):
+    app = FastAPI()
+
+    @app.get("/work")
+    def work(authorize: bool = False):
+        authorize_trace(authorize)
+        with stage("compute"):
+            time.sleep(0.01)
+        return {"ok": True}
+
+    app.add_middleware(TracingMiddleware, log=log)
+    return TestClient(app)
+
+
+def _log(sample_rate=0.0, slow_ms=1000.0):
+    return TraceLog(sample_rate, slow_ms / 1000, capacity=10, profile_interval=0.001)
+
+
+def test_untraced_requests_carry_no_timing():
+    response = _client(_log()).get("/work")
+    assert response.status_code == 200
+    assert "server-timing" not in response.headers
+
+
+def test_requested_trace_needs_authorization():
+    client = _client(_log())
+    assert "server-timing" not in client.get("/work", headers={"X-Trace": "1"}).headers
+
+    response = client.get("/work?authorize=true", headers={"X-Trace": "1"})
+    timing = response.headers["server-timing"]
+    assert timing.startswith("compute;dur=")
+    assert "total;dur=" in timing
+    assert len(response.headers["x-trace-id"]) == 16
+
+
+def test_every_slow_request_is_logged_untraced_ones_without_stages():
+    log = _log(slow_ms=5)
+    client = _client(log)
+    client.get("/work")
+    client.get("/work?authorize=true", headers={"X-Trace": "1"})
+
+    untraced, traced = log.summary()["slow_requests"]
+    assert untraced["traced"] is False
+    assert untraced["path"] == "/work"
+    assert untraced["status"] == 200
+    assert untraced["total_ms"] >= 5
+    assert "stages_ms" not in untraced
+    assert traced["traced"] is True
+    assert "compute" in traced["stages_ms"]
+
+
+def test_fast_requests_are_not_logged():
+    log = _log(sample_rate=1.0, slow_ms=60000)
+    _client(log).get("/work")
+    assert log.summary()["slow_requests"] == []
+
+
+def test_profile_is_kept_for_lookup():
+    log = _log()
+    response = _client(log).get("/work?authorize=true", headers={"X-Trace": "profile"})
+    profile = log.get(response.headers["x-trace-id"])
+    assert profile["profiled"]
+    assert profile["profile"]["samples"] > 0
+
+
+def test_profiler_attach_and_detach_from_many_threads():
+    profiler = SamplingProfiler(0.0005)
+    profiler.start(threading.get_ident())
+
+    def churn():
+        for _ in range(2000):
+            profiler.attach()
+            profiler.detach()
+
+    threads = [threading.Thread(target=churn) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profile = profiler.stop()
+    assert dict(profiler._threads) == {threading.get_ident(): 1}
+    assert profile["samples"] > 0
@@ -0,0 +1,99 @@
+"""
+Tests for the trigram index behind substring and fuzzy search.
+
+Run from the repository root: python -m pytest tests
+"""
+import random
+import time
+
+import pytest
+
+import trigram_index
+from search_budget import Deadline
+from trigram_index import BLOCK_SIZE, PostingList, TrigramIndex, trigrams
+
+WORDS = ["apple", "banana", "cherry", "date", "elder", "fig", "grape", "honeydew", "kiwi", "lemon"]
+
+
+def _corpus(count, seed=3):
+    rng = random.Random(seed)
+    return {f"d{i}": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))) for i in range(count)}
+
+
+@pytest.mark.parametrize("numbers", [[], [5], list(range(0, 3 * BLOCK_SIZE + 7)), [1, 300, 70000, 10 ** 9]])
+def test_posting_lists_round_trip(numbers):
+    assert PostingList(numbers).decode() == numbers
+
+
+def test_candidates_match_a_scan():
+    corpus = _corpus(3 * BLOCK_SIZE)
+    index = TrigramIndex(max_candidate_fraction=1.0)
+    index.add_many(corpus.items())
+    for query in ["apple ban", "date", "kiwi kiwi", "on lem", "melon"]:
+        expected = sorted(doc_id for doc_id, text in corpus.items() if all(g in text for g in trigrams(query)))
+        assert sorted(index.candidates(query)) == expected
+
+
+def test_short_and_common_queries_are_not_narrowed():
+    index = TrigramIndex(max_candidate_fraction=0.5)
+    index.add_many([("a", "apple pie"), ("b", "apple tart"), ("c", "cherry")])
+    assert index.candidates("ap") is None
+    assert index.candidates("apple") is None
+    assert index.candidates("cherry") == ["c"]
+    assert index.candidates("zzz") == []
+
+
+def test_updates_and_removals_are_not_found_under_their_old_text():
+    # Dead postings count against the candidate fraction until compacted
+    index = TrigramIndex(max_candidate_fraction=10.0)
+    index.add("a", "old words")
+    index.add("a", "new words")
+    index.add("b", "old words")
+    index.remove("b")
+    assert index.candidates("old") == []
+    assert index.candidates("new") == ["a"]
+    assert len(index) == 1
+    assert index.stats()["dead_postings"] > 0
+
+
+def test_fuzzy_tolerates_typos_and_ranks_closest_first():
+    index = TrigramIndex()
+    index.add_many([("exact", "strawberry"), ("longer", "strawberry jam and toast"), ("other", "blueberry")])
+    hits = index.fuzzy("strawbery", 3)
+    assert [doc_id for _, doc_id in hits][:2] == ["exact", "longer"]
+    assert hits[0][0] == hits[1][0] > 0.5
+    assert index.fuzzy("strawbery", 3, min_similarity=1.0) == []
+    assert index.fuzzy("zz", 3) == []
+
+
+def test_fuzzy_past_its_deadline_stops_early():
+    index = TrigramIndex()
+    index.add_many(_corpus(200).items())
+    deadline = Deadline(1)
+    time.sleep(0.01)
+    partial = index.fuzzy("banana cherry", 200, deadline=deadline)
+    assert deadline.partial
+    # Documents that reach the threshold on part of the lists reach it on all of them
+    assert {doc_id for _, doc_id in partial} <= {doc_id for _, doc_id in index.fuzzy("banana cherry", 200)}
+
+
+def test_compaction_drops_dead_postings(monkeypatch):
+    monkeypatch.setattr(trigram_index, "COMPACT_MIN_POSTINGS", 10)
+    index = TrigramIndex(max_candidate_fraction=1.0)
+    corpus = _corpus(200)
+    index.add_many(corpus.items())
+    before = index.stats()["posting_bytes"]
+    for doc_id in list(corpus)[:150]:
+        index.remove(doc_id)
+    # Writes advance a running pass until every list is filtered
+    for i in range(200):
+        if not index.stats()["compacting"]:
+            break
+        index.add(f"new{i}", "fresh text")
+    stats = index.stats()
+    assert not stats["compacting"]
+    assert stats["dead_postings"] <= stats["postings"] - stats["dead_postings"]
+    assert stats["posting_bytes"] < before
+    kept = dict(list(corpus.items())[150:])
+    expected = sorted(doc_id for doc_id, text in kept.items() if "apple" in text)
+    assert sorted(index.candidates("apple")) == expected
@@ -0,0 +1,80 @@
+"""
+Tests for document versions and ETag matching.
+
+Run from the repository root: python -m pytest tests
+"""
+import threading
+
+import pytest
+
+from versioning import DocumentVersions, etag, etag_matches
+
+
+@pytest.mark.parametrize("header, expected", [
+    ('"5"', True),
+    ('W/"5"', True),
+    ('"4", "5"', True),
+    ("*", True),
+    ('"4"', False),
+    ("5", False),
+    ("", False),
+    (None, False),
+])
+def test_etag_matches(header, expected):
+    assert etag(5) == '"5"'
+    assert etag_matches(header, 5) is expected
+
+
+def test_versions_only_grow_and_are_recorded_for_writes():
+    versions = DocumentVersions()
+    result, [first] = versions.write(["a"], lambda new: True)
+    assert result is True
+    _, [second, third] = versions.write(["a", "b"], lambda new: True)
+    assert first < second < third
+    assert (versions.get("a"), versions.get("b")) == (second, third)
+
+    # A write that changed nothing keeps the recorded version
+    versions.write(["a"], lambda new: False)
+    assert versions.get("a") == second
+
+
+def test_delete_forgets_only_what_was_deleted():
+    versions = DocumentVersions()
+    versions.write(["a"], lambda new: True)
+    assert versions.delete("a", lambda: False) is False
+    assert versions.get("a") is not None
+    assert versions.delete("a", lambda: True) is True
+    assert versions.get("a") is None
+    assert len(versions) == 0
+
+
+def test_load_does_not_overwrite_writes_made_while_loading():
+    versions = DocumentVersions(loading=True)
+    _, [written] = versions.write(["a"], lambda new: True)
+    versions.delete("b", lambda: True)
+    versions.load([("a", 1), ("b", 2), ("c", 3)])
+    assert (versions.get("a"), versions.get("b"), versions.get("c")) == (written, None, 3)
+    assert versions.stats()["ready"]
+
+    # Versions after a load stay above every loaded one
+    loaded = DocumentVersions(loading=True)
+    loaded.load([("x", 10 ** 18)])
+    _, [next_version] = loaded.write(["y"], lambda new: True)
+    assert next_version == 10 ** 18 + 1
+
+
+def test_concurrent_writes_to_one_id_record_the_last_stored_version():
+    versions = DocumentVersions()
+    stored = {}
+
+    def writer():
+        for _ in range(200):
+            versions.write(["a"], lambda new: stored.update(a=new[0]) or True)
+
+    threads = [threading.Thread(target=writer) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert versions.get("a") == stored["a"]
+    assert versions.stats()["last_version"] == stored["a"]
@@ -0,0 +1,151 @@
+"""
+Tests for the MessagePack and Arrow wire formats and embedding encoding.
+
+Run from the repository root: python -m pytest tests
+"""
+import io
+from typing import List, Optional, Union
+
+import pytest
+
+msgpack = pytest.importorskip("msgpack")
+pa = pytest.importorskip("pyarrow")
+
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from vectors import EmbeddingError, decode_embedding, embedding_bytes, encode_embedding
+from wire_format import (
+    ARROW_TYPE, JSON_TYPE, MSGPACK_TYPE, ExportEncoder, WireRoute, binary_response, decode_body, negotiate_format,
+    search_batch_table,
+)
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON_TYPE),
+    ("*/*", JSON_TYPE),
+    ("application/x-msgpack", MSGPACK_TYPE),
+    (f"{JSON_TYPE};q=0.5, {ARROW_TYPE}", ARROW_TYPE),
+    (f"{MSGPACK_TYPE};q=0.2, {ARROW_TYPE};q=0.9", ARROW_TYPE),
+    (f"{MSGPACK_TYPE};q=bad", JSON_TYPE),
+    ("text/html", JSON_TYPE),
+])
+def test_negotiate_format(accept, expected):
+    assert negotiate_format(accept) == expected
+
+
+def test_embeddings_round_trip_and_are_validated():
+    vector = [0.5, -1.25, 3.0]
+    assert decode_embedding(encode_embedding(vector)) == vector
+    assert decode_embedding(embedding_bytes(vector), 3) == vector
+    for bad, dimension in [("not base64!", None), ("", None), (encode_embedding(vector), 4),
+                           (embedding_bytes([float("nan")]), None), (b"\x00\x00\x00", None)]:
+        with pytest.raises(EmbeddingError):
+            decode_embedding(bad, dimension)
+
+
+class Document(BaseModel):
+    id: Optional[str] = None
+    text: str
+    embedding: Optional[Union[str, bytes]] = None
+
+
+class Batch(BaseModel):
+    documents: List[Document]
+
+
+def _arrow(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+@pytest.mark.parametrize("vector_type", [pa.list_(pa.float32(), 2), pa.list_(pa.float32())])
+def test_arrow_bodies_slice_embeddings_out_of_the_buffer(vector_type):
+    table = pa.table({
+        "id": ["a", "b", "c"],
+        "text": ["one", "two", "three"],
+        "embedding": pa.array([[1.0, 2.0], None, [5.0, 6.0]], vector_type),
+    })
+    # A slice starts its columns at an offset into the shared buffers
+    rows = decode_body(_arrow(table.slice(1)), ARROW_TYPE, Batch)["documents"]
+    assert [row["id"] for row in rows] == ["b", "c"]
+    assert rows[0]["embedding"] is None
+    assert decode_embedding(rows[1]["embedding"]) == [5.0, 6.0]
+
+
+def test_bad_bodies_are_rejected():
+    with pytest.raises(HTTPException) as error:
+        decode_body(b"\xc1", MSGPACK_TYPE)
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException) as error:
+        decode_body(b"not arrow", ARROW_TYPE, Batch)
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException) as error:
+        decode_body(b"", ARROW_TYPE, Document)
+    assert error.value.status_code == 415
+
+
+def _client():
+    router = APIRouter(route_class=WireRoute)
+
+    @router.post("/add/batch")
+    def add(batch: Batch):
+        return [
+            {"id": d.id, "text": d.text, "dimension": len(decode_embedding(d.embedding)) if d.embedding else 0}
+            for d in batch.documents
+        ]
+
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_binary_request_bodies_are_validated_like_json():
+    client = _client()
+    body = {"documents": [{"id": "a", "text": "one", "embedding": embedding_bytes([1.0, 2.0, 3.0])}]}
+    response = client.post("/add/batch", content=msgpack.packb(body), headers={"Content-Type": MSGPACK_TYPE})
+    assert response.json() == [{"id": "a", "text": "one", "dimension": 3}]
+
+    table = pa.table({"text": ["one", "two"], "embedding": pa.array([[1.0], [2.0]], pa.list_(pa.float32(), 1))})
+    response = client.post("/add/batch", content=_arrow(table), headers={"Content-Type": ARROW_TYPE})
+    assert [row["dimension"] for row in response.json()] == [1, 1]
+
+    response = client.post("/add/batch", content=msgpack.packb({"documents": [{}]}), headers={"Content-Type": MSGPACK_TYPE})
+    assert response.status_code == 422
+    assert MSGPACK_TYPE in client.get("/openapi.json").json()["paths"]["/add/batch"]["post"]["requestBody"]["content"]
+
+
+def test_responses_and_search_tables():
+    response = binary_response([Document(id="a", text="one")], MSGPACK_TYPE, exclude_none=True)
+    assert msgpack.unpackb(response.body) == [{"id": "a", "text": "one"}]
+
+    table = search_batch_table([[{"id": "a", "distance": 0.5, "metadata": {"k": 1}}], [], [{"id": "b"}]])
+    assert table.column_names == ["query", "id", "metadata", "distance"]
+    assert table.column("query").to_pylist() == [0, 2]
+    assert table.column("metadata").to_pylist() == ['{"k": 1}', None]
+
+
+def test_arrow_export_is_one_stream_across_pages():
+    encoder = ExportEncoder(ARROW_TYPE, include_embeddings=True)
+    data = encoder.encode(["a", "b"], ["one", "two"], [[1.0, 2.0], [3.0, 4.0]])
+    data += encoder.encode([], [], [])
+    data += encoder.encode(["c"], ["three"], [[5.0, 6.0]])
+    data += encoder.finish()
+    table = pa.ipc.open_stream(data).read_all()
+    assert table.column("id").to_pylist() == ["a", "b", "c"]
+    assert table.schema.field("embedding").type == pa.list_(pa.float32(), 2)
+    assert table.column("embedding").to_pylist()[2] == [5.0, 6.0]
+
+    empty = ExportEncoder(ARROW_TYPE)
+    assert pa.ipc.open_stream(empty.finish()).read_all().num_rows == 0
+
+
+def test_msgpack_export_is_a_sequence_of_maps():
+    encoder = ExportEncoder(MSGPACK_TYPE, include_embeddings=True)
+    data = encoder.encode(["a", "b"], ["one", "two"], [[1.0], [2.0]]) + encoder.finish()
+    records = list(msgpack.Unpacker(io.BytesIO(data), raw=False))
+    assert [record["id"] for record in records] == ["a", "b"]
+    assert decode_embedding(records[1]["embedding"]) == [2.0]
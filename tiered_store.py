@@ -0,0 +1,268 @@
+"""
+Memory-budgeted document store: hot texts in RAM, cold texts on disk.
+
+``TieredDocumentStore`` is a ``CompactDocumentStore`` whose resident text
+bytes are capped by a memory budget. IDs, the hash table and the slot
+arrays always stay in RAM; only texts move:
+
+- texts are written to the arena as usual and marked referenced;
+- when the resident text bytes exceed the budget, a CLOCK hand sweeps
+  the slots, clearing reference bits and spilling the texts of slots
+  that were not referenced since its last pass to an append-only file,
+  read and written through a memory map (the arena record keeps its ID);
+- a point read of a spilled text is served from the map, counted as a
+  miss and queued for promotion; the owner promotes queued texts back
+  into the arena under its write lock (``promote_pending``);
+- scans (``items``) read spilled texts from the map without touching
+  reference bits or promoting, so one full scan does not flush the
+  working set.
+
+The spill file is scratch space for this process (an unlinked temporary
+file), compacted like the arena once most of it is garbage.
+"""
+import mmap
+import os
+import sys
+import tempfile
+import threading
+from array import array
+from typing import Optional
+
+from compact_store import (
+    COMPACT_MIN_BYTES, COMPACT_RATIO, EMPTY, KIND_FREE, CompactDocumentStore, encode_id,
+)
+
+# The spill file grows by doubling, starting here
+SPILL_INITIAL_BYTES = 1 << 20
+
+# Cold reads queued for promotion at most; beyond this they are served from disk only
+MAX_PENDING_PROMOTIONS = 1024
+
+
+class SpillFile:
+    """Append-only scratch file of texts, written and read through a memory map.
+
+    Not thread-safe on its own: the owning store appends under its write
+    lock and reads under its read lock.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._file = tempfile.TemporaryFile(prefix="docstore-spill-", dir=directory)
+        self._map: Optional[mmap.mmap] = None
+        self.capacity = 0
+        self.size = 0
+        self._grow(SPILL_INITIAL_BYTES)
+
+    def _grow(self, needed: int):
+        capacity = max(needed, self.capacity * 2, SPILL_INITIAL_BYTES)
+        # Extending with ftruncate leaves a sparse file; blocks are allocated as texts land
+        os.ftruncate(self._file.fileno(), capacity)
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), capacity)
+        self.capacity = capacity
+
+    def append(self, data: bytes) -> int:
+        """Write data at the end of the file and return its offset"""
+        offset = self.size
+        end = offset + len(data)
+        if end > self.capacity:
+            self._grow(end)
+        self._map[offset:end] = data
+        self.size = end
+        return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self._map[offset:offset + length]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class TieredDocumentStore(CompactDocumentStore):
+    """``CompactDocumentStore`` keeping at most memory_budget bytes of text in RAM"""
+
+    def __init__(self, memory_budget: int, spill_dir: Optional[str] = None):
+        super().__init__()
+        self.memory_budget = max(0, memory_budget)
+        self.spill_dir = spill_dir
+        self._spill: Optional[SpillFile] = None
+        # Per slot: offset and length of the spilled text (EMPTY while resident), CLOCK reference bit
+        self._spill_offsets = array("q")
+        self._spill_lengths = array("I")
+        self._referenced = array("B")
+        self._hand = 0
+        self._resident_bytes = 0
+        self._spilled_bytes = 0
+        self._spilled_count = 0
+        # Point-read counters and the promotion queue are updated by concurrent readers
+        self._stats_lock = threading.Lock()
+        self._pending: set = set()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._promotions = 0
+
+    # Mapping interface
+
+    def __getitem__(self, doc_id: str) -> str:
+        slot = self._find(*encode_id(doc_id))[1]
+        if slot < 0:
+            raise KeyError(doc_id)
+        self._referenced[slot] = 1
+        if self._spill_offsets[slot] == EMPTY:
+            with self._stats_lock:
+                self._hits += 1
+            return super()._text(slot)
+        text = self._text(slot)
+        with self._stats_lock:
+            self._misses += 1
+            if len(self._pending) < MAX_PENDING_PROMOTIONS:
+                self._pending.add(doc_id)
+        return text
+
+    def __setitem__(self, doc_id: str, text: str):
+        slot = self._find(*encode_id(doc_id))[1]
+        if slot >= 0:
+            if self._spill_offsets[slot] != EMPTY:
+                # The new text is written to the arena; the spilled copy becomes garbage
+                self._drop_spill(slot)
+            self._resident_bytes -= self._text_lengths[slot]
+        super().__setitem__(doc_id, text)
+        slot = self._find(*encode_id(doc_id))[1]
+        self._resident_bytes += self._text_lengths[slot]
+        self._referenced[slot] = 1
+        self._enforce_budget()
+
+    def __delitem__(self, doc_id: str):
+        slot = self._find(*encode_id(doc_id))[1]
+        if slot < 0:
+            raise KeyError(doc_id)
+        if self._spill_offsets[slot] != EMPTY:
+            self._drop_spill(slot)
+        self._resident_bytes -= self._text_lengths[slot]
+        self._referenced[slot] = 0
+        super().__delitem__(doc_id)
+        self._maybe_compact_spill()
+
+    def clear(self):
+        if self._spill is not None:
+            self._spill.close()
+        self.__init__(self.memory_budget, self.spill_dir)
+
+    # Promotion
+
+    @property
+    def has_pending_promotions(self) -> bool:
+        return bool(self._pending)
+
+    def promote_pending(self):
+        """Move texts read from disk since the last call back into RAM; call under the write lock"""
+        with self._stats_lock:
+            pending, self._pending = self._pending, set()
+        for doc_id in pending:
+            slot = self._find(*encode_id(doc_id))[1]
+            if slot >= 0 and self._spill_offsets[slot] != EMPTY:
+                self[doc_id] = self._text(slot)
+                self._promotions += 1
+
+    # Internals
+
+    def _text(self, slot: int) -> str:
+        offset = self._spill_offsets[slot]
+        if offset == EMPTY:
+            return super()._text(slot)
+        return self._spill.read(offset, self._spill_lengths[slot]).decode("utf-8")
+
+    def _allocate_slot(self, kind: int) -> int:
+        slot = super()._allocate_slot(kind)
+        if slot == len(self._spill_offsets):
+            self._spill_offsets.append(EMPTY)
+            self._spill_lengths.append(0)
+            self._referenced.append(0)
+        return slot
+
+    def _drop_spill(self, slot: int):
+        # A spilled slot's arena record is its ID with an empty text
+        self._spilled_bytes -= self._spill_lengths[slot]
+        self._spilled_count -= 1
+        self._spill_offsets[slot] = EMPTY
+        self._spill_lengths[slot] = 0
+
+    def _enforce_budget(self):
+        """Advance the CLOCK hand, spilling unreferenced texts, until the resident bytes fit"""
+        slots = len(self._kinds)
+        steps = 0
+        # Two passes are enough: the first clears every reference bit it does not spill
+        while self._resident_bytes > self.memory_budget and steps < 2 * slots:
+            slot = self._hand
+            self._hand = (self._hand + 1) % slots
+            steps += 1
+            if self._kinds[slot] == KIND_FREE or self._spill_offsets[slot] != EMPTY:
+                continue
+            if self._referenced[slot]:
+                self._referenced[slot] = 0
+                continue
+            length = self._text_lengths[slot]
+            if not length:
+                continue
+            if self._spill is None:
+                self._spill = SpillFile(self.spill_dir)
+            start = self._offsets[slot] + self._key_lengths[slot]
+            self._spill_offsets[slot] = self._spill.append(self._arena[start:start + length])
+            self._spill_lengths[slot] = length
+            self._text_lengths[slot] = 0
+            self._live_bytes -= length
+            self._resident_bytes -= length
+            self._spilled_bytes += length
+            self._spilled_count += 1
+            self._evictions += 1
+        self._maybe_compact()
+        self._maybe_compact_spill()
+
+    def _maybe_compact_spill(self):
+        if self._spill is None:
+            return
+        garbage = self._spill.size - self._spilled_bytes
+        if garbage > COMPACT_MIN_BYTES and garbage > COMPACT_RATIO * self._spill.size:
+            self.compact_spill()
+
+    def compact_spill(self):
+        """Rewrite the spill file without the texts that were deleted, replaced or promoted"""
+        if self._spill is None:
+            return
+        spill = SpillFile(self.spill_dir)
+        for slot in range(len(self._kinds)):
+            offset = self._spill_offsets[slot]
+            if offset != EMPTY:
+                self._spill_offsets[slot] = spill.append(self._spill.read(offset, self._spill_lengths[slot]))
+        self._spill.close()
+        self._spill = spill
+
+    def memory_usage(self) -> dict:
+        """Bytes held by the store, plus the tiering counters"""
+        usage = super().memory_usage()
+        tier_bytes = sum(sys.getsizeof(a) for a in (
+            self._spill_offsets, self._spill_lengths, self._referenced
+        ))
+        usage["slot_bytes"] += tier_bytes
+        usage["total_bytes"] += tier_bytes
+        count = usage["documents"]
+        usage["bytes_per_document"] = round(usage["total_bytes"] / count, 1) if count else 0.0
+        with self._stats_lock:
+            hits, misses = self._hits, self._misses
+        usage.update({
+            "memory_budget": self.memory_budget,
+            "resident_text_bytes": self._resident_bytes,
+            "spilled_documents": self._spilled_count,
+            "spilled_bytes": self._spilled_bytes,
+            "spill_file_bytes": self._spill.size if self._spill is not None else 0,
+            "hits": hits,
+            "misses": misses,
+            "evictions": self._evictions,
+            "promotions": self._promotions,
+        })
+        return usage
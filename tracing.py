@@ -0,0 +1,340 @@
+"""
+Opt-in per-request tracing.
+
+A request is traced when it carries ``X-Trace: 1`` (or ``X-Trace:
+profile``), or when it is picked by ``TRACE_SAMPLE_RATE``. Code marks its
+phases with ``stage(name)``; the trace travels in a context variable, so
+stages run on the threadpool are attributed to the right request.
+
+- Requested traces from keys with the ``trace`` scope get a
+  ``Server-Timing`` header with every stage, plus ``X-Trace-Id``.
+- ``X-Trace: profile`` additionally samples the stacks of the threads
+  working on the request; the collapsed stacks are kept for
+  ``GET /admin/traces/{id}``.
+- Every request slower than ``TRACE_SLOW_MS`` is written to the slow
+  request log (logger ``slow_requests`` and an in-memory ring); only
+  traced ones carry their stages.
+
+Untraced requests only pay for one header lookup and a clock read around
+the response in the middleware, and one context variable read per
+``stage()``.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+slow_logger = logging.getLogger("slow_requests")
+
+_current: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+MAX_STACK_DEPTH = 64
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: "RequestTrace", name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        if self.trace.profiler is not None:
+            self.trace.profiler.attach()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.start)
+        if self.trace.profiler is not None:
+            self.trace.profiler.detach()
+        return False
+
+
+def stage(name: str):
+    """Time a block as a named stage of the current request (a no-op when untraced)"""
+    trace = _current.get()
+    if trace is None:
+        return _NOOP_STAGE
+    return _Stage(trace, name)
+
+
+def traced(name: str, fn, *args, **kwargs):
+    """Call fn inside a stage (handy with run_in_threadpool)"""
+    with stage(name):
+        return fn(*args, **kwargs)
+
+
+def authorize_trace(allowed: bool):
+    """Called after authentication: only keys with the trace scope see timings or profiles"""
+    trace = _current.get()
+    if trace is None or not trace.requested:
+        return
+    trace.authorized = allowed
+    if allowed and trace.profile_requested and trace.profiler is None:
+        trace.profiler = SamplingProfiler(trace_log.profile_interval)
+        trace.profiler.start(trace.loop_thread)
+
+
+class SamplingProfiler:
+    """Samples the stacks of the threads currently working on one request"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        # Attached from the loop and threadpool threads, read by the sampler
+        self._threads: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self):
+        with self._lock:
+            self._threads[threading.get_ident()] += 1
+
+    def detach(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] -= 1
+            if self._threads[ident] <= 0:
+                del self._threads[ident]
+
+    def start(self, loop_thread: int):
+        with self._lock:
+            self._threads[loop_thread] += 1
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads)
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_collapse(frame)] += 1
+            self.samples += 1
+
+    def stop(self) -> dict:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            # Collapsed stacks (root first), as consumed by flamegraph tools
+            "stacks": [{"stack": stack, "count": count} for stack, count in self.stacks.most_common(100)],
+        }
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class RequestTrace:
+    """Stage durations of one request"""
+
+    def __init__(self, method: str, path: str, requested: bool, profile_requested: bool):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.requested = requested
+        self.profile_requested = profile_requested
+        self.authorized = False
+        self.status: Optional[int] = None
+        self.stages: Dict[str, float] = {}
+        self.start = time.perf_counter()
+        self.last_end: Optional[float] = None
+        self.total: Optional[float] = None
+        self.profiler: Optional[SamplingProfiler] = None
+        self.profile: Optional[dict] = None
+        self.loop_thread = threading.get_ident()
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.last_end = time.perf_counter()
+
+    def response_started(self, status: int):
+        now = time.perf_counter()
+        self.status = status
+        if self.last_end is not None:
+            # Response model validation and rendering after the last stage
+            self.stages["respond"] = now - self.last_end
+        self.total = now - self.start
+
+    def server_timing(self) -> str:
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={(self.total or 0.0) * 1000:.2f}")
+        return ", ".join(entries)
+
+    def finish(self):
+        if self.total is None:
+            self.total = time.perf_counter() - self.start
+        if self.profiler is not None:
+            self.profile = self.profiler.stop()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "total_ms": round((self.total or 0.0) * 1000, 3),
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "traced": True,
+            "sampled": not self.requested,
+            "profiled": self.profile is not None,
+        }
+
+
+class TraceLog:
+    """Slow request log and recently captured profiles"""
+
+    def __init__(self, sample_rate: float, slow_threshold: float, capacity: int, profile_interval: float):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.profile_interval = profile_interval
+        self.slow = deque(maxlen=capacity)
+        self.profiles: "OrderedDict[str, dict]" = OrderedDict()
+        self.capacity = capacity
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TraceLog":
+        return cls(
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", 0.01)),
+            slow_threshold=float(os.getenv("TRACE_SLOW_MS", 1000)) / 1000,
+            capacity=int(os.getenv("TRACE_LOG_SIZE", 100)),
+            profile_interval=float(os.getenv("TRACE_PROFILE_INTERVAL_MS", 5)) / 1000,
+        )
+
+    def _log_slow(self, entry: dict):
+        slow_logger.warning(json.dumps(entry))
+        with self._lock:
+            self.slow.append(entry)
+
+    def record_untraced(self, method: str, path: str, status: Optional[int], seconds: float):
+        """Slow-log check for a request that was not traced, so has no stages"""
+        if seconds >= self.slow_threshold:
+            self._log_slow({
+                "id": None,
+                "method": method,
+                "path": path,
+                "status": status,
+                "total_ms": round(seconds * 1000, 3),
+                "traced": False,
+            })
+
+    def record(self, trace: RequestTrace):
+        if trace.total >= self.slow_threshold:
+            self._log_slow(trace.to_dict())
+        with self._lock:
+            if trace.profile is not None:
+                self.profiles[trace.id] = dict(trace.to_dict(), profile=trace.profile)
+                while len(self.profiles) > self.capacity:
+                    self.profiles.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[dict]:
+        with self._lock:
+            return self.profiles.get(trace_id)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "slow_threshold_ms": self.slow_threshold * 1000,
+                "slow_requests": list(self.slow),
+                "profiles": list(self.profiles),
+            }
+
+
+trace_log = TraceLog.from_env()
+
+
+class TracingMiddleware:
+    """ASGI middleware that starts traces and emits Server-Timing"""
+
+    def __init__(self, app, log: Optional[TraceLog] = None):
+        self.app = app
+        self.log = log or trace_log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = None
+        for name, value in scope["headers"]:
+            if name == b"x-trace":
+                requested = value.decode("latin-1").strip().lower()
+                break
+        requested = requested if requested not in (None, "", "0", "false") else None
+        if requested is None and not (self.log.sample_rate and random.random() < self.log.sample_rate):
+            await self._timed(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["method"], scope["path"], requested is not None, requested == "profile")
+        token = _current.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.response_started(message["status"])
+                if trace.authorized:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    headers.append((b"x-trace-id", trace.id.encode("latin-1")))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            trace.finish()
+            self.log.record(trace)
+
+    async def _timed(self, scope, receive, send):
+        """Run an untraced request, timing it up to its response start like a trace, for the slow log"""
+        start = time.perf_counter()
+        status = None
+        elapsed = None
+
+        async def send_wrapper(message):
+            nonlocal status, elapsed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if elapsed is None:
+                elapsed = time.perf_counter() - start
+            self.log.record_untraced(scope["method"], scope["path"], status, elapsed)
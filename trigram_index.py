@@ -0,0 +1,328 @@
+"""
+Trigram index for substring and fuzzy search over document texts.
+
+Every lowercased text is broken into its distinct character trigrams,
+and each trigram keeps a posting list of the numbers of the documents
+containing it. A substring query can only occur in documents holding all
+of its trigrams, so intersecting its lists narrows the candidates the
+caller then verifies with a real substring count. A fuzzy query ranks
+documents by the fraction of its trigrams they contain, which tolerates
+typos and transpositions.
+
+Posting lists are sorted: documents get increasing numbers (an update is
+a delete plus an add under a new number) and are appended to a list's
+tail. Full tails are frozen into blocks of ``BLOCK_SIZE`` postings,
+stored as deltas in the narrowest of 1, 2 or 4 bytes, with the first
+number of every block in a skip array. Intersection starts from the
+shortest list and gallops through the longer ones over their skip
+arrays, decoding only the blocks it lands in; a list not much longer
+than the remaining candidates is decoded whole and probed as a set.
+
+A fuzzy query given a ``Deadline`` stops between posting lists once it
+passes, and ranks the documents that already have enough trigrams.
+
+Numbers of deleted documents stay in the lists until a compaction pass
+filters them out. The pass starts once dead postings outnumber live ones
+and advances a few lists with every write, so no write pays for all of
+it.
+"""
+import heapq
+import math
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from search_budget import Deadline
+from sharded_store import RWLock
+
+BLOCK_SIZE = 128
+
+# Delta widths, narrowest first
+_WIDTHS = (("B", 0xFF), ("H", 0xFFFF), ("I", 0xFFFFFFFF))
+
+# Decode a list whole instead of galloping when it is at most this many times longer than the candidates
+DECODE_RATIO = 8
+
+# Compaction starts at this many dead postings (and more dead than live ones)
+COMPACT_MIN_POSTINGS = 100000
+
+# Postings compacted per posting written while a pass runs
+COMPACT_SPEED = 4
+
+
+def trigrams(text_lower: str) -> Set[str]:
+    """Distinct character trigrams of an already lowercased text"""
+    return {text_lower[i:i + 3] for i in range(len(text_lower) - 2)}
+
+
+def _encode_block(numbers: Sequence[int]) -> bytes:
+    deltas = [b - a for a, b in zip(numbers, numbers[1:])]
+    top = max(deltas, default=0)
+    typecode = next(typecode for typecode, limit in _WIDTHS if top <= limit)
+    return typecode.encode("ascii") + array(typecode, deltas).tobytes()
+
+
+def _decode_block(head: int, block: bytes) -> List[int]:
+    deltas = array(chr(block[0]))
+    deltas.frombytes(block[1:])
+    return list(accumulate(deltas, initial=head))
+
+
+class PostingList:
+    """Sorted document numbers: compressed frozen blocks plus an uncompressed tail"""
+
+    __slots__ = ("heads", "blocks", "tail", "size")
+
+    def __init__(self, numbers: Iterable[int] = ()):
+        # Most trigrams are rare; the skip array and block list exist from the first full block on
+        self.heads: Optional[array] = None
+        self.blocks: Optional[List[bytes]] = None
+        self.tail = array("I")
+        self.size = 0
+        for number in numbers:
+            self.append(number)
+
+    def append(self, number: int):
+        """Add a number larger than every number in the list"""
+        self.tail.append(number)
+        self.size += 1
+        if len(self.tail) >= BLOCK_SIZE:
+            if self.heads is None:
+                self.heads, self.blocks = array("I"), []
+            self.heads.append(self.tail[0])
+            self.blocks.append(_encode_block(self.tail))
+            self.tail = array("I")
+
+    def decode(self) -> List[int]:
+        if self.heads is None:
+            return self.tail.tolist()
+        numbers = []
+        for head, block in zip(self.heads, self.blocks):
+            numbers.extend(_decode_block(head, block))
+        numbers.extend(self.tail)
+        return numbers
+
+    def nbytes(self) -> int:
+        if self.heads is None:
+            return len(self.tail) * 4
+        return sum(len(block) for block in self.blocks) + (len(self.heads) + len(self.tail)) * 4
+
+
+class _Cursor:
+    """Membership tests against one posting list for ascending numbers"""
+
+    __slots__ = ("postings", "block", "decoded", "decoded_block")
+
+    def __init__(self, postings: PostingList):
+        self.postings = postings
+        self.block = 0
+        self.decoded: List[int] = []
+        self.decoded_block = -1
+
+    def __contains__(self, number: int) -> bool:
+        postings = self.postings
+        tail = postings.tail
+        if tail and number >= tail[0] or not postings.heads:
+            i = bisect_left(tail, number)
+            return i < len(tail) and tail[i] == number
+
+        # Gallop forward from the last block over the skip array, then bisect the overshoot
+        heads = postings.heads
+        low, step = self.block, 1
+        while low + step < len(heads) and heads[low + step] <= number:
+            low += step
+            step *= 2
+        block = bisect_right(heads, number, low, min(low + step, len(heads))) - 1
+        if block < 0:
+            return False
+        self.block = block
+        if block != self.decoded_block:
+            self.decoded = _decode_block(heads[block], postings.blocks[block])
+            self.decoded_block = block
+        i = bisect_left(self.decoded, number)
+        return i < len(self.decoded) and self.decoded[i] == number
+
+
+def _probe(postings: PostingList, candidates: int):
+    """Membership test for ascending numbers: a decoded set for short lists, a galloping cursor for long ones"""
+    if postings.size <= DECODE_RATIO * candidates:
+        return set(postings.decode()).__contains__
+    return _Cursor(postings).__contains__
+
+
+class TrigramIndex:
+    """Trigram posting lists over document texts (thread-safe; queries run concurrently)"""
+
+    def __init__(self, max_candidate_fraction: float = 0.25, min_similarity: float = 0.5):
+        # Queries whose shortest list covers more of the corpus are better served by a scan
+        self.max_candidate_fraction = max_candidate_fraction
+        self.min_similarity = min_similarity
+        self._postings: Dict[str, PostingList] = {}
+        self._numbers: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._sizes = array("I")
+        self._live_postings = 0
+        self._dead_postings = 0
+        # Trigrams the running compaction pass has yet to filter
+        self._compacting: Optional[List[str]] = None
+        self._lock = RWLock()
+
+    @classmethod
+    def from_env(cls) -> "TrigramIndex":
+        return cls(
+            float(os.getenv("TRIGRAM_MAX_CANDIDATES", 0.25)),
+            float(os.getenv("FUZZY_MIN_SIMILARITY", 0.5)),
+        )
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    # Writes
+
+    def _remove(self, doc_id: str):
+        number = self._numbers.pop(doc_id, None)
+        if number is not None:
+            self._ids[number] = None
+            self._live_postings -= self._sizes[number]
+            self._dead_postings += self._sizes[number]
+
+    def _add(self, doc_id: str, text: str) -> int:
+        self._remove(doc_id)
+        grams = trigrams(text.lower())
+        number = len(self._ids)
+        self._ids.append(doc_id)
+        self._sizes.append(len(grams))
+        self._numbers[doc_id] = number
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = PostingList()
+            postings.append(number)
+        self._live_postings += len(grams)
+        return len(grams)
+
+    def add(self, doc_id: str, text: str):
+        """Index a document, replacing its previous text"""
+        with self._lock.write():
+            self._compact_step(self._add(doc_id, text))
+
+    def add_many(self, documents: Iterable[Tuple[str, str]]):
+        with self._lock.write():
+            written = sum(self._add(doc_id, text) for doc_id, text in documents)
+            self._compact_step(written)
+
+    def remove(self, doc_id: str):
+        with self._lock.write():
+            self._remove(doc_id)
+            self._compact_step(0)
+
+    def _compact_step(self, written: int):
+        if self._compacting is None:
+            if self._dead_postings < COMPACT_MIN_POSTINGS or self._dead_postings < self._live_postings:
+                return
+            self._compacting = list(self._postings)
+        budget = max(BLOCK_SIZE, COMPACT_SPEED * written)
+        while budget > 0 and self._compacting:
+            gram = self._compacting.pop()
+            postings = self._postings.get(gram)
+            if postings is None:
+                continue
+            numbers = postings.decode()
+            live = [number for number in numbers if self._ids[number] is not None]
+            if len(live) < len(numbers):
+                if live:
+                    self._postings[gram] = PostingList(live)
+                else:
+                    del self._postings[gram]
+                self._dead_postings -= len(numbers) - len(live)
+            budget -= len(numbers)
+        if not self._compacting:
+            self._compacting = None
+
+    # Queries
+
+    def candidates(self, query_lower: str) -> Optional[List[str]]:
+        """IDs of the documents containing every trigram of the query.
+
+        None when the index cannot narrow the query (shorter than a
+        trigram, or too common to beat a scan).
+        """
+        grams = trigrams(query_lower)
+        if not grams:
+            return None
+        with self._lock.read():
+            lists = [self._postings.get(gram) for gram in grams]
+            if any(postings is None for postings in lists):
+                return []
+            lists.sort(key=lambda postings: postings.size)
+            if lists[0].size > self.max_candidate_fraction * len(self._numbers):
+                return None
+            numbers = lists[0].decode()
+            for postings in lists[1:]:
+                if not numbers:
+                    break
+                contains = _probe(postings, len(numbers))
+                numbers = [number for number in numbers if contains(number)]
+            ids = self._ids
+            return [ids[number] for number in numbers if ids[number] is not None]
+
+    def fuzzy(self, query_lower: str, limit: int, min_similarity: Optional[float] = None,
+              deadline: Optional[Deadline] = None) -> List[Tuple[float, str]]:
+        """Best (similarity, id) pairs by the fraction of the query's trigrams a document contains"""
+        grams = trigrams(query_lower)
+        if not grams:
+            return []
+        min_similarity = self.min_similarity if min_similarity is None else min_similarity
+        needed = max(1, math.ceil(min_similarity * len(grams) - 1e-9))
+        with self._lock.read():
+            lists = sorted(
+                (self._postings[gram] for gram in grams if gram in self._postings),
+                key=lambda postings: postings.size
+            )
+            # A document with `needed` of the trigrams is in at least one of the
+            # len(grams) - needed + 1 shortest lists; trigrams no document has come first
+            prefix = len(grams) - needed + 1 - (len(grams) - len(lists))
+            if prefix <= 0:
+                return []
+            counts: Counter = Counter()
+            for k, postings in enumerate(lists[:prefix]):
+                if k and deadline is not None and deadline.exceeded():
+                    break
+                counts.update(postings.decode())
+            ids = self._ids
+            numbers = sorted(number for number in counts if ids[number] is not None)
+
+            rest = lists[prefix:]
+            for k, postings in enumerate(rest):
+                # Candidates that cannot reach `needed` even with every remaining list are dropped
+                remaining = len(rest) - k
+                numbers = [number for number in numbers if counts[number] + remaining >= needed]
+                if not numbers or deadline is not None and deadline.exceeded():
+                    break
+                contains = _probe(postings, len(numbers))
+                for number in numbers:
+                    if contains(number):
+                        counts[number] += 1
+
+            sizes = self._sizes
+            best = heapq.nsmallest(
+                limit,
+                (number for number in numbers if counts[number] >= needed),
+                # Most trigrams matched first; among equals, the document with fewer other trigrams
+                key=lambda number: (-counts[number], sizes[number])
+            )
+            return [(counts[number] / len(grams), ids[number]) for number in best]
+
+    def stats(self) -> dict:
+        with self._lock.read():
+            return {
+                "documents": len(self._numbers),
+                "trigrams": len(self._postings),
+                "postings": self._live_postings + self._dead_postings,
+                "dead_postings": self._dead_postings,
+                "posting_bytes": sum(postings.nbytes() for postings in self._postings.values()),
+                "compacting": self._compacting is not None,
+            }
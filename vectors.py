@@ -0,0 +1,54 @@
+"""
+Compact wire encoding for embedding vectors.
+
+Vectors travel as base64 of little-endian float32 values, which is about a
+third of the size of a JSON float array and much cheaper to parse. Binary
+wire formats (MessagePack, Arrow) carry the float32 bytes as they are.
+"""
+import base64
+import binascii
+import math
+import sys
+from array import array
+from typing import List, Optional, Sequence, Union
+
+
+class EmbeddingError(ValueError):
+    pass
+
+
+def decode_embedding(value: Union[str, bytes], dimension: Optional[int] = None) -> List[float]:
+    """Decode a base64 (or raw bytes) float32 vector, validating its length and values"""
+    if isinstance(value, bytes):
+        raw = value
+    else:
+        try:
+            raw = base64.b64decode(value, validate=True)
+        except (binascii.Error, ValueError):
+            raise EmbeddingError("embedding is not valid base64")
+    if not raw or len(raw) % 4:
+        raise EmbeddingError("embedding must be a non-empty sequence of float32 values")
+
+    vector = array("f")
+    vector.frombytes(raw)
+    if sys.byteorder == "big":
+        vector.byteswap()
+
+    if dimension is not None and len(vector) != dimension:
+        raise EmbeddingError(f"embedding has dimension {len(vector)}, expected {dimension}")
+    if not all(math.isfinite(x) for x in vector):
+        raise EmbeddingError("embedding contains NaN or infinite values")
+    return vector.tolist()
+
+
+def embedding_bytes(values: Sequence[float]) -> bytes:
+    """A vector as little-endian float32 bytes"""
+    vector = array("f", values)
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return vector.tobytes()
+
+
+def encode_embedding(values: Sequence[float]) -> str:
+    """Encode a vector as base64 little-endian float32"""
+    return base64.b64encode(embedding_bytes(values)).decode("ascii")
@@ -0,0 +1,121 @@
+"""
+Per-document versions for conditional reads.
+
+Every write gives the documents it touches a new version, drawn from one
+process-wide counter that starts at the current time in microseconds, so
+a version is never reused for an ID, not even after a delete and a
+restart. ``DocumentVersions`` keeps the current version of every ID in
+memory: a conditional GET whose ``If-None-Match`` matches is answered
+with 304 without touching the store.
+
+Writes to the same ID are serialized through striped locks, so the
+version recorded here always belongs to the text that was stored last.
+"""
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+LOCK_STRIPES = 64
+
+# Documents written before versions existed
+UNVERSIONED = 0
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], version: int) -> bool:
+    """Whether an If-None-Match header names this version (weak comparison)"""
+    if not if_none_match:
+        return False
+    tag = etag(version)
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+class DocumentVersions:
+    """ID -> current version, with per-ID write serialization (thread-safe)"""
+
+    def __init__(self, loading: bool = False):
+        self._versions: Dict[str, int] = {}
+        self._last = 0
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # While the initial load runs, IDs written by requests must not be overwritten by it
+        self.ready = not loading
+        self._touched = set()
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def get(self, doc_id: str) -> Optional[int]:
+        return self._versions.get(doc_id)
+
+    def _allocate(self, count: int) -> List[int]:
+        with self._lock:
+            first = max(self._last + 1, time.time_ns() // 1000)
+            self._last = first + count - 1
+        return list(range(first, first + count))
+
+    def _set(self, doc_id: str, version: Optional[int]):
+        with self._lock:
+            if not self.ready:
+                self._touched.add(doc_id)
+            if version is None:
+                self._versions.pop(doc_id, None)
+            else:
+                self._versions[doc_id] = version
+
+    @contextmanager
+    def _locked(self, doc_ids: Iterable[str]):
+        stripes = sorted({zlib.crc32(doc_id.encode("utf-8")) % LOCK_STRIPES for doc_id in doc_ids})
+        with ExitStack() as stack:
+            # Always acquired in stripe order, so batches cannot deadlock
+            for stripe in stripes:
+                stack.enter_context(self._stripes[stripe])
+            yield
+
+    def write(self, doc_ids: List[str], apply: Callable[[List[int]], T]) -> Tuple[T, List[int]]:
+        """Run apply(new_versions) with writes to doc_ids serialized, then record the versions (blocking).
+
+        apply returns a falsy value when nothing was written (e.g. the
+        document did not exist); the versions are not recorded then.
+        """
+        with self._locked(doc_ids):
+            versions = self._allocate(len(doc_ids))
+            result = apply(versions)
+            if result:
+                for doc_id, version in zip(doc_ids, versions):
+                    self._set(doc_id, version)
+            return result, versions
+
+    def delete(self, doc_id: str, apply: Callable[[], T]) -> T:
+        """Run apply() with writes to doc_id serialized, then forget its version (blocking)"""
+        with self._locked([doc_id]):
+            result = apply()
+            if result:
+                self._set(doc_id, None)
+            return result
+
+    def load(self, versions: Iterable[Tuple[str, int]]):
+        """Initial bulk load that may run concurrently with writes"""
+        for doc_id, version in versions:
+            with self._lock:
+                if doc_id not in self._touched:
+                    self._versions[doc_id] = version
+                    self._last = max(self._last, version)
+        with self._lock:
+            self.ready = True
+            self._touched.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._versions), "last_version": self._last, "ready": self.ready}
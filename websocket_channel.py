@@ -0,0 +1,300 @@
+"""
+Multiplexed request channel over one WebSocket.
+
+A client authenticates once, when the connection opens (``Authorization:
+Bearer`` header, or ``?token=`` for browsers), then sends JSON frames
+naming an operation and a tag of its choice, with the operation's fields
+alongside::
+
+    {"tag": 7, "op": "search", "query": "vector databases", "limit": 5}
+
+Every frame is handled as its own task, so requests are pipelined and
+each reply is sent as soon as it is ready, in any order::
+
+    {"tag": 7, "status": 200, "result": [...]}
+    {"tag": 8, "status": 404, "error": "Document not found"}
+
+Operations call the application's route handlers, so they run the same
+validation, executor and index paths as HTTP; only request parsing, the
+bearer check and response framing are paid once per connection instead
+of once per call. Admission control still applies to every frame.
+
+Operations with a batch form are coalesced group-commit style: the
+first request runs at once, and requests arriving while it runs are sent
+together as the next batch, so a busy connection gets batching without a
+lone request ever waiting for a timer. A failed batch is retried one
+request at a time, so one bad request cannot fail its neighbours.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from fastapi import HTTPException, Response, WebSocket
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from starlette.websockets import WebSocketDisconnect
+
+from admission import AdmissionController, AdmissionRejected, ApiKey, KeyRing
+from search_budget import PARTIAL_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Close codes: policy violation (bad credentials) and internal error
+CLOSE_UNAUTHORIZED = 1008
+CLOSE_MISCONFIGURED = 1011
+
+# Frame keys that are not operation fields
+RESERVED_KEYS = ("tag", "op")
+
+
+class Operation:
+    """One operation frames can name.
+
+    handler(request, api_key, response) runs a single request; the channel
+    copies an ETag or partial-results flag set on response into the reply.
+    batch(requests, api_key, response) runs several at once and returns one
+    result per request, sharing the response's headers; batch_key
+    maps a request to the batch it may join (requests with different
+    options cannot share one), or None to run it alone.
+    """
+
+    def __init__(
+        self,
+        model,
+        handler: Callable[[Any, ApiKey, Response], Awaitable[Any]],
+        batch: Optional[Callable[[List[Any], ApiKey, Response], Awaitable[List[Any]]]] = None,
+        batch_key: Callable[[Any], Optional[Hashable]] = lambda request: (),
+        exclude_none: bool = False,
+    ):
+        self.model = model
+        self.handler = handler
+        self.batch = batch
+        self.batch_key = batch_key
+        self.exclude_none = exclude_none
+
+
+class _Coalescer:
+    """Group commit for one operation and option set on one connection"""
+
+    def __init__(self, operation: Operation, api_key: ApiKey, max_batch: int, stats: "_ChannelStats"):
+        self.operation = operation
+        self.api_key = api_key
+        self.max_batch = max_batch
+        self.stats = stats
+        self._pending: list = []
+        self._running = False
+
+    async def submit(self, request):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((request, future))
+        if not self._running:
+            self._running = True
+            asyncio.ensure_future(self._drain())
+        return await future
+
+    async def _drain(self):
+        try:
+            while self._pending:
+                pending, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                await self._run(pending)
+        finally:
+            self._running = False
+
+    async def _run(self, pending: list):
+        # Futures resolve to (result, response)
+        if len(pending) > 1:
+            response = Response()
+            try:
+                results = await self.operation.batch([request for request, _ in pending], self.api_key, response)
+            except Exception:
+                # Fall through: each request gets its own answer
+                pass
+            else:
+                self.stats.count(batches=1, batched=len(pending))
+                for (_, future), result in zip(pending, results):
+                    if not future.done():
+                        future.set_result((result, response))
+                return
+        await asyncio.gather(*(self._run_one(request, future) for request, future in pending))
+
+    async def _run_one(self, request, future: asyncio.Future):
+        response = Response()
+        try:
+            result = await self.operation.handler(request, self.api_key, response)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result((result, response))
+
+
+class _ChannelStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {"connections": 0, "opened": 0, "frames": 0, "errors": 0, "batches": 0, "batched": 0}
+
+    def count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self.values[name] += delta
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.values)
+
+
+class WebSocketChannel:
+    """Serves multiplexed operation frames on accepted WebSocket connections"""
+
+    def __init__(
+        self,
+        key_ring: KeyRing,
+        admission: AdmissionController,
+        operations: Dict[str, Operation],
+        max_batch: int = 256,
+        max_in_flight: int = 64,
+    ):
+        self.key_ring = key_ring
+        self.admission = admission
+        self.operations = operations
+        self.max_batch = max_batch
+        self.max_in_flight = max_in_flight
+        self._stats = _ChannelStats()
+
+    @classmethod
+    def from_env(cls, key_ring: KeyRing, admission: AdmissionController,
+                 operations: Dict[str, Operation], max_batch: int = 256) -> "WebSocketChannel":
+        return cls(key_ring, admission, operations, max_batch, int(os.getenv("WS_MAX_IN_FLIGHT", 64)))
+
+    def _authenticate(self, websocket: WebSocket) -> Optional[ApiKey]:
+        scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            token = websocket.query_params.get("token", "")
+        return self.key_ring.authenticate(token) if token else None
+
+    async def serve(self, websocket: WebSocket):
+        """Run one connection until the client disconnects"""
+        if not self.key_ring.keys:
+            await websocket.close(code=CLOSE_MISCONFIGURED)
+            return
+        api_key = self._authenticate(websocket)
+        if api_key is None:
+            # Closing before accepting rejects the handshake with 403
+            await websocket.close(code=CLOSE_UNAUTHORIZED)
+            return
+        await websocket.accept()
+        self._stats.count(connections=1, opened=1)
+
+        # Frames beyond the key's concurrency limit wait here instead of being rejected with 429
+        limit = min(self.max_in_flight, api_key.concurrency) if api_key.concurrency > 0 else self.max_in_flight
+        slots = asyncio.Semaphore(max(1, limit))
+        connection = _Connection(self, websocket, api_key)
+        tasks = set()
+
+        def finished(task):
+            tasks.discard(task)
+            slots.release()
+
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                # Not reading the next frame until a slot frees up applies backpressure to the client
+                await slots.acquire()
+                task = asyncio.ensure_future(connection.handle(message.get("text") or message.get("bytes")))
+                tasks.add(task)
+                task.add_done_callback(finished)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in list(tasks):
+                task.cancel()
+            self._stats.count(connections=-1)
+
+    def stats(self) -> dict:
+        return {**self._stats.snapshot(), "operations": sorted(self.operations)}
+
+
+class _Connection:
+    def __init__(self, channel: WebSocketChannel, websocket: WebSocket, api_key: ApiKey):
+        self.channel = channel
+        self.websocket = websocket
+        self.api_key = api_key
+        self._coalescers: Dict[tuple, _Coalescer] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def handle(self, data):
+        tag = None
+        try:
+            try:
+                frame = json.loads(data)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Frames must be JSON objects")
+            if not isinstance(frame, dict):
+                raise HTTPException(status_code=400, detail="Frames must be JSON objects")
+            tag = frame.get("tag")
+            reply = await self._dispatch(frame)
+        except HTTPException as e:
+            reply = {"status": e.status_code, "error": e.detail}
+        except AdmissionRejected as e:
+            reply = {"status": e.status_code, "error": e.detail, "retry_after": e.retry_after}
+        except ValidationError as e:
+            reply = {"status": 422, "error": jsonable_encoder(e.errors())}
+        except Exception:
+            logger.exception("WebSocket operation failed")
+            reply = {"status": 500, "error": "Internal server error"}
+        self.channel._stats.count(frames=1, errors=int(reply["status"] >= 400))
+        await self._send({"tag": tag, **reply})
+
+    async def _dispatch(self, frame: dict) -> dict:
+        name = frame.get("op")
+        operation = self.channel.operations.get(name)
+        if operation is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown op {name!r}; expected {', '.join(sorted(self.channel.operations))}"
+            )
+        request = operation.model(**{key: value for key, value in frame.items() if key not in RESERVED_KEYS})
+
+        self.channel.admission.admit(self.api_key)
+        try:
+            response = Response()
+            key = operation.batch_key(request) if operation.batch is not None else None
+            if key is None:
+                result = await operation.handler(request, self.api_key, response)
+            else:
+                result, response = await self._coalescer(name, operation, key).submit(request)
+        finally:
+            self.channel.admission.release(self.api_key)
+
+        if isinstance(result, Response):
+            # e.g. 304 Not Modified from a conditional read
+            response, result = result, None
+        reply = {"status": response.status_code}
+        if result is not None:
+            reply["result"] = jsonable_encoder(result, exclude_none=operation.exclude_none)
+        if "etag" in response.headers:
+            reply["etag"] = response.headers["etag"]
+        if PARTIAL_HEADER in response.headers:
+            reply["partial"] = True
+        return reply
+
+    def _coalescer(self, name: str, operation: Operation, key: Hashable) -> _Coalescer:
+        coalescer = self._coalescers.get((name, key))
+        if coalescer is None:
+            coalescer = _Coalescer(operation, self.api_key, self.channel.max_batch, self.channel._stats)
+            self._coalescers[(name, key)] = coalescer
+        return coalescer
+
+    async def _send(self, reply: dict):
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(json.dumps(reply))
+            except (WebSocketDisconnect, RuntimeError):
+                # The client went away; its remaining replies are dropped
+                pass
@@ -0,0 +1,329 @@
+"""
+Binary wire formats for the bulk endpoints.
+
+JSON stays the default. Clients that send ``Content-Type`` (any route
+with a JSON body) or ``Accept`` (batch add, batch search and export)
+naming one of these formats get it instead:
+
+``application/msgpack``
+    The same structure as the JSON body, but embeddings are raw
+    little-endian float32 bytes instead of base64 strings.
+
+``application/vnd.apache.arrow.stream``
+    An Arrow IPC stream. A request body holds the rows of the route's
+    list (e.g. the ``documents`` of ``/add/batch``) as columns; embeddings
+    are a ``fixed_size_list<float32>`` column (``list<float32>`` is
+    accepted too), whose values are sliced straight out of the Arrow
+    buffer. Responses are tables, one row per document or search hit.
+
+Both are optional dependencies (``msgpack``, ``pyarrow``): when one is
+missing, its request bodies get 415 and ``Accept`` falls back to JSON.
+"""
+import io
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+from vectors import embedding_bytes
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+try:
+    import numpy as np
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+
+# Aliases clients commonly send for MessagePack
+MSGPACK_ALIASES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def available_formats() -> List[str]:
+    """Supported response media types in server preference order (JSON first)"""
+    formats = [JSON_TYPE]
+    if msgpack is not None:
+        formats.append(MSGPACK_TYPE)
+    if pa is not None:
+        formats.append(ARROW_TYPE)
+    return formats
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return MSGPACK_TYPE if media_type in MSGPACK_ALIASES else media_type
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """Pick the response media type from an Accept header; JSON unless a binary format is preferred"""
+    if not accept:
+        return JSON_TYPE
+    weights: Dict[str, float] = {}
+    for part in accept.split(","):
+        media_type, _, params = part.partition(";")
+        media_type = _media_type(media_type)
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[media_type] = q
+
+    best, best_q = JSON_TYPE, 0.0
+    for media_type in available_formats():
+        major = media_type.split("/")[0]
+        q = weights.get(media_type, weights.get(f"{major}/*", weights.get("*/*", 0.0)))
+        if q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+# Request bodies
+
+def _float32_rows(column) -> List[Optional[bytes]]:
+    """Per-row float32 bytes of a (fixed-size) list<float32> column, sliced from the values buffer"""
+    values = column.values
+    data = memoryview(values.buffers()[1])[values.offset * 4:]
+    valid = column.is_valid().to_pylist()
+    if pa.types.is_fixed_size_list(column.type):
+        size = column.type.list_size
+        starts = [(column.offset + i) * size for i in range(len(column))]
+        ends = [start + size for start in starts]
+    else:
+        offsets = column.offsets.to_pylist()
+        starts, ends = offsets[:-1], offsets[1:]
+    return [
+        data[start * 4:end * 4].tobytes() if is_valid else None
+        for start, end, is_valid in zip(starts, ends, valid)
+    ]
+
+
+def _arrow_rows(body: bytes) -> List[dict]:
+    table = pa.ipc.open_stream(body).read_all()
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        column = column.combine_chunks()
+        if (pa.types.is_list(column.type) or pa.types.is_fixed_size_list(column.type)) \
+                and pa.types.is_float32(column.type.value_type):
+            columns[name] = _float32_rows(column)
+        else:
+            columns[name] = column.to_pylist()
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def _list_field(model) -> Optional[str]:
+    """The field an Arrow body fills: the only field of a model like DocumentBatch"""
+    fields = getattr(model, "model_fields", None) or getattr(model, "__fields__", {})
+    return next(iter(fields)) if len(fields) == 1 else None
+
+
+def decode_body(body: bytes, media_type: str, model=None) -> Any:
+    """Decode a binary request body into the structure its JSON form would have"""
+    if media_type == MSGPACK_TYPE:
+        if msgpack is None:
+            raise HTTPException(status_code=415, detail="MessagePack bodies require the msgpack package")
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid MessagePack body: {e or type(e).__name__}")
+
+    if pa is None:
+        raise HTTPException(status_code=415, detail="Arrow bodies require the pyarrow package")
+    field = _list_field(model) if model is not None else None
+    if field is None:
+        raise HTTPException(status_code=415, detail="This endpoint does not accept Arrow bodies")
+    try:
+        return {field: _arrow_rows(body)}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid Arrow body: {e}")
+
+
+class _DecodedRequest(Request):
+    """Request whose binary body FastAPI reads through json()"""
+
+    def __init__(self, request: Request, media_type: str, model):
+        # The handler only calls json() for JSON content types
+        headers = [(k, v) for k, v in request.scope["headers"] if k != b"content-type"]
+        headers.append((b"content-type", JSON_TYPE.encode("latin-1")))
+        super().__init__(dict(request.scope, headers=headers), request.receive)
+        self._wire_media_type = media_type
+        self._wire_model = model
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = decode_body(await self.body(), self._wire_media_type, self._wire_model)
+        return self._json
+
+
+def _body_model(route: APIRoute):
+    return getattr(route.body_field, "type_", None) if route.body_field is not None else None
+
+
+class WireRoute(APIRoute):
+    """APIRoute that also accepts MessagePack and Arrow request bodies.
+
+    The decoded body goes through the same Pydantic validation as JSON.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        model = _body_model(self)
+        if isinstance(model, type) and issubclass(model, BaseModel):
+            # Documented next to the JSON body in the OpenAPI schema
+            content = {MSGPACK_TYPE: {"schema": {"$ref": f"#/components/schemas/{model.__name__}"}}}
+            if _list_field(model) is not None:
+                content[ARROW_TYPE] = {"schema": {"type": "string", "format": "binary"}}
+            extra = dict(self.openapi_extra or {})
+            request_body = dict(extra.get("requestBody", {}))
+            request_body["content"] = dict(request_body.get("content", {}), **content)
+            extra["requestBody"] = request_body
+            self.openapi_extra = extra
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        model = _body_model(self)
+
+        async def route_handler(request: Request) -> Response:
+            media_type = _media_type(request.headers.get("content-type"))
+            if media_type in (MSGPACK_TYPE, ARROW_TYPE):
+                request = _DecodedRequest(request, media_type, model)
+            return await handler(request)
+
+        return route_handler
+
+
+# Responses
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def arrow_stream(table) -> bytes:
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def rows_table(rows: List[dict]):
+    """Arrow table from flat JSON-compatible rows"""
+    return pa.Table.from_pylist(rows)
+
+
+# Column types of search hits; metadata is JSON-encoded
+SEARCH_COLUMNS = (
+    ("id", "string"),
+    ("text", "string"),
+    ("metadata", "string"),
+    ("distance", "float64"),
+    ("score", "float64"),
+)
+
+
+def search_batch_table(results: List[List[dict]]):
+    """One row per hit, with the index of its query; only fields some hit has become columns"""
+    rows = [dict(hit, query=q) for q, hits in enumerate(results) for hit in hits]
+    fields = [pa.field("query", pa.int32())]
+    for name, type_name in SEARCH_COLUMNS:
+        if name == "id" or any(name in row for row in rows):
+            fields.append(pa.field(name, pa.type_for_alias(type_name)))
+    for row in rows:
+        if "metadata" in row:
+            row["metadata"] = json.dumps(row["metadata"])
+    return pa.Table.from_pylist(rows, schema=pa.schema(fields))
+
+
+def to_plain(content: Any, exclude_none: bool = False) -> Any:
+    """Response models (in nested lists) as dicts; much cheaper than jsonable_encoder for flat models"""
+    if isinstance(content, list):
+        return [to_plain(item, exclude_none) for item in content]
+    if hasattr(content, "model_dump"):
+        return content.model_dump(exclude_none=exclude_none)
+    return content.dict(exclude_none=exclude_none)
+
+
+def binary_response(content: Any, media_type: str, to_table: Callable = rows_table, exclude_none: bool = False) -> Response:
+    """Response models as MessagePack, or as an Arrow stream of to_table(their dicts)"""
+    content = to_plain(content, exclude_none)
+    if media_type == MSGPACK_TYPE:
+        return Response(encode_msgpack(content), media_type=MSGPACK_TYPE)
+    return Response(arrow_stream(to_table(content)), media_type=ARROW_TYPE)
+
+
+class ExportEncoder:
+    """Incremental encoder for /export pages in a binary format.
+
+    MessagePack output is a sequence of maps, one per document; Arrow
+    output is one IPC stream with a record batch per page. Embeddings are
+    float32 bytes, or a fixed_size_list<float32> column.
+    """
+
+    def __init__(self, media_type: str, include_embeddings: bool = False):
+        self.media_type = media_type
+        self.include_embeddings = include_embeddings
+        self._sink = io.BytesIO()
+        self._writer = None
+        self._schema_used = None
+
+    def _schema(self, dimension: Optional[int]):
+        fields = [pa.field("id", pa.string()), pa.field("text", pa.string())]
+        if self.include_embeddings:
+            vectors = pa.list_(pa.float32(), dimension) if dimension else pa.list_(pa.float32())
+            fields.append(pa.field("embedding", vectors))
+        return pa.schema(fields)
+
+    def _flush(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def encode(self, ids: List[str], texts: List[str], embeddings: Optional[list] = None) -> bytes:
+        """One page of documents; embeddings are float sequences"""
+        if self.media_type == MSGPACK_TYPE:
+            packer = msgpack.Packer(use_bin_type=True)
+            records = []
+            for i, doc_id in enumerate(ids):
+                record = {"id": doc_id, "text": texts[i]}
+                if self.include_embeddings:
+                    record["embedding"] = embedding_bytes(embeddings[i])
+                records.append(packer.pack(record))
+            return b"".join(records)
+
+        if not ids:
+            return b""
+        columns = [pa.array(ids, pa.string()), pa.array(texts, pa.string())]
+        dimension = None
+        if self.include_embeddings:
+            # One contiguous float32 buffer for the page, wrapped without copying
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            dimension = matrix.shape[1]
+            columns.append(pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), dimension))
+        if self._writer is None:
+            self._schema_used = self._schema(dimension)
+            self._writer = pa.ipc.new_stream(self._sink, self._schema_used)
+        self._writer.write_batch(pa.record_batch(columns, schema=self._schema_used))
+        return self._flush()
+
+    def finish(self) -> bytes:
+        """Trailing bytes (the Arrow end-of-stream marker, with the schema if no page was written)"""
+        if self.media_type != ARROW_TYPE:
+            return b""
+        if self._writer is None:
+            self._writer = pa.ipc.new_stream(self._sink, self._schema(None))
+        self._writer.close()
+        return self._flush()